@@ -1,73 +1,111 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Response, jsonify, request, send_file, g, has_request_context
 from flask_cors import CORS
 import json
 import os
-import pandas as pd
+from contextlib import contextmanager
 from datetime import datetime
-import io
 import base64
-from database.db_config import get_db_cursor
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from database.bulk_ingest import BulkIngest, CONFLICT_ACTIONS
+from database.column_filters import parse_filters, compile_filters
+from database.fast_json import FastJSONProvider, raw_json_response
+from database.db_config import get_db_cursor, get_pool_stats, db_pool
+from database.hot_cache import hot_cache
+from database.invalidation_bus import invalidation_bus
+from database.jobs import create_job, get_job, job_file
+from database.metadata_registry import metadata_registry, parse_search_config
+from database.row_counts import ESTIMATED_ROWS_SQL, validate_count_mode, get_row_counts, get_row_count
+from database.row_hash import INTERNAL_COLUMNS, public_row
+from database.table_browser import (
+    get_table_columns, project_columns, fetch_page, fetch_page_json, fetch_page_arrow, encode_cursor,
+    decode_cursor, fetch_by_keys, lookup_text, convert_lookup_value
+)
+from database.text_search import RELEVANCE, validate_search_mode, resolve_search_mode, build_search
+from database.table_export import (
+    ARROW_STREAM_MIMETYPE, PARQUET_MIMETYPE, CopyExport, csv_copy_sql, ndjson_copy_sql, iter_json_array,
+    write_excel, write_arrow, arrow_stream_bytes
+)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)  # orjson quando instalado (veja database/fast_json.py)
 CORS(app)  # Permitir CORS para acesso externo
 
 # Configuracao
 DATA_DIR = "data"
 
+# Maximo de chaves por chamada de /api/tables/<nome>/lookup
+MAX_LOOKUP_KEYS = 50000
+
+# Erros de validacao devolvidos por POST /api/tables/<nome>/records
+MAX_REPORTED_ERRORS = 200
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
 def get_db_connection():
     """Retorna conexao com o banco PostgreSQL."""
     from database.db_config import get_db_connection as pg_get_connection
     return pg_get_connection()
 
+def get_request_connection():
+    """Retorna a conexao do pool associada a requisicao HTTP atual.
+
+    A conexao e retirada do pool no primeiro uso e devolvida no teardown do
+    Flask. Requisicoes GET/HEAD rodam em uma transacao REPEATABLE READ somente
+    leitura, de modo que todas as consultas do handler veem o mesmo snapshot
+    (por exemplo, o total e a pagina em get_table_data).
+    """
+    if 'db_conn' not in g:
+        conn = db_pool.getconn()
+        try:
+            if request.method in ('GET', 'HEAD'):
+                conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        except Exception:
+            db_pool.putconn(conn)
+            raise
+        g.db_conn = conn
+    return g.db_conn
+
+@contextmanager
+def request_cursor():
+    """Cursor RealDictCursor na conexao da requisicao atual.
+
+    Nao faz commit ao sair do bloco: a transacao dura a requisicao inteira.
+    Handlers que escrevem devem chamar commit_request() antes de responder.
+    Fora de uma requisicao, usa get_db_cursor() normalmente.
+    """
+    if not has_request_context():
+        with get_db_cursor() as cursor:
+            yield cursor
+        return
+    
+    conn = get_request_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        yield cursor
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def commit_request():
+    """Confirma a transacao da requisicao atual."""
+    if 'db_conn' in g:
+        g.db_conn.commit()
+
+@app.teardown_appcontext
+def release_request_connection(exception=None):
+    """Devolve ao pool a conexao da requisicao (com rollback do que nao foi confirmado)."""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        db_pool.putconn(conn)
+
 def load_tables_metadata():
-    """Carrega metadados das tabelas do banco PostgreSQL."""
+    """Carrega metadados das tabelas (registro compartilhado, em cache no processo)."""
     try:
-        with get_db_cursor() as cursor:
-            cursor.execute("""
-                SELECT table_name, display_name, description, columns, created_at, updated_at
-                FROM tables_metadata
-                ORDER BY created_at
-            """)
-            
-            metadata = []
-            for row in cursor.fetchall():
-                table_name = row['table_name']
-                display_name = row['display_name']
-                description = row['description']
-                columns = row['columns']
-                created_at = row['created_at']
-                updated_at = row['updated_at']
-                
-                # Converter JSONB para lista de campos
-                fields = []
-                if columns:
-                    # PostgreSQL JSONB já vem como dict/list, não precisa fazer parse
-                    if isinstance(columns, list):
-                        for field in columns:
-                            if isinstance(field, dict):
-                                fields.append({
-                                    'name': field.get('name', ''),
-                                    'type': field.get('type', 'text')
-                                })
-                    elif isinstance(columns, dict):
-                        # Se for um dict, converter para lista
-                        for field_name, field_type in columns.items():
-                            fields.append({
-                                'name': field_name,
-                                'type': field_type if isinstance(field_type, str) else 'text'
-                            })
-                
-                metadata.append({
-                    'name': table_name,
-                    'display_name': display_name or table_name,
-                    'description': description,
-                    'fields': fields,
-                    'created_at': created_at.isoformat() if created_at else None,
-                    'updated_at': updated_at.isoformat() if updated_at else None
-                })
-            
-            return metadata
-            
+        return list(metadata_registry.list_tables(include_inactive=True))
     except Exception as e:
         print(f"Erro ao carregar metadados das tabelas: {e}")
         return []
@@ -75,7 +113,7 @@ def load_tables_metadata():
 def load_users():
     """Carrega usuarios do sistema do banco PostgreSQL."""
     try:
-        with get_db_cursor() as cursor:
+        with request_cursor() as cursor:
             cursor.execute("SELECT username, password, role FROM users")
             users = {}
             for row in cursor.fetchall():
@@ -88,12 +126,46 @@ def load_users():
         print(f"Erro ao carregar usuários do banco: {e}")
         return {}
 
+class InvalidRecord:
+    """Registro rejeitado antes da conversao: o erro e reportado pelo
+    BulkIngest com o numero da linha, como os erros de tipo."""
+
+    def __init__(self, error):
+        self.error = error
+
+    def get(self, name):
+        raise ValueError(self.error)
+
+def iter_ndjson(stream):
+    """Um objeto por linha do corpo NDJSON, sem ler o corpo inteiro."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield InvalidRecord(f"JSON invalido: {e}")
+
+def map_record_fields(records, fields_by_key):
+    """Converte as chaves de cada registro (nome da coluna ou do campo) para o
+    nome do campo usado pelo BulkIngest."""
+    for record in records:
+        if not isinstance(record, dict):
+            yield record if isinstance(record, InvalidRecord) else InvalidRecord("registro deve ser um objeto")
+            continue
+        unknown = [key for key in record if key not in fields_by_key]
+        if unknown:
+            yield InvalidRecord(f"coluna(s) desconhecida(s): {', '.join(unknown)}")
+            continue
+        yield {fields_by_key[key]['name']: value for key, value in record.items()}
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Endpoint de health check."""
     try:
         # Testar conexão com PostgreSQL
-        with get_db_cursor() as cursor:
+        with request_cursor() as cursor:
             cursor.execute("SELECT 1")
             db_status = True
     except Exception as e:
@@ -104,30 +176,44 @@ def health_check():
         "status": "healthy" if db_status else "unhealthy",
         "timestamp": datetime.now().isoformat(),
         "database": "PostgreSQL",
-        "database_status": db_status
+        "database_status": db_status,
+        "connection_pool": get_pool_stats(),
+        "hot_cache": hot_cache.stats()
     })
 
 @app.route('/api/tables', methods=['GET'])
 def get_tables():
-    """Lista todas as tabelas disponiveis."""
+    """Lista todas as tabelas disponiveis.
+
+    Parametro `count`: exact, estimate ou maintained (padrao).
+    """
     try:
+        try:
+            count_mode = validate_count_mode(request.args.get('count', 'maintained'))
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        
         metadata = load_tables_metadata()
         tables_info = []
         
+        # Uma unica conexao/snapshot e uma unica consulta para todas as contagens
+        with request_cursor() as cursor:
+            row_counts = get_row_counts(cursor, [table['name'] for table in metadata], count_mode)
+        
         for table in metadata:
-            with get_db_cursor() as cursor:
-                cursor.execute(f"SELECT COUNT(*) as count FROM {table['name']}")
-                row_count = cursor.fetchone()['count']
-            
             tables_info.append({
                 "name": table['name'],
                 "display_name": table.get('display_name', table['name']),
                 "fields": table['fields'],
-                "row_count": row_count
+                "row_count": row_counts.get(table['name'])
             })
         
         return jsonify({
             "success": True,
+            "count_mode": count_mode,
             "tables": tables_info
         })
     except Exception as e:
@@ -138,72 +224,240 @@ def get_tables():
 
 @app.route('/api/tables/<table_name>', methods=['GET'])
 def get_table_data(table_name):
-    """Obtem dados de uma tabela especifica."""
+    """Obtem dados de uma tabela especifica.
+
+    Paginacao por pagina (page/limit, com OFFSET) ou por cursor: o parametro
+    `cursor` (ou `after`) recebe o `next_cursor` da resposta anterior e a
+    proxima pagina e buscada por (sort_by, id), com custo constante mesmo
+    no fim de tabelas grandes.
+
+    Parametro `count` (exact, estimate, maintained) define como o total e
+    calculado; com `search` o total e sempre exato.
+
+    `search_mode` (auto, contains, prefix, fulltext) define a busca; auto
+    usa o caminho com indice da tabela (veja database/text_search.py).
+    Com search, sort_by=relevance ordena pela relevancia (apenas page/limit).
+
+    `filter` (repetivel) filtra por campo com tipo validado pelos metadados:
+    campo:operador:valor (veja database/column_filters.py).
+
+    `fields` (campos separados por virgula) limita as colunas retornadas;
+    id e a coluna de ordenacao sempre vem, pois compoem o cursor.
+
+    Com db_json=true o JSON das linhas e gerado pelo PostgreSQL e copiado
+    para a resposta sem passar por objetos Python (paginas grandes).
+
+    Com Accept: application/vnd.apache.arrow.stream a pagina volta como
+    stream Arrow IPC (sempre lida do banco); total e cursor seguem nos
+    cabecalhos X-Total-Count, X-Count-Mode e X-Next-Cursor.
+
+    Tabelas com hot_cache ativo sao servidas da memoria (total sempre exato).
+    """
     try:
         # Parametros de paginacao
         page = request.args.get('page', 1, type=int)
         limit = request.args.get('limit', 100, type=int)
         offset = (page - 1) * limit
+        after_token = request.args.get('cursor') or request.args.get('after')
         
         # Parametros de filtro
         search = request.args.get('search', '')
+        fields = request.args.get('fields', '')
+        db_json = request.args.get('db_json', 'false').lower() == 'true'
+        arrow = request.accept_mimetypes.best_match(
+            ['application/json', ARROW_STREAM_MIMETYPE]
+        ) == ARROW_STREAM_MIMETYPE
         sort_by = request.args.get('sort_by', 'id')
-        sort_order = request.args.get('sort_order', 'ASC')
-        
-        # Construir query com filtros
-        where_clause = ""
-        params = []
-        
-        if search:
-            # Busca em todas as colunas de texto
-            with get_db_cursor() as cursor:
-                cursor.execute(f"""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name = %s AND data_type IN ('character varying', 'text', 'character')
-                """, (table_name,))
-                columns = cursor.fetchall()
-                text_columns = [col['column_name'] for col in columns]
-                
-                if text_columns:
-                    search_conditions = [f"{col} ILIKE %s" for col in text_columns]
-                    where_clause = f"WHERE {' OR '.join(search_conditions)}"
-                    params = [f"%{search}%" for _ in text_columns]
+        sort_order = request.args.get('sort_order', 'ASC').upper()
         
-        # Query para contar total de registros
-        count_query = f"SELECT COUNT(*) as total FROM {table_name} {where_clause}"
-        with get_db_cursor() as cursor:
-            cursor.execute(count_query, params)
-            total_count = cursor.fetchone()['total']
-        
-        # Query para dados paginados
-        data_query = f"""
-            SELECT * FROM {table_name} 
-            {where_clause}
-            ORDER BY {sort_by} {sort_order}
-            LIMIT %s OFFSET %s
-        """
-        params.extend([limit, offset])
+        try:
+            count_mode = validate_count_mode(request.args.get('count', 'exact'))
+            search_mode = validate_search_mode(request.args.get('search_mode'))
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
-        with get_db_cursor() as cursor:
-            cursor.execute(data_query, params)
-            rows = cursor.fetchall()
+        if sort_order not in ('ASC', 'DESC'):
+            return jsonify({
+                "success": False,
+                "error": "sort_order deve ser ASC ou DESC"
+            }), 400
+        descending = sort_order == 'DESC'
         
-        # Converter para dicionarios
-        data = []
-        for row in rows:
-            data.append(dict(row))
+        relevance = sort_by == RELEVANCE
+        if relevance and (not search or after_token):
+            return jsonify({
+                "success": False,
+                "error": "sort_by=relevance exige search e paginacao por page/limit"
+            }), 400
         
-        return jsonify({
+        # Modo efetivo da busca conforme os indices configurados na tabela
+        table_meta = metadata_registry.get_table(table_name)
+        search_config = table_meta['search_config'] if table_meta else parse_search_config(None)
+        text_columns = [
+            field.column for field in (table_meta['fields'] if table_meta else ())
+            if field['type'] == 'text'
+        ]
+        search_mode = resolve_search_mode(search_mode, search_config, text_columns)
+        
+        filter_args = request.args.getlist('filter')
+        if filter_args and table_meta is None:
+            return jsonify({
+                "success": False,
+                "error": f"Tabela '{table_name}' nao encontrada"
+            }), 404
+        try:
+            filters = parse_filters(table_meta, filter_args) if filter_args else []
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        
+        after = None
+        if after_token:
+            try:
+                after = decode_cursor(after_token, sort_by, descending)
+            except ValueError as e:
+                return jsonify({
+                    "success": False,
+                    "error": str(e)
+                }), 400
+        
+        # Tabelas com hot_cache sao servidas da memoria do processo
+        cached = None
+        if not relevance and not arrow and search_mode in ('contains', 'prefix'):
+            cached = hot_cache.query(
+                table_meta,
+                sort_by=sort_by,
+                descending=descending,
+                search=search,
+                search_mode=search_mode,
+                filters=filters,
+                fields=fields,
+                after=after,
+                offset=offset,
+                page_size=limit
+            )
+        
+        data_json = None
+        batch = None
+        if cached is not None:
+            data, has_next, total_count = cached
+            last_row = data[-1] if data else None
+            count_mode = 'exact'
+        else:
+            # Construir query com filtros
+            where_clause = ""
+            params = []
+            rank = None
+            
+            # Busca de colunas, contagem e pagina usam a mesma conexao e o mesmo snapshot
+            with request_cursor() as cursor:
+                columns = get_table_columns(cursor, table_name)
+                if not columns:
+                    return jsonify({
+                        "success": False,
+                        "error": f"Tabela '{table_name}' nao encontrada"
+                    }), 404
+                
+                if not relevance and sort_by not in dict(columns):
+                    return jsonify({
+                        "success": False,
+                        "error": f"Coluna de ordenacao invalida: {sort_by}"
+                    }), 400
+                
+                try:
+                    select_columns = project_columns(
+                        columns, fields, table_meta, required=('id',) if relevance else ('id', sort_by)
+                    )
+                except ValueError as e:
+                    return jsonify({
+                        "success": False,
+                        "error": str(e)
+                    }), 400
+                
+                if search:
+                    # Busca nas colunas de texto (indices trigram/tsvector quando existem)
+                    where_clause, params, rank = build_search(columns, search, search_mode, search_config)
+                
+                # Filtros por coluna (parametrizados, com o tipo da coluna)
+                filter_sql, filter_params = compile_filters(filters)
+                if filter_sql:
+                    where_clause = f"{where_clause} AND {filter_sql}" if where_clause else f"WHERE {filter_sql}"
+                    params = params + filter_params
+                
+                if relevance and rank is None:
+                    return jsonify({
+                        "success": False,
+                        "error": "Tabela sem campos de texto para ordenar por relevancia"
+                    }), 400
+                
+                # Query para contar total de registros
+                if where_clause:
+                    count_mode = 'exact'
+                    count_query = f"SELECT COUNT(*) as total FROM {table_name} {where_clause}"
+                    cursor.execute(count_query, params)
+                    total_count = cursor.fetchone()['total']
+                else:
+                    total_count = get_row_count(cursor, table_name, count_mode) or 0
+                
+                # Query para dados paginados (JSON gerado pelo banco com db_json)
+                page_args = dict(
+                    sort_by='id' if relevance else sort_by,
+                    descending=descending,
+                    where=where_clause,
+                    params=params,
+                    after=after,
+                    offset=offset,
+                    page_size=limit,
+                    rank=rank if relevance else None
+                )
+                if arrow:
+                    batch, has_next, last_row = fetch_page_arrow(
+                        get_request_connection(), table_name, select_columns, **page_args
+                    )
+                elif db_json:
+                    data_json, has_next, last_row = fetch_page_json(
+                        cursor, table_name, select_columns, **page_args
+                    )
+                else:
+                    data, has_next = fetch_page(cursor, table_name, select_columns, **page_args)
+                    last_row = data[-1] if data else None
+        
+        next_cursor = None
+        if has_next and last_row and not relevance:
+            next_cursor = encode_cursor(sort_by, descending, last_row)
+        
+        if batch is not None:
+            headers = {'X-Total-Count': str(total_count), 'X-Count-Mode': count_mode, 'Vary': 'Accept'}
+            if next_cursor:
+                headers['X-Next-Cursor'] = next_cursor
+            return Response(arrow_stream_bytes(batch), mimetype=ARROW_STREAM_MIMETYPE, headers=headers)
+        
+        response = {
             "success": True,
-            "data": data,
             "pagination": {
-                "page": page,
+                "page": page if after is None else None,
                 "limit": limit,
                 "total": total_count,
-                "pages": (total_count + limit - 1) // limit
-            }
-        })
+                "pages": (total_count + limit - 1) // limit,
+                "next_cursor": next_cursor,
+                "count_mode": count_mode
+            },
+            "search_mode": search_mode if search else None,
+            "cached": cached is not None
+        }
+        if data_json is not None:
+            json_response = raw_json_response(app, response, "data", data_json)
+        else:
+            response["data"] = data
+            json_response = jsonify(response)
+        # O formato depende do Accept: caches nao devem trocar JSON por Arrow
+        json_response.vary.add('Accept')
+        return json_response
     except Exception as e:
         return jsonify({
             "success": False,
@@ -212,44 +466,144 @@ def get_table_data(table_name):
 
 @app.route('/api/tables/<table_name>/export', methods=['GET'])
 def export_table(table_name):
-    """Exporta dados de uma tabela em diferentes formatos."""
+    """Exporta dados de uma tabela em diferentes formatos.
+
+    CSV, NDJSON e JSON sao transmitidos em blocos direto do COPY do
+    PostgreSQL; Excel, Parquet e Arrow (stream IPC) sao gerados em arquivo
+    temporario, lote a lote.
+    Com async=true (apenas CSV) a exportacao vira uma tarefa em segundo
+    plano: a resposta (202) traz o id, acompanhado em /api/jobs/<id>.
+    `fields` (campos separados por virgula) limita as colunas exportadas.
+    """
     try:
         format_type = request.args.get('format', 'csv').lower()
+        run_async = request.args.get('async', 'false').lower() == 'true'
+        fields = request.args.get('fields', '')
         
-        with get_db_cursor() as cursor:
-            cursor.execute(f"SELECT * FROM {table_name}")
-            rows = cursor.fetchall()
-            df = pd.DataFrame(rows)
+        if format_type not in ('csv', 'json', 'ndjson', 'excel', 'parquet', 'arrow'):
+            return jsonify({
+                "success": False,
+                "error": "Formato nao suportado. Use: csv, json, ndjson, excel, parquet, arrow"
+            }), 400
         
-        if format_type == 'csv':
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            return output.getvalue(), 200, {
-                'Content-Type': 'text/csv',
-                'Content-Disposition': f'attachment; filename={table_name}.csv'
-            }
+        if run_async and format_type != 'csv':
+            return jsonify({
+                "success": False,
+                "error": "async=true so e suportado no formato csv"
+            }), 400
+        
+        with request_cursor() as cursor:
+            columns = get_table_columns(cursor, table_name)
+        
+        if not columns:
+            return jsonify({
+                "success": False,
+                "error": f"Tabela '{table_name}' nao encontrada"
+            }), 404
         
-        elif format_type == 'json':
+        try:
+            columns = project_columns(columns, fields, metadata_registry.get_table(table_name))
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
+        
+        if run_async:
+            with request_cursor() as cursor:
+                job_id = create_job(cursor, 'csv_export', {
+                    'table_name': table_name,
+                    'columns': [name for name, _ in columns]
+                })
+            commit_request()
             return jsonify({
                 "success": True,
-                "data": df.to_dict('records')
-            })
+                "job_id": job_id,
+                "status_url": f"/api/jobs/{job_id}"
+            }), 202
+        
+        if format_type == 'excel':
+            output = write_excel(get_request_connection(), table_name, columns)
+            return send_file(
+                output,
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                as_attachment=True,
+                download_name=f'{table_name}.xlsx'
+            )
         
-        elif format_type == 'excel':
-            output = io.BytesIO()
-            df.to_excel(output, index=False, engine='openpyxl')
-            output.seek(0)
-            return output.getvalue(), 200, {
-                'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                'Content-Disposition': f'attachment; filename={table_name}.xlsx'
-            }
+        if format_type in ('parquet', 'arrow'):
+            output = write_arrow(get_request_connection(), table_name, columns, format_type)
+            return send_file(
+                output,
+                mimetype=PARQUET_MIMETYPE if format_type == 'parquet' else ARROW_STREAM_MIMETYPE,
+                as_attachment=True,
+                download_name=f"{table_name}.{'parquet' if format_type == 'parquet' else 'arrows'}"
+            )
         
+        if format_type == 'csv':
+            export = CopyExport(csv_copy_sql(table_name, columns)).open()
+            response = Response(export.iter_chunks(), mimetype='text/csv', headers={
+                'Content-Disposition': f'attachment; filename={table_name}.csv'
+            })
+        elif format_type == 'ndjson':
+            export = CopyExport(ndjson_copy_sql(table_name, columns)).open()
+            response = Response(export.iter_chunks(), mimetype='application/x-ndjson', headers={
+                'Content-Disposition': f'attachment; filename={table_name}.ndjson'
+            })
         else:
+            export = CopyExport(ndjson_copy_sql(table_name, columns)).open()
+            response = Response(iter_json_array(export.iter_chunks()), mimetype='application/json')
+        
+        # Garante o cancelamento do COPY mesmo se a resposta nao for consumida
+        response.call_on_close(export.close)
+        return response
+            
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Andamento de uma tarefa em segundo plano (importacao/exportacao)."""
+    try:
+        with request_cursor() as cursor:
+            job = get_job(cursor, job_id)
+        
+        if job is None:
             return jsonify({
                 "success": False,
-                "error": "Formato nao suportado. Use: csv, json, excel"
-            }), 400
-            
+                "error": "Tarefa nao encontrada"
+            }), 404
+        
+        result_file = job.pop('result_file')
+        job['result_url'] = f"/api/jobs/{job_id}/result" if result_file else None
+        return jsonify({
+            "success": True,
+            "job": job
+        })
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/jobs/<int:job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Arquivo gerado por uma tarefa concluida."""
+    try:
+        with request_cursor() as cursor:
+            job = get_job(cursor, job_id)
+        
+        path = job_file(job) if job and job['status'] == 'done' else None
+        if path is None or not os.path.exists(path):
+            return jsonify({
+                "success": False,
+                "error": "Resultado nao disponivel"
+            }), 404
+        
+        return send_file(path, as_attachment=True, download_name=job['result_file'])
     except Exception as e:
         return jsonify({
             "success": False,
@@ -260,13 +614,13 @@ def export_table(table_name):
 def get_table_schema(table_name):
     """Obtem o schema de uma tabela."""
     try:
-        with get_db_cursor() as cursor:
+        with request_cursor() as cursor:
             cursor.execute(f"""
                 SELECT column_name, data_type, is_nullable, column_default
                 FROM information_schema.columns 
-                WHERE table_name = %s
+                WHERE table_name = %s AND column_name <> ALL(%s)
                 ORDER BY ordinal_position
-            """, (table_name,))
+            """, (table_name, list(INTERNAL_COLUMNS)))
             columns = cursor.fetchall()
         
         schema = []
@@ -292,39 +646,83 @@ def get_table_schema(table_name):
 
 @app.route('/api/stats', methods=['GET'])
 def get_database_stats():
-    """Obtem estatisticas do banco de dados."""
+    """Obtem estatisticas do banco de dados.
+
+    Uma unica consulta ao catalogo (pg_class, pg_attribute e
+    pg_stat_user_tables) traz colunas, tamanhos e datas de vacuum/analyze
+    de todas as tabelas. Parametro `count`: estimate (padrao, vem da mesma
+    consulta), exact ou maintained.
+    """
     try:
-        # Listar todas as tabelas
-        with get_db_cursor() as cursor:
-            cursor.execute("""
-                SELECT table_name 
-                FROM information_schema.tables 
-                WHERE table_schema = 'public'
-            """)
-            tables = [row['table_name'] for row in cursor.fetchall()]
+        try:
+            count_mode = validate_count_mode(request.args.get('count', 'estimate'))
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
         stats = {
-            "total_tables": len(tables),
+            "total_tables": 0,
+            "count_mode": count_mode,
             "tables": []
         }
         
+        with request_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT c.relname AS name,
+                       COUNT(a.attnum) AS column_count,
+                       {ESTIMATED_ROWS_SQL} AS estimated_rows,
+                       s.n_live_tup AS live_rows,
+                       s.n_dead_tup AS dead_rows,
+                       pg_relation_size(c.oid) AS table_bytes,
+                       pg_indexes_size(c.oid) AS index_bytes,
+                       COALESCE(pg_total_relation_size(NULLIF(c.reltoastrelid, 0)), 0) AS toast_bytes,
+                       pg_total_relation_size(c.oid) AS total_bytes,
+                       s.last_vacuum,
+                       s.last_autovacuum,
+                       s.last_analyze,
+                       s.last_autoanalyze
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                LEFT JOIN pg_attribute a
+                    ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+                   AND a.attname <> ALL(%s)
+                WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+                GROUP BY c.oid, c.relname, c.reltuples, c.relpages, c.reltoastrelid,
+                         s.n_live_tup, s.n_dead_tup, s.last_vacuum, s.last_autovacuum,
+                         s.last_analyze, s.last_autoanalyze
+                ORDER BY c.relname
+            """, (list(INTERNAL_COLUMNS),))
+            tables = cursor.fetchall()
+            
+            if count_mode == 'estimate':
+                row_counts = {table['name']: table['estimated_rows'] for table in tables}
+            else:
+                row_counts = get_row_counts(cursor, [table['name'] for table in tables], count_mode)
+        
+        stats["total_tables"] = len(tables)
+        stats["total_bytes"] = sum(table['total_bytes'] for table in tables)
+        
         for table in tables:
-            with get_db_cursor() as cursor:
-                cursor.execute(f"SELECT COUNT(*) as count FROM {table}")
-                row_count = cursor.fetchone()['count']
-                
-                cursor.execute(f"""
-                    SELECT COUNT(*) as column_count
-                    FROM information_schema.columns 
-                    WHERE table_name = %s AND table_schema = 'public'
-                """, (table,))
-                column_count = cursor.fetchone()['column_count']
-                
-                stats["tables"].append({
-                    "name": table,
-                    "row_count": row_count,
-                    "column_count": column_count
-                })
+            stats["tables"].append({
+                "name": table['name'],
+                "row_count": row_counts.get(table['name']),
+                "column_count": table['column_count'],
+                "live_rows": table['live_rows'],
+                "dead_rows": table['dead_rows'],
+                "size": {
+                    "table_bytes": table['table_bytes'],
+                    "index_bytes": table['index_bytes'],
+                    "toast_bytes": table['toast_bytes'],
+                    "total_bytes": table['total_bytes']
+                },
+                "last_vacuum": table['last_vacuum'],
+                "last_autovacuum": table['last_autovacuum'],
+                "last_analyze": table['last_analyze'],
+                "last_autoanalyze": table['last_autoanalyze']
+            })
         
         return jsonify({
             "success": True,
@@ -369,7 +767,7 @@ def delete_record(table_name, record_id):
     """Exclui um registro especifico."""
     try:
         # Excluir registro
-        with get_db_cursor() as cursor:
+        with request_cursor() as cursor:
             # Verificar se o registro existe
             cursor.execute(f"SELECT id FROM {table_name} WHERE id = %s", (record_id,))
             if not cursor.fetchone():
@@ -380,12 +778,15 @@ def delete_record(table_name, record_id):
             
             # Excluir registro
             cursor.execute(f"DELETE FROM {table_name} WHERE id = %s", (record_id,))
-            
-            return jsonify({
-                "success": True,
-                "message": "Registro excluido com sucesso",
-                "affected_rows": cursor.rowcount
-            })
+            affected_rows = cursor.rowcount
+        
+        commit_request()
+        
+        return jsonify({
+            "success": True,
+            "message": "Registro excluido com sucesso",
+            "affected_rows": affected_rows
+        })
         
     except Exception as e:
         return jsonify({
@@ -396,16 +797,37 @@ def delete_record(table_name, record_id):
 
 @app.route('/api/tables/<table_name>/records/<int:record_id>', methods=['GET'])
 def get_record(table_name, record_id):
-    """Obtem um registro especifico por ID."""
+    """Obtem um registro especifico por ID (`fields` limita as colunas; id sempre vem)."""
     try:
-        with get_db_cursor() as cursor:
-            cursor.execute(f"SELECT * FROM {table_name} WHERE id = %s", (record_id,))
-            row = cursor.fetchone()
+        fields = request.args.get('fields', '')
+        table_meta = metadata_registry.get_table(table_name)
+        cached, row = hot_cache.get_record(table_meta, record_id, fields=fields)
+        if not cached:
+            with request_cursor() as cursor:
+                if fields:
+                    columns = get_table_columns(cursor, table_name)
+                    if not columns:
+                        return jsonify({
+                            "success": False,
+                            "error": f"Tabela '{table_name}' nao encontrada"
+                        }), 404
+                    try:
+                        columns = project_columns(columns, fields, table_meta, required=('id',))
+                    except ValueError as e:
+                        return jsonify({
+                            "success": False,
+                            "error": str(e)
+                        }), 400
+                    column_list = ', '.join(name for name, _ in columns)
+                else:
+                    column_list = '*'
+                cursor.execute(f"SELECT {column_list} FROM {table_name} WHERE id = %s", (record_id,))
+                row = cursor.fetchone()
         
         if row:
             return jsonify({
                 "success": True,
-                "record": dict(row)
+                "record": public_row(row)
             })
         else:
             return jsonify({
@@ -420,6 +842,211 @@ def get_record(table_name, record_id):
         }), 500
 
 
+@app.route('/api/tables/<table_name>/records', methods=['POST'])
+def insert_records(table_name):
+    """Insere ou atualiza registros em lote.
+
+    Corpo: lista JSON de objetos ou NDJSON (Content-Type application/x-ndjson),
+    com as colunas da tabela pelo nome da coluna ou do campo. Parametros:
+        on_conflict  insert (padrao), skip ou update
+        key          coluna(s) que identificam o registro, separadas por
+                     virgula (padrao: a chave natural da tabela; obrigatorio
+                     com skip/update se a tabela nao tiver chave natural)
+
+    Os valores sao validados pelos tipos dos metadados e gravados via COPY em
+    uma staging, seguida do merge. Qualquer linha invalida cancela a carga.
+    """
+    try:
+        table_meta = metadata_registry.get_table(table_name)
+        if table_meta is None:
+            return jsonify({
+                "success": False,
+                "error": f"Tabela '{table_name}' nao encontrada"
+            }), 404
+        
+        on_conflict = request.args.get('on_conflict', 'insert').lower()
+        if on_conflict not in CONFLICT_ACTIONS:
+            return jsonify({
+                "success": False,
+                "error": f"on_conflict invalido: {on_conflict}. Use: {', '.join(CONFLICT_ACTIONS)}"
+            }), 400
+        
+        fields_by_key = {}
+        for field in table_meta.fields:
+            fields_by_key[field.column] = field
+            fields_by_key[field.name] = field
+        
+        key_columns = []
+        for key in request.args.get('key', '').split(','):
+            key = key.strip()
+            if not key:
+                continue
+            if key not in fields_by_key:
+                return jsonify({
+                    "success": False,
+                    "error": f"Coluna de chave invalida: {key}"
+                }), 400
+            key_columns.append(fields_by_key[key].column)
+        
+        # Sem `key`, vale a chave natural da tabela
+        if not key_columns:
+            key_columns = list(table_meta.natural_key_columns)
+        if on_conflict != 'insert' and not key_columns:
+            return jsonify({
+                "success": False,
+                "error": "Informe a coluna de chave (key) para on_conflict=skip ou update"
+            }), 400
+        # A chave natural tem indice unico: o merge usa ON CONFLICT
+        unique_key = bool(key_columns) and set(key_columns) == set(table_meta.natural_key_columns)
+        
+        if request.mimetype in NDJSON_MIMETYPES:
+            records = iter_ndjson(request.stream)
+        else:
+            records = request.get_json(silent=True)
+            if not isinstance(records, list):
+                return jsonify({
+                    "success": False,
+                    "error": "Corpo deve ser uma lista JSON de registros ou NDJSON"
+                }), 400
+        
+        with request_cursor() as cursor:
+            ingest = BulkIngest(cursor, table_name, table_meta.fields, table_meta.column_names)
+            ingest.create_staging()
+            received, errors = ingest.copy_records(map_record_fields(records, fields_by_key))
+            if errors:
+                # A conexao volta ao pool com rollback
+                return jsonify({
+                    "success": False,
+                    "error": f"{len(errors)} registro(s) invalido(s); nada foi gravado",
+                    "errors": errors[:MAX_REPORTED_ERRORS]
+                }), 400
+            inserted, updated, skipped = ingest.merge_on_key(key_columns, on_conflict, unique=unique_key)
+        commit_request()
+        
+        return jsonify({
+            "success": True,
+            "received": received,
+            "inserted": inserted,
+            "updated": updated,
+            "skipped": skipped
+        })
+    except psycopg2.IntegrityError as e:
+        # Ex.: on_conflict=insert com registro repetido na chave natural
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 409
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/api/tables/<table_name>/lookup', methods=['POST'])
+def lookup_records(table_name):
+    """Resolve muitas chaves em uma unica chamada.
+
+    Corpo JSON: {"ids": [1, 2, ...]} ou {"column": "codigo", "values": ["A1", ...]}.
+    Responde com `records`, um mapa valor -> registro (chaves na forma
+    textual do valor pedido), e a lista de valores nao encontrados. Se um
+    valor aparece em mais de uma linha, vale a de menor id e o valor e
+    listado em `duplicates`. `fields` (no corpo, lista ou texto separado por
+    virgula) limita as colunas dos registros; id e a coluna da chave sempre vem.
+    """
+    try:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({
+                "success": False,
+                "error": "Corpo JSON deve ser um objeto com 'ids' ou 'column' e 'values'"
+            }), 400
+        
+        if 'ids' in body:
+            key_column, values = 'id', body['ids']
+        else:
+            key_column, values = body.get('column'), body.get('values')
+        
+        fields = body.get('fields') or ''
+        if isinstance(fields, list):
+            fields = ','.join(str(name) for name in fields)
+        
+        if not key_column or not isinstance(values, list):
+            return jsonify({
+                "success": False,
+                "error": "Informe 'ids' ou 'column' e 'values' (lista)"
+            }), 400
+        
+        if len(values) > MAX_LOOKUP_KEYS:
+            return jsonify({
+                "success": False,
+                "error": f"Maximo de {MAX_LOOKUP_KEYS} chaves por chamada"
+            }), 400
+        
+        if key_column == 'id':
+            try:
+                values = [convert_lookup_value('integer', value) for value in values]
+            except (TypeError, ValueError):
+                return jsonify({
+                    "success": False,
+                    "error": "'ids' deve conter apenas inteiros"
+                }), 400
+        
+        # Lookup por id em tabelas com hot_cache sai da memoria
+        table_meta = metadata_registry.get_table(table_name)
+        cached = None
+        if key_column == 'id':
+            cached = hot_cache.get_records(table_meta, values, fields=fields)
+        if cached is not None:
+            found = {str(record_id): [row] for record_id, row in cached.items()}
+        else:
+            with request_cursor() as cursor:
+                columns = get_table_columns(cursor, table_name)
+                if not columns:
+                    return jsonify({
+                        "success": False,
+                        "error": f"Tabela '{table_name}' nao encontrada"
+                    }), 404
+                
+                if key_column not in dict(columns):
+                    return jsonify({
+                        "success": False,
+                        "error": f"Coluna invalida: {key_column}"
+                    }), 400
+                
+                try:
+                    columns = project_columns(columns, fields, table_meta, required=('id', key_column))
+                except ValueError as e:
+                    return jsonify({
+                        "success": False,
+                        "error": str(e)
+                    }), 400
+                
+                found = fetch_by_keys(cursor, table_name, columns, key_column, values)
+        
+        records = {key: rows[0] for key, rows in found.items()}
+        missing = []
+        seen = set()
+        for value in values:
+            key = lookup_text(value) if value is not None else None
+            if key not in records and key not in seen:
+                missing.append(value)
+            seen.add(key)
+        
+        return jsonify({
+            "success": True,
+            "column": key_column,
+            "requested": len(values),
+            "found": len(records),
+            "records": records,
+            "missing": missing,
+            "duplicates": [key for key, rows in found.items() if len(rows) > 1]
+        })
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
 @app.route('/api/query', methods=['POST'])
 def execute_custom_query():
     """Executa uma query SQL customizada (apenas SELECT)."""
@@ -434,14 +1061,10 @@ def execute_custom_query():
                 "error": "Apenas queries SELECT sao permitidas por seguranca"
             }), 400
         
-        with get_db_cursor() as cursor:
+        # As linhas (RealDictRow) sao serializadas direto pelo provider JSON
+        with request_cursor() as cursor:
             cursor.execute(query)
-            rows = cursor.fetchall()
-        
-        # Converter para dicionarios
-        data = []
-        for row in rows:
-            data.append(dict(row))
+            data = cursor.fetchall()
         
         return jsonify({
             "success": True,
@@ -458,18 +1081,28 @@ if __name__ == '__main__':
     # Criar diretorio de dados se nao existir
     os.makedirs(DATA_DIR, exist_ok=True)
     
+    # Pre-abre o minimo de conexoes e mantem o pool em segundo plano
+    db_pool.start()
+    
     print("🚀 API Server iniciando...")
     print("📊 Banco de dados: PostgreSQL")
     print("🌐 Endpoints disponiveis:")
     print("   GET  /api/health - Status do servidor")
     print("   GET  /api/tables - Lista todas as tabelas")
-    print("   GET  /api/tables/<nome> - Dados de uma tabela")
+    print("   GET  /api/tables/<nome> - Dados de uma tabela (page/limit ou cursor; db_json=true)")
     print("   GET  /api/tables/<nome>/records/<id> - Registro especifico")
+    print("   POST /api/tables/<nome>/records - Inserir/atualizar registros em lote (JSON ou NDJSON)")
+    print("   POST /api/tables/<nome>/lookup - Varios registros por id ou coluna")
     print("   PUT  /api/tables/<nome>/records/<id> - Atualizar registro")
     print("   DELETE /api/tables/<nome>/records/<id> - Excluir registro")
-    print("   GET  /api/tables/<nome>/export - Exporta dados")
+    print("   GET  /api/tables/<nome>/export - Exporta dados (csv, json, ndjson, excel, parquet, arrow; async=true)")
+    print("   GET  /api/jobs/<id> - Andamento de uma tarefa em segundo plano")
+    print("   GET  /api/jobs/<id>/result - Arquivo gerado pela tarefa")
     print("   GET  /api/tables/<nome>/schema - Schema da tabela")
     print("   GET  /api/stats - Estatisticas do banco")
     print("   POST /api/query - Query SQL customizada")
     
+    # Listener de invalidacao de cache (LISTEN/NOTIFY)
+    invalidation_bus.start()
+    
     app.run(host='0.0.0.0', port=5000, debug=False) 
\ No newline at end of file
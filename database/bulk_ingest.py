@@ -0,0 +1,459 @@
+"""
+Motor de carga em lote (COPY FROM STDIN) para as tabelas dinamicas
+"""
+
+import math
+import re
+import struct
+import uuid
+import logging
+from datetime import date, datetime
+
+from database.row_hash import row_hash_sql, has_row_hash
+
+logger = logging.getLogger(__name__)
+
+# Tipos SQL usados pelas tabelas dinamicas (mesmo mapeamento de create_sql_table)
+SQL_TYPES = {
+    "text": "TEXT",
+    "int": "INTEGER",
+    "float": "REAL",
+    "date": "DATE",
+    "bool": "BOOLEAN",
+}
+
+COPY_FORMATS = ('binary', 'text')
+
+# Tratamento de linhas cuja chave ja existe na tabela (merge_on_key)
+CONFLICT_ACTIONS = ('insert', 'skip', 'update')
+
+_INT4_MIN, _INT4_MAX = -2**31, 2**31 - 1
+_FLOAT4_MAX = 3.4028234663852886e38
+_PG_EPOCH = date(2000, 1, 1)
+_BOOL_TRUE = {'true', '1', 'sim', 'yes', 't'}
+_BOOL_FALSE = {'false', '0', 'nao', 'não', 'no', 'f'}
+# YYYY-MM-DD, com hora opcional (ignorada) como em 2024-01-31T10:00:00Z
+_ISO_DATE_RE = re.compile(
+    r'^(\d{4})-(\d{1,2})-(\d{1,2})'
+    r'(?:[T ]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}(?::?\d{2})?)?)?$'
+)
+_BR_DATE_RE = re.compile(r'^(\d{1,2})[/-](\d{1,2})[/-](\d{4})$')
+
+_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+_BINARY_TRAILER = struct.pack('>h', -1)
+_NULL_FIELD = struct.pack('>i', -1)
+
+
+# ---------------------------------------------------------------------------
+# Conversao de valores (feita uma unica vez, em Python)
+# ---------------------------------------------------------------------------
+
+def _is_empty(value):
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    return isinstance(value, str) and value == ''
+
+
+def to_int(value):
+    if _is_empty(value):
+        return None
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"valor {value} nao e um numero inteiro")
+    result = int(value)
+    if not _INT4_MIN <= result <= _INT4_MAX:
+        raise ValueError(f"valor {result} fora do intervalo de INTEGER")
+    return result
+
+
+def to_float(value):
+    if _is_empty(value):
+        return None
+    result = float(value)
+    if math.isfinite(result) and abs(result) > _FLOAT4_MAX:
+        raise ValueError(f"valor {result} fora do intervalo de REAL")
+    return result
+
+
+def to_bool(value):
+    if _is_empty(value):
+        return None
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _BOOL_TRUE:
+        return True
+    if text in _BOOL_FALSE:
+        return False
+    raise ValueError(f"booleano invalido: '{value}' (use true/false)")
+
+
+def to_date(value):
+    if _is_empty(value):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    match = _ISO_DATE_RE.match(text)
+    if match:
+        year, month, day = match.groups()
+        return date(int(year), int(month), int(day))
+    match = _BR_DATE_RE.match(text)
+    if match:
+        day, month, year = match.groups()
+        return date(int(year), int(month), int(day))
+    raise ValueError(f"data invalida: '{text}'")
+
+
+def to_text(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    result = str(value)
+    if '\x00' in result:
+        raise ValueError("texto contem caractere NUL")
+    return result
+
+
+CONVERTERS = {
+    "text": to_text,
+    "int": to_int,
+    "float": to_float,
+    "date": to_date,
+    "bool": to_bool,
+}
+
+
+def convert_value(field_type, value):
+    """Converte um valor para o tipo Python correspondente ao tipo do campo."""
+    return CONVERTERS.get(field_type, to_text)(value)
+
+
+# ---------------------------------------------------------------------------
+# Codificacao COPY
+# ---------------------------------------------------------------------------
+
+def _binary_encoder(field_type):
+    if field_type == 'int':
+        return lambda v: b'\x00\x00\x00\x04' + struct.pack('>i', v)
+    if field_type == 'float':
+        return lambda v: b'\x00\x00\x00\x04' + struct.pack('>f', v)
+    if field_type == 'date':
+        return lambda v: b'\x00\x00\x00\x04' + struct.pack('>i', (v - _PG_EPOCH).days)
+    if field_type == 'bool':
+        return lambda v: b'\x00\x00\x00\x01' + (b'\x01' if v else b'\x00')
+
+    def encode_text(v):
+        data = v.encode('utf-8')
+        return struct.pack('>i', len(data)) + data
+    return encode_text
+
+
+_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _text_encoder(field_type):
+    if field_type == 'bool':
+        return lambda v: 't' if v else 'f'
+    if field_type == 'float':
+        return repr
+    if field_type == 'int':
+        return str
+    if field_type == 'date':
+        return date.isoformat
+    return lambda v: v.translate(_TEXT_ESCAPES)
+
+
+class _CopyStream:
+    """Objeto tipo arquivo que entrega ao COPY os bytes gerados sob demanda."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class BulkIngest:
+    """Carrega registros em uma tabela temporaria de staging via COPY e faz o
+    merge tipado (NOT EXISTS) na tabela de destino.
+
+    Os valores sao convertidos uma unica vez em Python; a staging tem os mesmos
+    tipos da tabela de destino, portanto o merge nao precisa de casts. Todas
+    as etapas usam o cursor recebido, ou seja, acontecem na transacao do
+    chamador.
+
+    Uso tipico::
+
+        ingest = BulkIngest(cursor, table_name, fields, column_names)
+        ingest.create_staging()
+        copied, errors = ingest.copy_records(records)
+        inserted, duplicates, repeated = ingest.merge_new_rows()
+        ingest.drop_staging()
+    """
+
+    def __init__(self, cursor, table_name, fields, column_names, copy_format='binary',
+                 chunk_size=1 << 16):
+        if copy_format not in COPY_FORMATS:
+            raise ValueError(f"Formato COPY nao suportado: {copy_format}")
+        self.cursor = cursor
+        self.table_name = table_name
+        self.fields = list(fields)
+        self.column_names = list(column_names)
+        self.copy_format = copy_format
+        self.chunk_size = chunk_size
+        self.staging_table = f"_staging_{uuid.uuid4().hex[:16]}"
+        self.staged_count = 0
+
+        make_encoder = _binary_encoder if copy_format == 'binary' else _text_encoder
+        self._columns = [
+            (field['name'], CONVERTERS.get(field['type'], to_text), make_encoder(field['type']))
+            for field in self.fields
+        ]
+
+    def create_staging(self):
+        """Cria a tabela temporaria de staging com os tipos da tabela de destino."""
+        columns_sql = ', '.join(
+            f"{col} {SQL_TYPES.get(field['type'], 'TEXT')}"
+            for col, field in zip(self.column_names, self.fields)
+        )
+        self.cursor.execute(
+            f"CREATE TEMP TABLE {self.staging_table} ({columns_sql}) ON COMMIT DROP"
+        )
+
+    def _encode_rows(self, records, errors, start_line):
+        """Gera blocos de bytes no formato COPY, pulando linhas invalidas."""
+        binary = self.copy_format == 'binary'
+        field_count = struct.pack('>h', len(self._columns))
+        pending = []
+        pending_size = 0
+
+        if binary:
+            yield _BINARY_HEADER
+
+        for i, record in enumerate(records):
+            try:
+                if binary:
+                    parts = [field_count]
+                    for name, convert, encode in self._columns:
+                        value = convert(record.get(name))
+                        parts.append(_NULL_FIELD if value is None else encode(value))
+                    row = b''.join(parts)
+                else:
+                    values = []
+                    for name, convert, encode in self._columns:
+                        value = convert(record.get(name))
+                        values.append('\\N' if value is None else encode(value))
+                    row = ('\t'.join(values) + '\n').encode('utf-8')
+            except Exception as e:
+                errors.append(f"Erro na linha {start_line + i}: {e}")
+                continue
+
+            self.staged_count += 1
+            pending.append(row)
+            pending_size += len(row)
+            if pending_size >= self.chunk_size:
+                yield b''.join(pending)
+                pending = []
+                pending_size = 0
+
+        if pending:
+            yield b''.join(pending)
+        if binary:
+            yield _BINARY_TRAILER
+
+    def copy_records(self, records, start_line=1):
+        """Envia os registros (iteravel de dicts por nome de campo) para a staging.
+
+        Pode ser chamado varias vezes (por exemplo, uma vez por bloco de um CSV).
+        Retorna (linhas_copiadas, erros); linhas com erro de conversao sao
+        ignoradas e reportadas como "Erro na linha N: ...".
+        """
+        errors = []
+        before = self.staged_count
+        options = "FORMAT binary" if self.copy_format == 'binary' else "FORMAT text"
+        stream = _CopyStream(self._encode_rows(records, errors, start_line))
+        self.cursor.copy_expert(
+            f"COPY {self.staging_table} ({', '.join(self.column_names)}) FROM STDIN WITH ({options})",
+            stream,
+            size=self.chunk_size,
+        )
+        return self.staged_count - before, errors
+
+    def merge_new_rows(self, key_columns=None):
+        """Insere na tabela de destino as linhas da staging que ainda nao existem.
+
+        Antes do merge as linhas repetidas dentro da propria staging (mesma
+        chave ou, sem chave, mesmo registro inteiro) sao removidas, mantendo
+        a primeira. Com `key_columns` (chave natural com indice unico) o
+        duplicado e decidido pelo indice, com ON CONFLICT DO NOTHING; sem
+        chave, pelo indice de row_hash ou, em tabelas sem essa coluna,
+        comparando a linha inteira com a tabela de destino.
+
+        Retorna (inseridos, ja_existentes, repetidos_no_lote).
+        """
+        if self.staged_count == 0:
+            return 0, 0, 0
+
+        columns = ', '.join(self.column_names)
+        if key_columns:
+            repeated = self._dedupe_staging(key_columns, 'first')
+            self.cursor.execute(f"""
+                INSERT INTO {self.table_name} ({columns})
+                SELECT {columns} FROM {self.staging_table}
+                ON CONFLICT ({', '.join(key_columns)}) DO NOTHING
+            """)
+            inserted = self.cursor.rowcount
+            return inserted, self.staged_count - repeated - inserted, repeated
+
+        # Registro inteiro como chave: o mesmo hash de row_hash (NULLs iguais)
+        repeated = self._dedupe_staging([row_hash_sql(self.staging_table)], 'first')
+
+        # Tabelas temporarias nao passam pelo autovacuum; sem estatisticas o
+        # planejador estima mal o anti-join
+        self.cursor.execute(f"ANALYZE {self.staging_table}")
+
+        if has_row_hash(self.cursor, self.table_name):
+            # Busca no indice de row_hash em vez de comparar todas as colunas
+            join_conditions = f"t.row_hash = {row_hash_sql('s')}"
+        else:
+            join_conditions = ' AND '.join(f"t.{col} = s.{col}" for col in self.column_names)
+        self.cursor.execute(f"""
+            INSERT INTO {self.table_name} ({columns})
+            SELECT {', '.join(f's.{col}' for col in self.column_names)}
+            FROM {self.staging_table} s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {self.table_name} t
+                WHERE {join_conditions}
+            )
+        """)
+        inserted = self.cursor.rowcount
+        return inserted, self.staged_count - repeated - inserted, repeated
+
+    def _dedupe_staging(self, key_columns, keep):
+        """Remove da staging as linhas com chave repetida (NULLs iguais entre
+        si), mantendo a primeira (keep='first') ou a ultima (keep='last') na
+        ordem do COPY. `key_columns` sao colunas ou expressoes SQL sobre a
+        staging. Retorna o numero de linhas removidas."""
+        direction = 'ASC' if keep == 'first' else 'DESC'
+        self.cursor.execute(f"""
+            DELETE FROM {self.staging_table}
+            WHERE ctid IN (
+                SELECT ctid FROM (
+                    SELECT ctid, row_number() OVER (
+                        PARTITION BY {', '.join(key_columns)} ORDER BY ctid {direction}
+                    ) AS position
+                    FROM {self.staging_table}
+                ) ranked
+                WHERE position > 1
+            )
+        """)
+        return self.cursor.rowcount
+
+    def merge_on_key(self, key_columns, action='skip', unique=False):
+        """Merge da staging na tabela de destino comparando apenas `key_columns`.
+
+        action:
+            insert  insere todas as linhas, sem comparar chaves
+            skip    insere as chaves novas; chaves existentes (ou repetidas no
+                    lote, alem da primeira) sao ignoradas
+            update  atualiza as linhas com chave existente e insere as novas;
+                    com chave repetida no lote vale a ultima
+
+        Com `unique` (a chave e a chave natural, com indice unico) o merge
+        usa INSERT ... ON CONFLICT e chaves NULL coincidem entre si; sem
+        indice, chaves NULL nunca coincidem com a tabela de destino.
+        Retorna (inseridos, atualizados, ignorados).
+        """
+        if action not in CONFLICT_ACTIONS:
+            raise ValueError(f"on_conflict invalido: {action}. Use: {', '.join(CONFLICT_ACTIONS)}")
+        if self.staged_count == 0:
+            return 0, 0, 0
+
+        columns = ', '.join(self.column_names)
+        source_columns = ', '.join(f's.{col}' for col in self.column_names)
+        if action == 'insert':
+            self.cursor.execute(f"""
+                INSERT INTO {self.table_name} ({columns})
+                SELECT {source_columns} FROM {self.staging_table} s
+            """)
+            return self.cursor.rowcount, 0, 0
+
+        unknown = [col for col in key_columns if col not in self.column_names]
+        if not key_columns or unknown:
+            raise ValueError(f"Chave invalida: {', '.join(unknown) or '(vazia)'}")
+        set_columns = [col for col in self.column_names if col not in key_columns]
+        if not set_columns:
+            # Todas as colunas sao chave: nao ha o que atualizar
+            action = 'skip'
+
+        if unique:
+            return self._upsert_on_conflict(key_columns, set_columns, action)
+
+        repeated = self._dedupe_staging(key_columns, 'last' if action == 'update' else 'first')
+        self.cursor.execute(f"ANALYZE {self.staging_table}")
+        key_match = ' AND '.join(f"t.{col} = s.{col}" for col in key_columns)
+
+        updated = 0
+        if action == 'update':
+            self.cursor.execute(f"""
+                UPDATE {self.table_name} t
+                SET {', '.join(f'{col} = s.{col}' for col in set_columns)}
+                FROM {self.staging_table} s
+                WHERE {key_match}
+            """)
+            updated = self.cursor.rowcount
+
+        self.cursor.execute(f"""
+            INSERT INTO {self.table_name} ({columns})
+            SELECT {source_columns}
+            FROM {self.staging_table} s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {self.table_name} t
+                WHERE {key_match}
+            )
+        """)
+        inserted = self.cursor.rowcount
+        # No update, as linhas restantes foram atualizadas ou inseridas
+        skipped = repeated if action == 'update' else self.staged_count - inserted
+        return inserted, updated, skipped
+
+    def _upsert_on_conflict(self, key_columns, set_columns, action):
+        if action == 'skip':
+            inserted, existing, repeated = self.merge_new_rows(key_columns)
+            return inserted, 0, existing + repeated
+
+        columns = ', '.join(self.column_names)
+
+        # DO UPDATE nao pode atingir a mesma linha duas vezes no comando
+        repeated = self._dedupe_staging(key_columns, 'last')
+        self.cursor.execute(f"""
+            WITH upserted AS (
+                INSERT INTO {self.table_name} ({columns})
+                SELECT {columns} FROM {self.staging_table}
+                ON CONFLICT ({', '.join(key_columns)}) DO UPDATE
+                SET {', '.join(f'{col} = EXCLUDED.{col}' for col in set_columns)}
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT COUNT(*) FILTER (WHERE inserted) AS inserted,
+                   COUNT(*) FILTER (WHERE NOT inserted) AS updated
+            FROM upserted
+        """)
+        row = self.cursor.fetchone()
+        return row['inserted'], row['updated'], repeated
+
+    def drop_staging(self):
+        """Remove a tabela de staging antes do fim da transacao."""
+        self.cursor.execute(f"DROP TABLE IF EXISTS {self.staging_table}")
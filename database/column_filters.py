@@ -0,0 +1,209 @@
+"""
+Filtros tipados por coluna (parametro filter de GET /api/tables/<nome>)
+
+Sintaxe: campo:operador[:valor], um parametro por filtro (combinados com
+AND), por exemplo:
+
+    ?filter=codigo:eq:10&filter=data:between:2024-01-01,2024-06-30&filter=status:in:a,b
+
+O campo e o nome do campo em tables_metadata (ou o nome da coluna) e o
+valor e convertido de forma estrita pelo tipo do campo (inteiro, decimal
+finito, data YYYY-MM-DD, true/false); valores invalidos geram ValueError. O SQL gerado compara a coluna
+com parametros convertidos para o tipo dela (CAST(%s AS tipo)), de modo que
+os indices da coluna podem ser usados. Listas (in, between) sao separadas
+por virgula; use \\, para uma virgula dentro do valor.
+"""
+
+import re
+import math
+from datetime import date
+from collections import namedtuple
+
+from database.bulk_ingest import SQL_TYPES, to_int, to_float, to_text
+from database.metadata_registry import sanitize_identifier
+from database.table_browser import _escape_like
+
+# Operadores: numero de valores (None = lista) e tipos de campo aceitos
+FILTER_OPERATORS = {
+    'eq': (1, None),
+    'ne': (1, None),
+    'lt': (1, ('text', 'int', 'float', 'date')),
+    'lte': (1, ('text', 'int', 'float', 'date')),
+    'gt': (1, ('text', 'int', 'float', 'date')),
+    'gte': (1, ('text', 'int', 'float', 'date')),
+    'between': (2, ('text', 'int', 'float', 'date')),
+    'in': (None, None),
+    'contains': (1, ('text',)),
+    'startswith': (1, ('text',)),
+    'isnull': (0, None),
+    'notnull': (0, None),
+}
+
+# Maximo de filtros e de valores em uma lista (in)
+MAX_FILTERS = 20
+MAX_FILTER_VALUES = 1000
+
+_COMPARISONS = {'eq': '=', 'ne': '<>', 'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>='}
+_LIST_SEPARATOR = re.compile(r'(?<!\\),')
+_INT_RE = re.compile(r'^[+-]?\d+$')
+_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+ColumnFilter = namedtuple('ColumnFilter', ['column', 'op', 'values', 'field_type'])
+
+
+def _split_values(text):
+    return [part.replace('\\,', ',') for part in _LIST_SEPARATOR.split(text)]
+
+
+def _parse_int(text):
+    if not _INT_RE.match(text.strip()):
+        raise ValueError("esperado um numero inteiro")
+    return to_int(text.strip())
+
+
+def _parse_float(text):
+    value = to_float(text.strip())
+    if not math.isfinite(value):
+        raise ValueError("esperado um numero finito")
+    return value
+
+
+def _parse_date(text):
+    if not _DATE_RE.match(text.strip()):
+        raise ValueError("esperada uma data YYYY-MM-DD")
+    return date.fromisoformat(text.strip())
+
+
+def _parse_bool(text):
+    value = text.strip().lower()
+    if value not in ('true', 'false'):
+        raise ValueError("esperado true ou false")
+    return value == 'true'
+
+
+# Conversao estrita dos valores dos filtros (mais rigida que a da carga em lote)
+_PARSERS = {
+    'int': _parse_int,
+    'float': _parse_float,
+    'date': _parse_date,
+    'bool': _parse_bool,
+}
+
+
+def _convert(field_type, raw, field_name):
+    try:
+        value = _PARSERS.get(field_type, to_text)(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Valor invalido para o campo '{field_name}' ({field_type}): {raw!r} ({e})")
+    if value is None:
+        raise ValueError(f"Valor vazio no filtro do campo '{field_name}'; use isnull/notnull")
+    return value
+
+
+def parse_filter(table_meta, expression):
+    """ColumnFilter de uma expressao campo:operador[:valor]. ValueError se invalida."""
+    parts = expression.split(':', 2)
+    if len(parts) < 2:
+        raise ValueError(f"Filtro invalido: {expression!r}. Use campo:operador:valor")
+    name, op = parts[0].strip(), parts[1].strip().lower()
+    raw = parts[2] if len(parts) == 3 else None
+
+    if name == 'id':
+        column, field_type = 'id', 'int'
+    else:
+        field = next(
+            (f for f in table_meta['fields'] if f['name'] == name or sanitize_identifier(f['name']) == name),
+            None
+        )
+        if field is None:
+            raise ValueError(f"Campo inexistente no filtro: {name}")
+        column, field_type = sanitize_identifier(field['name']), field['type']
+
+    if op not in FILTER_OPERATORS:
+        raise ValueError(f"Operador invalido: {op}. Use: {', '.join(FILTER_OPERATORS)}")
+    arity, types = FILTER_OPERATORS[op]
+    if types is not None and field_type not in types:
+        raise ValueError(f"Operador {op} nao se aplica ao campo '{name}' ({field_type})")
+
+    if arity == 0:
+        if raw:
+            raise ValueError(f"Operador {op} nao recebe valor")
+        return ColumnFilter(column, op, (), field_type)
+    if raw is None or raw == '':
+        raise ValueError(f"Filtro sem valor: {expression!r}")
+
+    raws = [raw] if arity == 1 else _split_values(raw)
+    if arity == 2 and len(raws) != 2:
+        raise ValueError(f"Operador between exige dois valores separados por virgula: {raw!r}")
+    if len(raws) > MAX_FILTER_VALUES:
+        raise ValueError(f"Maximo de {MAX_FILTER_VALUES} valores por filtro")
+    if op in ('contains', 'startswith'):
+        values = tuple(raws)
+    else:
+        values = tuple(_convert(field_type, value, name) for value in raws)
+    return ColumnFilter(column, op, values, field_type)
+
+
+def parse_filters(table_meta, expressions):
+    """Lista de ColumnFilter das expressoes (parametros filter repetidos)."""
+    expressions = [expression for expression in expressions if expression]
+    if len(expressions) > MAX_FILTERS:
+        raise ValueError(f"Maximo de {MAX_FILTERS} filtros por consulta")
+    return [parse_filter(table_meta, expression) for expression in expressions]
+
+
+def compile_filters(filters):
+    """(condicoes SQL unidas por AND, parametros); condicoes vazias sem filtros."""
+    conditions = []
+    params = []
+    for f in filters:
+        sql_type = 'INTEGER' if f.column == 'id' else SQL_TYPES.get(f.field_type, 'TEXT')
+        if f.op in _COMPARISONS:
+            conditions.append(f"{f.column} {_COMPARISONS[f.op]} CAST(%s AS {sql_type})")
+            params.append(f.values[0])
+        elif f.op == 'between':
+            conditions.append(f"{f.column} BETWEEN CAST(%s AS {sql_type}) AND CAST(%s AS {sql_type})")
+            params.extend(f.values)
+        elif f.op == 'in':
+            conditions.append(f"{f.column} = ANY(CAST(%s AS {sql_type}[]))")
+            params.append(list(f.values))
+        elif f.op == 'contains':
+            conditions.append(f"{f.column} ILIKE %s")
+            params.append(f"%{_escape_like(f.values[0])}%")
+        elif f.op == 'startswith':
+            conditions.append(f"{f.column} ILIKE %s")
+            params.append(f"{_escape_like(f.values[0])}%")
+        elif f.op == 'isnull':
+            conditions.append(f"{f.column} IS NULL")
+        else:
+            conditions.append(f"{f.column} IS NOT NULL")
+    return ' AND '.join(conditions), params
+
+
+def filter_predicate(f):
+    """Funcao valor -> bool equivalente ao filtro (para dados em memoria)."""
+    if f.op == 'isnull':
+        return lambda value: value is None
+    if f.op == 'notnull':
+        return lambda value: value is not None
+    if f.op in ('contains', 'startswith'):
+        term = f.values[0].casefold()
+        if f.op == 'contains':
+            return lambda value: value is not None and term in value.casefold()
+        return lambda value: value is not None and value.casefold().startswith(term)
+    if f.op == 'in':
+        values = set(f.values)
+        return lambda value: value is not None and value in values
+    if f.op == 'between':
+        low, high = f.values
+        return lambda value: value is not None and low <= value <= high
+    target = f.values[0]
+    compare = {
+        'eq': lambda value: value == target,
+        'ne': lambda value: value != target,
+        'lt': lambda value: value < target,
+        'lte': lambda value: value <= target,
+        'gt': lambda value: value > target,
+        'gte': lambda value: value >= target,
+    }[f.op]
+    return lambda value: value is not None and compare(value)
@@ -0,0 +1,397 @@
+"""
+Validacao e carga em streaming de arquivos CSV nas tabelas dinamicas
+"""
+
+import numpy as np
+import pandas as pd
+
+from database.bulk_ingest import BulkIngest
+from database.natural_key import key_columns
+
+# Linhas lidas por bloco na carga em streaming
+CSV_CHUNK_SIZE = 50000
+
+# Maximo de mensagens de erro guardadas (o total continua sendo contado)
+MAX_REPORTED_ERRORS = 200
+
+TRUE_VALUES = ['true', '1', 'sim', 'yes']
+
+_INT_PATTERN = r'\s*[+-]?\d+\s*'
+_SLASH_DATE_PATTERN = r'^([^/]*)/([^/]*)/([^/]*)$'
+_DASH_DATE_PATTERN = r'^([^-]*)-([^-]*)-([^-]*)$'
+
+
+def _empty_mask(series: pd.Series) -> np.ndarray:
+    """Valores nulos (NaN/None) ou strings vazias."""
+    mask = series.isna().to_numpy(dtype=bool, copy=True)
+    if not pd.api.types.is_numeric_dtype(series):
+        mask |= series.eq('').fillna(False).to_numpy(dtype=bool)
+    return mask
+
+
+def _fallback(values: np.ndarray, errors: np.ndarray, series: pd.Series, positions, convert) -> None:
+    """Converte elemento a elemento as posicoes que o caminho vetorizado nao resolveu."""
+    raw = series.to_numpy()
+    for pos in positions:
+        try:
+            values[pos] = convert(raw[pos])
+        except (ValueError, TypeError, OverflowError):
+            errors[pos] = True
+
+
+def _str_fullmatch(series: pd.Series, pattern: str) -> np.ndarray:
+    """Mascara de strings que casam com o padrao (False para nao-strings)."""
+    try:
+        matched = series.str.fullmatch(pattern)
+    except AttributeError:
+        # Coluna de objetos sem nenhuma string
+        return np.zeros(len(series), dtype=bool)
+    return matched.fillna(False).to_numpy(dtype=bool)
+
+
+def _validate_int(series: pd.Series, empty: np.ndarray):
+    n = len(series)
+    values = np.full(n, None, dtype=object)
+    errors = np.zeros(n, dtype=bool)
+    todo = ~empty
+    if not todo.any():
+        return values, errors
+
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        values[todo] = series.to_numpy()[todo].astype(np.int64).tolist()
+    elif pd.api.types.is_float_dtype(series):
+        raw = series.to_numpy()
+        finite = todo & np.isfinite(raw)
+        in_range = finite & (np.abs(raw) < 2**63)
+        # astype trunca em direcao a zero, como int()
+        values[in_range] = raw[in_range].astype(np.int64).tolist()
+        errors |= todo & ~finite
+        _fallback(values, errors, series, np.flatnonzero(finite & ~in_range), int)
+    else:
+        matched = _str_fullmatch(series, _INT_PATTERN) & todo
+        rest = todo & ~matched
+        if matched.any():
+            parsed = pd.to_numeric(series[matched].str.strip(), errors='coerce')
+            if pd.api.types.is_integer_dtype(parsed):
+                values[matched] = parsed.to_numpy().tolist()
+            else:
+                # Numeros fora do intervalo de int64: deixar o int() do Python decidir
+                rest |= matched
+        _fallback(values, errors, series, np.flatnonzero(rest), int)
+    return values, errors
+
+
+def _validate_float(series: pd.Series, empty: np.ndarray):
+    n = len(series)
+    values = np.full(n, None, dtype=object)
+    errors = np.zeros(n, dtype=bool)
+    todo = ~empty
+    if not todo.any():
+        return values, errors
+
+    if pd.api.types.is_numeric_dtype(series):
+        values[todo] = series.to_numpy()[todo].astype(np.float64).tolist()
+    else:
+        parsed = pd.to_numeric(series[todo], errors='coerce').to_numpy(dtype=np.float64)
+        ok = np.zeros(n, dtype=bool)
+        ok[todo] = ~np.isnan(parsed)
+        values[ok] = parsed[ok[todo]].tolist()
+        # Strings como 'nan', '1_0' ou valores nao numericos seguem o float() original
+        _fallback(values, errors, series, np.flatnonzero(todo & ~ok), float)
+    return values, errors
+
+
+def _validate_bool(series: pd.Series, empty: np.ndarray):
+    n = len(series)
+    values = np.full(n, None, dtype=object)
+    todo = ~empty
+    if todo.any():
+        lowered = series[todo].astype(str).str.lower()
+        values[todo] = lowered.isin(TRUE_VALUES).tolist()
+    return values, np.zeros(n, dtype=bool)
+
+
+def _parse_date_fallback(value):
+    parsed = pd.to_datetime(value)
+    return parsed.strftime('%Y-%m-%d')
+
+
+def _validate_date(series: pd.Series, empty: np.ndarray):
+    n = len(series)
+    values = np.full(n, None, dtype=object)
+    errors = np.zeros(n, dtype=bool)
+    todo = ~empty
+    if not todo.any():
+        return values, errors
+
+    # Datas se repetem muito em arquivos reais: normaliza cada valor distinto uma vez
+    codes, uniques = pd.factorize(series[todo].astype(str).str.strip())
+    text = pd.Series(uniques, dtype=object)
+    result = text.to_numpy(dtype=object).copy()
+    resolved = np.zeros(len(text), dtype=bool)
+
+    # DD/MM/YYYY (formato brasileiro); outras variantes com '/' ficam como vieram
+    slash = text.str.contains('/', regex=False).to_numpy(dtype=bool)
+    if slash.any():
+        parts = text[slash].str.extract(_SLASH_DATE_PATTERN)
+        day, month, year = parts[0], parts[1], parts[2]
+        brazilian = ((day.str.len() <= 2) & (month.str.len() <= 2) & (year.str.len() == 4)).to_numpy(dtype=bool)
+        normalized = (year + '-' + month.str.zfill(2) + '-' + day.str.zfill(2)).to_numpy(dtype=object)
+        slash_positions = np.flatnonzero(slash)
+        result[slash_positions[brazilian]] = normalized[brazilian]
+        resolved |= slash
+
+    # YYYY-MM-DD (mantido) ou DD-MM-YYYY (normalizado)
+    rest_positions = np.flatnonzero(~resolved)
+    if len(rest_positions):
+        parts = text.iloc[rest_positions].str.extract(_DASH_DATE_PATTERN)
+        dashed = parts[0].notna().to_numpy(dtype=bool)
+        if dashed.any():
+            parts = parts[dashed]
+            day_first = (parts[0].str.len() != 4).to_numpy(dtype=bool)
+            normalized = (parts[2] + '-' + parts[1].str.zfill(2) + '-' + parts[0].str.zfill(2)).to_numpy(dtype=object)
+            dashed_positions = rest_positions[dashed]
+            result[dashed_positions[day_first]] = normalized[day_first]
+            resolved[dashed_positions] = True
+
+    # Demais formatos: parse do pandas
+    invalid = np.zeros(len(text), dtype=bool)
+    for pos in np.flatnonzero(~resolved):
+        try:
+            result[pos] = _parse_date_fallback(result[pos])
+        except Exception:
+            result[pos] = None
+            invalid[pos] = True
+
+    positions = np.flatnonzero(todo)
+    values[positions] = result[codes]
+    errors[positions] = invalid[codes]
+    return values, errors
+
+
+def _validate_text(series: pd.Series):
+    n = len(series)
+    values = np.full(n, None, dtype=object)
+    present = series.notna().to_numpy()
+    if present.any():
+        values[present] = series[present].astype(str).tolist()
+    return values, np.zeros(n, dtype=bool)
+
+
+FIELD_ERROR_MESSAGES = {
+    'int': "Campo '{name}' deve ser um numero inteiro",
+    'float': "Campo '{name}' deve ser um numero decimal",
+    'date': "Campo '{name}' deve ser uma data válida (formato: YYYY-MM-DD, DD/MM/YYYY)",
+}
+
+
+def validate_column(series: pd.Series, field_type: str):
+    """Valida e converte uma coluna inteira.
+
+    Retorna (valores, mascara_de_erros), onde valores e um array de objetos
+    Python (None para vazios) alinhado posicionalmente com a serie.
+    """
+    series = series.reset_index(drop=True)
+    if field_type == 'text' or field_type not in ('int', 'float', 'bool', 'date'):
+        return _validate_text(series)
+    empty = _empty_mask(series)
+    if field_type == 'int':
+        return _validate_int(series, empty)
+    if field_type == 'float':
+        return _validate_float(series, empty)
+    if field_type == 'bool':
+        return _validate_bool(series, empty)
+    return _validate_date(series, empty)
+
+
+def check_columns(columns, table_meta: dict) -> list:
+    """Compara as colunas do CSV com os campos da tabela."""
+    errors = []
+
+    # Check if all required columns are present
+    required_columns = {field['name'] for field in table_meta['fields']}
+    csv_columns = set(columns)
+
+    missing_columns = required_columns - csv_columns
+    extra_columns = csv_columns - required_columns
+
+    if missing_columns:
+        errors.append(f"Colunas faltando: {', '.join(missing_columns)}")
+
+    if extra_columns:
+        errors.append(f"Colunas extras (serao ignoradas): {', '.join(extra_columns)}")
+
+    return errors
+
+
+def validate_rows(df: pd.DataFrame, table_meta: dict) -> tuple:
+    """Valida as linhas de um DataFrame (ou de um bloco do CSV).
+
+    As mensagens usam o indice do DataFrame, que continua de um bloco para o
+    outro na leitura com chunksize. Retorna (erros, registros_validos).
+    """
+    errors = []
+    n = len(df)
+    names = []
+    columns = []
+    field_errors = []
+    any_error = np.zeros(n, dtype=bool)
+
+    for field in table_meta['fields']:
+        field_name = field['name']
+        if field_name in df.columns:
+            series = df[field_name]
+            if isinstance(series, pd.DataFrame):
+                series = series.iloc[:, 0]
+            values, error_mask = validate_column(series, field['type'])
+        else:
+            values, error_mask = np.full(n, None, dtype=object), np.zeros(n, dtype=bool)
+
+        names.append(field_name)
+        columns.append(values)
+        if error_mask.any():
+            message = FIELD_ERROR_MESSAGES[field['type']].format(name=field_name)
+            field_errors.append((error_mask, message))
+            any_error |= error_mask
+
+    # Mensagens apenas para as linhas com erro, na ordem dos campos
+    if any_error.any():
+        labels = df.index
+        for pos in np.flatnonzero(any_error):
+            row_errors = [message for mask, message in field_errors if mask[pos]]
+            errors.append(f"Linha {labels[pos] + 1}: {'; '.join(row_errors)}")
+        valid = np.flatnonzero(~any_error)
+        columns = [values[valid] for values in columns]
+
+    if names:
+        validated_records = [dict(zip(names, row)) for row in zip(*columns)]
+    else:
+        validated_records = [{} for _ in range(n)]
+
+    return errors, validated_records
+
+
+def validate_csv_data(df: pd.DataFrame, table_meta: dict) -> tuple:
+    """Validate CSV data against table schema.
+
+    Each column is validated at once with pandas/NumPy and rows with errors
+    are located with boolean masks; messages and records are the same as
+    the original row-by-row validation.
+
+    Returns (is_valid, errors, validated_records)
+    """
+    errors = check_columns(df.columns, table_meta)
+    row_errors, validated_records = validate_rows(df, table_meta)
+    errors.extend(row_errors)
+
+    return len(errors) == 0, errors, validated_records
+
+
+# ---------------------------------------------------------------------------
+# Carga em streaming (bloco a bloco)
+# ---------------------------------------------------------------------------
+
+def read_csv_chunks(source, chunksize: int = CSV_CHUNK_SIZE):
+    """Leitor do CSV em blocos de `chunksize` linhas (volta ao inicio do arquivo)."""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return pd.read_csv(source, encoding='utf-8', chunksize=chunksize)
+
+
+def new_tally() -> dict:
+    """Contadores da carga, atualizados a cada bloco."""
+    return {
+        'rows': 0,
+        'valid': 0,
+        'error_count': 0,
+        'errors': [],
+        'inserted': 0,
+        'duplicates': 0,
+        'repeated': 0,
+        'progress': 0.0,
+    }
+
+
+def _add_errors(tally: dict, errors: list) -> None:
+    tally['error_count'] += len(errors)
+    room = MAX_REPORTED_ERRORS - len(tally['errors'])
+    if room > 0:
+        tally['errors'].extend(errors[:room])
+
+
+def _update_progress(tally: dict, source, size) -> None:
+    """Fracao do arquivo ja lida (aproximada, pelo buffer do leitor)."""
+    if size and hasattr(source, 'tell'):
+        tally['progress'] = min(source.tell() / size, 1.0)
+
+
+def scan_csv(source, table_meta: dict, size: int = None, chunksize: int = CSV_CHUNK_SIZE,
+             on_chunk=None) -> dict:
+    """Valida o CSV inteiro bloco a bloco, sem manter o arquivo em memoria.
+
+    Retorna os contadores (ver new_tally) mais 'preview' (primeiras linhas)
+    e 'is_valid'. on_chunk(tally) e chamado apos cada bloco.
+    """
+    tally = new_tally()
+    tally['preview'] = None
+
+    with read_csv_chunks(source, chunksize) as reader:
+        for chunk in reader:
+            if tally['preview'] is None:
+                tally['preview'] = chunk.head(10)
+                _add_errors(tally, check_columns(chunk.columns, table_meta))
+
+            row_errors, records = validate_rows(chunk, table_meta)
+            tally['rows'] += len(chunk)
+            tally['valid'] += len(records)
+            _add_errors(tally, row_errors)
+            _update_progress(tally, source, size)
+            if on_chunk:
+                on_chunk(tally)
+
+    tally['progress'] = 1.0
+    tally['is_valid'] = tally['error_count'] == 0
+    return tally
+
+
+def import_csv(cursor, source, table_meta: dict, table_name: str, column_names: list,
+               size: int = None, chunksize: int = CSV_CHUNK_SIZE, on_chunk=None) -> dict:
+    """Importa o CSV bloco a bloco: valida e envia cada bloco via COPY para a
+    staging; no fim, faz um unico merge da staging na tabela de destino.
+
+    Tudo acontece na transacao do cursor recebido; o chamador faz um unico
+    commit no final, entao uma carga interrompida nunca fica visivel pela
+    metade. Como o merge ve o arquivo inteiro, linhas repetidas dentro do
+    arquivo (em qualquer bloco) contam em 'repeated' (so a primeira e
+    inserida) e linhas que ja estavam na tabela contam em 'duplicates'.
+    """
+    tally = new_tally()
+    # Com chave natural, duplicados sao decididos pelo indice unico da chave
+    natural_key = key_columns(table_meta.get('natural_key') or ())
+    ingest = BulkIngest(cursor, table_name, table_meta['fields'], column_names)
+    ingest.create_staging()
+
+    with read_csv_chunks(source, chunksize) as reader:
+        for chunk in reader:
+            row_errors, records = validate_rows(chunk, table_meta)
+            tally['rows'] += len(chunk)
+            _add_errors(tally, row_errors)
+
+            if records:
+                # Numeracao das linhas continua do bloco anterior
+                copied, copy_errors = ingest.copy_records(records, start_line=int(chunk.index[0]) + 1)
+                _add_errors(tally, copy_errors)
+                tally['valid'] += copied
+
+            _update_progress(tally, source, size)
+            if on_chunk:
+                on_chunk(tally)
+
+    if tally['valid']:
+        inserted, duplicates, repeated = ingest.merge_new_rows(natural_key)
+        tally['inserted'] = inserted
+        tally['duplicates'] = duplicates
+        tally['repeated'] = repeated
+    ingest.drop_staging()
+    tally['progress'] = 1.0
+    return tally
@@ -3,7 +3,11 @@ Configuracao de banco de dados PostgreSQL para Cadastro Streamlit
 """
 
 import os
+import atexit
+import threading
+import time
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
 from contextlib import contextmanager
 import logging
@@ -39,51 +43,335 @@ class DatabaseConfig:
 # Instancia global da configuracao
 db_config = DatabaseConfig()
 
+
+class ConnectionPool:
+    """Pool de conexoes PostgreSQL compartilhado pelo processo inteiro.
+
+    Mantem entre ``min_size`` e ``max_size`` conexoes abertas, descarta conexoes
+    ociosas por mais de ``idle_timeout`` segundos ou abertas ha mais de
+    ``max_lifetime`` segundos e valida a conexao no checkout (``SELECT 1``
+    quando ela ficou parada mais que ``health_check_after`` segundos).
+    E thread-safe, pois tanto o Streamlit quanto o Flask atendem requisicoes
+    em varias threads. ``start()`` pre-abre o minimo e o mantem com uma
+    thread de manutencao (``prune`` a cada ``maintenance_interval`` segundos).
+    """
+
+    def __init__(self, config, min_size=1, max_size=10, idle_timeout=300.0,
+                 max_lifetime=3600.0, health_check_after=5.0, checkout_timeout=30.0,
+                 maintenance_interval=30.0):
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.checkout_timeout = checkout_timeout
+        self.maintenance_interval = maintenance_interval
+
+        self._lock = threading.Condition()
+        self._idle = []          # [(conn, criada_em, devolvida_em)]
+        self._in_use = {}        # id(conn) -> (conn, criada_em)
+        self._pid = os.getpid()
+        self._inherited = []     # conexoes herdadas via fork (nunca fechadas no filho)
+        self._last_sweep = time.monotonic()
+        self._maintenance = None
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+        }
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.config.get_connection_params())
+        conn.autocommit = False
+        with self._lock:
+            self._stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self._stats['closed'] += 1
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception:
+            pass
+
+    def _check_fork(self):
+        """Conexoes herdadas via fork nao podem ser reutilizadas pelo filho."""
+        if self._pid != os.getpid():
+            # Manter referencias para que o coletor de lixo nao feche (e
+            # derrube no servidor) as sessoes que pertencem ao processo pai
+            self._inherited.extend(conn for conn, _, _ in self._idle)
+            self._inherited.extend(conn for conn, _ in self._in_use.values())
+            self._idle = []
+            self._in_use = {}
+            self._pid = os.getpid()
+
+    def _is_expired(self, created_at, released_at, now):
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return True
+        if self.idle_timeout and now - released_at > self.idle_timeout:
+            return True
+        return False
+
+    def _is_healthy(self, conn, released_at, now):
+        if conn.closed:
+            return False
+        if now - released_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Retira uma conexao do pool, abrindo uma nova se necessario."""
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            candidate = None
+            with self._lock:
+                self._check_fork()
+                while candidate is None:
+                    now = time.monotonic()
+                    if self._idle:
+                        conn, created_at, released_at = self._idle.pop()
+                        if self._is_expired(created_at, released_at, now):
+                            self._discard(conn)
+                            continue
+                        candidate = (conn, created_at, released_at)
+                    elif len(self._in_use) < self.max_size:
+                        break
+                    else:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self._stats['timeouts'] += 1
+                            raise psycopg2.OperationalError(
+                                f"Pool de conexoes esgotado ({self.max_size} conexoes em uso)"
+                            )
+                        self._stats['waits'] += 1
+                        self._lock.wait(remaining)
+
+                # Reservar a vaga antes de sair do lock; a validacao e a
+                # abertura de conexao acontecem fora dele
+                token = candidate[0] if candidate else object()
+                self._in_use[id(token)] = (token, candidate[1] if candidate else now)
+
+            if candidate is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot(token)
+                    raise
+                with self._lock:
+                    self._in_use.pop(id(token), None)
+                    self._in_use[id(conn)] = (conn, time.monotonic())
+                    self._stats['checkouts'] += 1
+                return conn
+
+            conn, created_at, released_at = candidate
+            if self._is_healthy(conn, released_at, time.monotonic()):
+                with self._lock:
+                    self._stats['checkouts'] += 1
+                return conn
+
+            with self._lock:
+                self._stats['health_check_failures'] += 1
+                self._discard(conn)
+            self._release_slot(conn)
+
+    def _release_slot(self, token):
+        with self._lock:
+            self._in_use.pop(id(token), None)
+            self._lock.notify()
+
+    def putconn(self, conn):
+        """Devolve a conexao ao pool, desfazendo transacoes pendentes."""
+        with self._lock:
+            self._check_fork()
+            entry = self._in_use.pop(id(conn), None)
+            self._lock.notify()
+
+        if entry is None:
+            # Conexao que nao saiu deste pool (ou herdada do processo pai)
+            if not any(conn is inherited for inherited in self._inherited):
+                self._discard(conn)
+            return
+
+        created_at = entry[1]
+        now = time.monotonic()
+        reusable = not conn.closed and not (self.max_lifetime and now - created_at > self.max_lifetime)
+        if reusable:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                # Restaurar configuracao de sessao alterada pelo chamador (apenas lado cliente)
+                conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT',
+                                 deferrable='DEFAULT', autocommit=False)
+            except psycopg2.Error:
+                reusable = False
+
+        if not reusable:
+            self._discard(conn)
+            return
+
+        with self._lock:
+            self._idle.append((conn, created_at, now))
+            self._lock.notify()
+            if now - self._last_sweep > 30:
+                self._sweep_idle(now)
+
+    def _sweep_idle(self, now):
+        """Fecha conexoes ociosas expiradas (chamado com o lock adquirido)."""
+        self._last_sweep = now
+        keep = []
+        for conn, created_at, released_at in self._idle:
+            if (conn.closed or self._is_expired(created_at, released_at, now)) \
+                    and len(keep) + len(self._in_use) >= self.min_size:
+                self._discard(conn)
+            else:
+                keep.append((conn, created_at, released_at))
+        self._idle = keep
+
+    def prune(self):
+        """Fecha conexoes ociosas expiradas e completa o minimo configurado."""
+        with self._lock:
+            self._check_fork()
+            self._sweep_idle(time.monotonic())
+            missing = self.min_size - len(self._idle) - len(self._in_use)
+
+        for _ in range(max(missing, 0)):
+            try:
+                conn = self._connect()
+            except psycopg2.Error as e:
+                logger.warning(f"Nao foi possivel pre-abrir conexao do pool: {e}")
+                break
+            with self._lock:
+                self._idle.append((conn, time.monotonic(), time.monotonic()))
+
+    def start(self):
+        """Pre-abre min_size conexoes e inicia a thread de manutencao.
+
+        Idempotente: chamadas seguintes (ou de outras threads) nao fazem nada
+        enquanto a thread estiver ativa; apos um fork ela e recriada.
+        """
+        with self._lock:
+            self._check_fork()
+            if self._maintenance is not None and self._maintenance.is_alive():
+                return
+            self._maintenance = threading.Thread(
+                target=self._maintain, name="db-pool-maintenance", daemon=True
+            )
+        self.prune()
+        self._maintenance.start()
+
+    def _maintain(self):
+        # Termina quando closeall() (ou um novo start() apos fork) troca a thread
+        while self._maintenance is threading.current_thread():
+            time.sleep(self.maintenance_interval)
+            if self._maintenance is not threading.current_thread():
+                break
+            try:
+                self.prune()
+            except Exception as e:
+                logger.warning(f"Erro na manutencao do pool de conexoes: {e}")
+
+    def closeall(self):
+        """Fecha todas as conexoes ociosas do pool e para a manutencao
+        (registrado no atexit)."""
+        with self._lock:
+            self._check_fork()
+            self._maintenance = None
+            for conn, _, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+
+    def stats(self):
+        """Retorna estatisticas do pool."""
+        with self._lock:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'size': len(self._idle) + len(self._in_use),
+                **self._stats,
+            }
+
+
+# Pool global do processo (configuravel por variaveis de ambiente)
+db_pool = ConnectionPool(
+    db_config,
+    min_size=int(os.getenv('POSTGRES_POOL_MIN_SIZE', '1')),
+    max_size=int(os.getenv('POSTGRES_POOL_MAX_SIZE', '10')),
+    idle_timeout=float(os.getenv('POSTGRES_POOL_IDLE_TIMEOUT', '300')),
+    max_lifetime=float(os.getenv('POSTGRES_POOL_MAX_LIFETIME', '3600')),
+    health_check_after=float(os.getenv('POSTGRES_POOL_HEALTH_CHECK_AFTER', '5')),
+    checkout_timeout=float(os.getenv('POSTGRES_POOL_CHECKOUT_TIMEOUT', '30')),
+)
+atexit.register(db_pool.closeall)
+
+
+def get_pool_stats():
+    """Retorna estatisticas do pool de conexoes do processo."""
+    return db_pool.stats()
+
+
 @contextmanager
 def get_db_connection():
     """
     Context manager para conexao com banco PostgreSQL
-    Retorna conexao com cursor RealDictCursor para acesso por nome de coluna
+    A conexao vem do pool do processo e e devolvida (com rollback de
+    qualquer transacao pendente) ao final do bloco
     """
     conn = None
     try:
-        conn = psycopg2.connect(**db_config.get_connection_params())
-        conn.autocommit = False
+        conn = db_pool.getconn()
         yield conn
     except psycopg2.Error as e:
         logger.error(f"Erro ao conectar com PostgreSQL: {e}")
-        if conn:
+        if conn and not conn.closed:
             conn.rollback()
         raise
     finally:
         if conn:
-            conn.close()
+            db_pool.putconn(conn)
 
 @contextmanager
 def get_db_cursor(connection=None):
     """
     Context manager para cursor do banco PostgreSQL
-    Retorna cursor com RealDictCursor para acesso por nome de coluna
+    Retorna cursor com RealDictCursor para acesso por nome de coluna.
+    Sem conexao explicita, usa uma conexao do pool durante o bloco
     """
     conn = connection
-    should_close = False
+    should_release = False
+    cursor = None
     
     if not conn:
-        conn = psycopg2.connect(**db_config.get_connection_params())
-        should_close = True
+        conn = db_pool.getconn()
+        should_release = True
     
     try:
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         yield cursor
         conn.commit()
     except Exception as e:
-        conn.rollback()
+        if not conn.closed:
+            conn.rollback()
         logger.error(f"Erro na operacao do banco: {e}")
         raise
     finally:
-        cursor.close()
-        if should_close and conn:
-            conn.close()
+        if cursor is not None:
+            cursor.close()
+        if should_release:
+            db_pool.putconn(conn)
 
 def test_connection():
     """Testa conexao com o banco PostgreSQL"""
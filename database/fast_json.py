@@ -0,0 +1,73 @@
+"""
+Serializacao JSON das respostas da API
+
+FastJSONProvider substitui o provider padrao do Flask (app.json): usa o
+orjson quando instalado (serializa datas, dicts e listas em C) e o json da
+biblioteca padrao caso contrario, com a mesma saida nos dois casos:
+
+    date/datetime/time  ISO 8601 (como o row_to_json do PostgreSQL)
+    Decimal             texto, sem perder precisao
+    chaves              na ordem das colunas (sem ordenar)
+
+Para paginas grandes o PostgreSQL pode gerar o JSON das linhas
+(row_to_json) e raw_json_response insere esse texto na resposta sem
+desserializar nem serializar de novo.
+"""
+
+import json
+import decimal
+from datetime import date, time
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def _default(value):
+    """Tipos que o orjson/json nao serializam diretamente."""
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return DefaultJSONProvider.default(value)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Provider JSON do Flask com orjson (quando disponivel)."""
+
+    sort_keys = False
+    ensure_ascii = False
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            kwargs.setdefault('default', _default)
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            kwargs.setdefault('separators', (',', ':'))
+            return json.dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode('utf-8')
+
+    def dumpb(self, obj):
+        """Documento JSON em bytes (sem a conversao para str do orjson)."""
+        if orjson is None:
+            return self.dumps(obj).encode('utf-8')
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumpb(obj) + b"\n", mimetype=self.mimetype)
+
+
+def raw_json_response(app, payload, key, raw):
+    """Resposta JSON com `payload` e, na chave `key`, o documento JSON `raw`
+    (str ja serializada, por exemplo pelo PostgreSQL) copiado sem alteracao."""
+    head = app.json.dumpb(payload)
+    separator = b',' if len(payload) else b''
+    body = b''.join([head[:-1], separator, app.json.dumpb(key), b':', raw.encode('utf-8'), b'}\n'])
+    return app.response_class(body, mimetype=app.json.mimetype)
@@ -0,0 +1,437 @@
+"""
+Cache em memoria das tabelas de referencia (opcao hot_cache da tabela)
+
+Tabelas marcadas com tables_metadata.hot_cache sao carregadas inteiras no
+processo da API em formato colunar: os ids ficam ordenados em um
+array('q'), que serve de indice da chave primaria (busca binaria), e cada
+coluna em uma lista alinhada a ele. Leituras, paginas e buscas da API sao
+atendidas em memoria.
+
+A atualizacao e incremental: os eventos do barramento de invalidacao
+acumulam os ids alterados e a proxima leitura busca apenas essas linhas
+(WHERE id = ANY). Eventos sem chaves (TRUNCATE, lotes grandes), alteracoes
+nos metadados e reconexoes do listener descartam a tabela, recarregada na
+proxima leitura. Sem o listener ativo o cache nao e usado.
+
+O total em memoria e limitado a HOT_CACHE_MAX_MB; ao passar do limite as
+tabelas usadas ha mais tempo sao descartadas (LRU).
+"""
+
+import os
+import re
+import sys
+import bisect
+import logging
+import threading
+from array import array
+from datetime import date
+from collections import OrderedDict
+
+from database.column_filters import filter_predicate
+from database.db_config import get_db_cursor
+from database.invalidation_bus import invalidation_bus
+from database.table_browser import get_table_columns, project_columns
+
+logger = logging.getLogger(__name__)
+
+HOT_CACHE_MAX_BYTES = int(float(os.getenv('HOT_CACHE_MAX_MB', '64')) * 1024 * 1024)
+
+# Linhas buscadas por vez na carga da tabela
+HOT_CACHE_FETCH_SIZE = 5000
+
+# Filtros que dependem da ordem dos valores (collation, no caso de texto)
+_RANGE_OPERATORS = ('lt', 'lte', 'gt', 'gte', 'between')
+
+TEXT_TYPES = ('character varying', 'text', 'character')
+INTEGER_TYPES = ('integer', 'bigint', 'smallint')
+FLOAT_TYPES = ('real', 'double precision', 'numeric')
+
+
+def like_regex(pattern):
+    """Expressao regular equivalente a `ILIKE pattern` (% e _ como coringas)."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        if char == '%':
+            parts.append('.*')
+        elif char == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return re.compile(''.join(parts), re.IGNORECASE | re.DOTALL)
+
+
+def _coerce(value, data_type):
+    """Converte o valor vindo do cursor (JSON) para o tipo da coluna."""
+    if value is None:
+        return None
+    if data_type == 'date':
+        return date.fromisoformat(value)
+    if data_type in INTEGER_TYPES:
+        return int(value)
+    if data_type in FLOAT_TYPES:
+        return float(value)
+    if data_type == 'boolean':
+        return value if isinstance(value, bool) else str(value).lower() == 'true'
+    return value
+
+
+def _value_bytes(value):
+    return 8 + (sys.getsizeof(value) if value is not None else 0)
+
+
+class HotTable:
+    """Uma tabela em memoria. Todo acesso deve ser feito com `lock`."""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.columns = []
+        self.ids = array('q')
+        self.data = {}
+        self.nbytes = 0
+        self.pending = set()
+        self._orders = {}
+
+    # Carga e atualizacao -----------------------------------------------
+
+    def load(self, cursor):
+        self.columns = get_table_columns(cursor, self.name)
+        if 'id' not in dict(self.columns):
+            raise ValueError(f"Tabela '{self.name}' sem coluna id")
+        self.data = {name: [] for name, _ in self.columns if name != 'id'}
+        self.ids = array('q')
+        column_list = ', '.join(name for name, _ in self.columns)
+        cursor.execute(f"SELECT {column_list} FROM {self.name} ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(HOT_CACHE_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                self.ids.append(row['id'])
+                for name, values in self.data.items():
+                    values.append(row[name])
+        self.nbytes = sum(
+            _value_bytes(value) for values in self.data.values() for value in values
+        ) + 8 * len(self.ids)
+        self._orders = {}
+        self.loaded = True
+
+    def _position(self, record_id):
+        i = bisect.bisect_left(self.ids, record_id)
+        if i < len(self.ids) and self.ids[i] == record_id:
+            return i
+        return None
+
+    def _upsert(self, row):
+        record_id = row['id']
+        i = bisect.bisect_left(self.ids, record_id)
+        if i < len(self.ids) and self.ids[i] == record_id:
+            for name, values in self.data.items():
+                self.nbytes += _value_bytes(row[name]) - _value_bytes(values[i])
+                values[i] = row[name]
+            return
+        self.ids.insert(i, record_id)
+        self.nbytes += 8
+        for name, values in self.data.items():
+            values.insert(i, row[name])
+            self.nbytes += _value_bytes(row[name])
+
+    def _remove(self, record_id):
+        i = self._position(record_id)
+        if i is None:
+            return
+        self.ids.pop(i)
+        self.nbytes -= 8
+        for values in self.data.values():
+            self.nbytes -= _value_bytes(values.pop(i))
+
+    def refresh(self, cursor, ids):
+        """Recarrega apenas as linhas `ids` (removendo as que nao existem mais)."""
+        column_list = ', '.join(name for name, _ in self.columns)
+        cursor.execute(f"SELECT {column_list} FROM {self.name} WHERE id = ANY(%s)", (list(ids),))
+        rows = {row['id']: row for row in cursor.fetchall()}
+        for record_id in ids:
+            if record_id in rows:
+                self._upsert(rows[record_id])
+            else:
+                self._remove(record_id)
+        self._orders = {}
+
+    # Consulta ----------------------------------------------------------
+
+    def row(self, i, columns=None):
+        names = columns if columns is not None else [name for name, _ in self.columns]
+        return {name: self.ids[i] if name == 'id' else self.data[name][i] for name in names}
+
+    def get(self, record_id, columns=None):
+        i = self._position(record_id)
+        return self.row(i, columns) if i is not None else None
+
+    def _order(self, sort_by):
+        """(posicoes, chaves) em ordem crescente de (sort_by, id), NULLs no fim."""
+        if sort_by == 'id':
+            return range(len(self.ids)), self.ids
+        if sort_by not in self._orders:
+            values = self.data[sort_by]
+            keys = [(values[i] is None, values[i], self.ids[i]) for i in range(len(self.ids))]
+            positions = sorted(range(len(keys)), key=keys.__getitem__)
+            self._orders[sort_by] = (positions, [keys[i] for i in positions])
+        return self._orders[sort_by]
+
+    def _matches(self, search, search_mode='contains'):
+        """Posicoes das linhas encontradas pela busca (None: sem colunas de texto, sem filtro)."""
+        regex = like_regex(f"{search}%" if search_mode == 'prefix' else f"%{search}%")
+        text_columns = [self.data[name] for name, data_type in self.columns if data_type in TEXT_TYPES]
+        if not text_columns:
+            return None
+        return {
+            i for i in range(len(self.ids))
+            if any(values[i] is not None and regex.fullmatch(values[i]) for values in text_columns)
+        }
+
+    def _filter(self, column_filter, candidates):
+        """Posicoes (entre `candidates`; todas se None) que passam no filtro."""
+        predicate = filter_predicate(column_filter)
+        values = self.ids if column_filter.column == 'id' else self.data[column_filter.column]
+        positions = range(len(self.ids)) if candidates is None else candidates
+        return {i for i in positions if predicate(values[i])}
+
+    def query(self, sort_by='id', descending=False, search='', search_mode='contains', filters=(),
+              after=None, offset=0, page_size=100, columns=None):
+        """Pagina com a mesma semantica de fetch_page + busca (modos contains
+        e prefix) e filtros por coluna da API. `columns` limita as colunas
+        das linhas (todas se None).
+
+        Retorna (linhas, ha_proxima_pagina, total).
+        """
+        positions, keys = self._order(sort_by)
+        if after is not None:
+            value, last_id = after
+            if sort_by == 'id':
+                key = last_id
+            else:
+                sort_value = _coerce(value, dict(self.columns)[sort_by])
+                key = (sort_value is None, sort_value, last_id)
+            if descending:
+                positions = positions[:bisect.bisect_left(keys, key)][::-1]
+            else:
+                positions = positions[bisect.bisect_right(keys, key):]
+            offset = 0
+        elif descending:
+            positions = positions[::-1]
+
+        matches = self._matches(search, search_mode) if search else None
+        for column_filter in filters:
+            matches = self._filter(column_filter, matches)
+        total = len(self.ids) if matches is None else len(matches)
+
+        page = []
+        skipped = 0
+        for i in positions:
+            if matches is not None and i not in matches:
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            page.append(i)
+            if len(page) > page_size:
+                break
+        return [self.row(i, columns) for i in page[:page_size]], len(page) > page_size, total
+
+
+class HotCache:
+    """Tabelas em memoria do processo, com limite de memoria e descarte LRU."""
+
+    def __init__(self, max_bytes=HOT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._tables = OrderedDict()
+        self._oversized = set()
+        self._subscribed = False
+
+    def _subscribe(self):
+        if not self._subscribed:
+            self._subscribed = True
+            invalidation_bus.subscribe(self._on_change)
+        invalidation_bus.start()
+
+    def _on_change(self, event):
+        with self._lock:
+            if event.table is None:
+                # RESET: avisos podem ter sido perdidos
+                self._tables.clear()
+                self._oversized.clear()
+            elif event.table == 'tables_metadata':
+                # Chaves de tables_metadata sao nomes de tabela
+                for name in (event.keys if event.keys is not None else list(self._tables)):
+                    self._tables.pop(name, None)
+                    self._oversized.discard(name)
+            elif event.table in self._tables:
+                hot = self._tables[event.table]
+                if event.keys is None or event.op in ('TRUNCATE', 'DROP'):
+                    del self._tables[event.table]
+                else:
+                    hot.pending.update(event.keys)
+
+    def evict(self, table_name=None):
+        """Descarta uma tabela do cache (todas se None)."""
+        with self._lock:
+            if table_name is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(table_name, None)
+
+    def stats(self):
+        with self._lock:
+            tables = {name: hot.nbytes for name, hot in self._tables.items() if hot.loaded}
+        return {
+            'max_bytes': self.max_bytes,
+            'used_bytes': sum(tables.values()),
+            'tables': tables,
+        }
+
+    def _enforce_budget(self, current):
+        with self._lock:
+            if current.nbytes > self.max_bytes:
+                self._tables.pop(current.name, None)
+                self._oversized.add(current.name)
+                logger.warning(
+                    f"Tabela {current.name} ({current.nbytes} bytes) excede HOT_CACHE_MAX_MB; cache desativado"
+                )
+                return False
+            used = sum(hot.nbytes for hot in self._tables.values())
+            while used > self.max_bytes:
+                name = next(name for name in self._tables if name != current.name)
+                used -= self._tables.pop(name).nbytes
+            return True
+
+    def _acquire(self, table_meta):
+        """HotTable atualizada, ja com o lock adquirido, ou None se a
+        tabela nao deve ser servida do cache."""
+        if not table_meta or not table_meta.get('hot_cache'):
+            return None
+        self._subscribe()
+        if not invalidation_bus.is_listening():
+            return None
+
+        name = table_meta['name']
+        with self._lock:
+            if name in self._oversized:
+                return None
+            hot = self._tables.get(name)
+            if hot is None:
+                hot = self._tables[name] = HotTable(name)
+            else:
+                self._tables.move_to_end(name)
+
+        hot.lock.acquire()
+        try:
+            changed = not hot.loaded
+            if changed:
+                # Eventos recebidos durante a carga ficam em hot.pending e sao
+                # reaplicados abaixo
+                with get_db_cursor() as cursor:
+                    hot.load(cursor)
+            with self._lock:
+                pending, hot.pending = hot.pending, set()
+            if pending:
+                changed = True
+                with get_db_cursor() as cursor:
+                    hot.refresh(cursor, pending)
+            # A tabela pode crescer a cada refresh: o limite e conferido de novo
+            if changed and not self._enforce_budget(hot):
+                hot.lock.release()
+                return None
+            return hot
+        except Exception as e:
+            logger.warning(f"Cache da tabela {name} indisponivel: {e}")
+            with self._lock:
+                if self._tables.get(name) is hot:
+                    del self._tables[name]
+            hot.lock.release()
+            return None
+
+    @staticmethod
+    def _projection(hot, table_meta, fields, required=('id',)):
+        """Nomes das colunas pedidas em `fields` (None: todas), ou False se
+        algum campo nao existir (a consulta no banco responde o erro)."""
+        if not fields:
+            return None
+        try:
+            return [name for name, _ in project_columns(hot.columns, fields, table_meta, required)]
+        except ValueError:
+            return False
+
+    def query(self, table_meta, fields=None, **kwargs):
+        """Pagina da tabela servida da memoria (veja HotTable.query), ou None
+        se a tabela nao estiver no cache. `fields` como em project_columns;
+        id e a coluna de ordenacao sempre vem nas linhas."""
+        hot = self._acquire(table_meta)
+        if hot is None:
+            return None
+        try:
+            known = dict(hot.columns)
+            sort_by = kwargs.get('sort_by', 'id')
+            if sort_by not in known:
+                return None
+            if any(f.column not in known for f in kwargs.get('filters', ())):
+                return None
+            # A ordem de texto do Python (por codigo) nao e a collation do
+            # PostgreSQL: ordenacao e intervalos em texto ficam com o banco, e
+            # os cursores das duas origens continuam valendo uma na outra
+            if known[sort_by] in TEXT_TYPES:
+                return None
+            if any(known[f.column] in TEXT_TYPES and f.op in _RANGE_OPERATORS
+                   for f in kwargs.get('filters', ())):
+                return None
+            columns = self._projection(hot, table_meta, fields, ('id', sort_by))
+            if columns is False:
+                return None
+            return hot.query(columns=columns, **kwargs)
+        finally:
+            hot.lock.release()
+
+    def get_record(self, table_meta, record_id, fields=None):
+        """(True, registro ou None) servido da memoria, ou (False, None) se a
+        tabela nao estiver no cache."""
+        hot = self._acquire(table_meta)
+        if hot is None:
+            return False, None
+        try:
+            columns = self._projection(hot, table_meta, fields)
+            if columns is False:
+                return False, None
+            return True, hot.get(record_id, columns)
+        finally:
+            hot.lock.release()
+
+    def get_records(self, table_meta, record_ids, fields=None):
+        """dict id -> registro (ids inexistentes ficam de fora) servido da
+        memoria, ou None se a tabela nao estiver no cache."""
+        hot = self._acquire(table_meta)
+        if hot is None:
+            return None
+        try:
+            columns = self._projection(hot, table_meta, fields)
+            if columns is False:
+                return None
+            records = {}
+            for record_id in record_ids:
+                row = hot.get(record_id, columns)
+                if row is not None:
+                    records[record_id] = row
+            return records
+        finally:
+            hot.lock.release()
+
+
+# Instancia global do cache
+hot_cache = HotCache()
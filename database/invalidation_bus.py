@@ -0,0 +1,298 @@
+"""
+Barramento de invalidacao de cache (LISTEN/NOTIFY do PostgreSQL)
+
+Triggers de instrucao (com tabelas de transicao) em users,
+user_table_permissions, user_general_permissions, tables_metadata e em
+cada tabela dinamica publicam no canal CHANGES_CHANNEL um JSON com a
+tabela, a operacao e as chaves das linhas alteradas:
+
+    {"table": "clientes", "op": "UPDATE", "keys": [10, 11]}
+
+Com mais de MAX_NOTIFY_KEYS chaves (ou payload grande demais para o
+NOTIFY), "keys" vem null e o assinante deve descartar tudo da tabela. O
+aviso so e entregue no COMMIT, entao nenhum processo le o dado antigo
+depois de receber a invalidacao.
+
+Cada processo (API e Streamlit) mantem uma thread em LISTEN, numa conexao
+dedicada, que repassa os eventos aos assinantes registrados com
+invalidation_bus.subscribe(). Ao (re)conectar a thread envia um evento
+RESET (table None), pois avisos emitidos enquanto estava desconectada se
+perderam. invalidation_bus.change_version(tabela) muda a cada evento da
+tabela (ou RESET), para caches que nao podem ser limpos pelo callback (como
+o st.session_state do Streamlit).
+"""
+
+import os
+import json
+import time
+import select
+import logging
+import threading
+from collections import namedtuple
+
+import psycopg2
+import psycopg2.extensions
+
+from database.db_config import db_config, get_db_cursor
+
+logger = logging.getLogger(__name__)
+
+CHANGES_CHANNEL = 'table_changes'
+
+# Acima disso o evento vai sem chaves (invalida a tabela inteira)
+MAX_NOTIFY_KEYS = 500
+
+# Limite do payload do NOTIFY e 8000 bytes
+MAX_NOTIFY_PAYLOAD = 7900
+
+# Tabelas de sistema publicadas e a coluna usada como chave nos eventos
+SYSTEM_TABLE_KEYS = {
+    'users': 'id',
+    'user_table_permissions': 'user_id',
+    'user_general_permissions': 'user_id',
+    'tables_metadata': 'table_name',
+}
+
+CHANGE_OPERATIONS = ('insert', 'update', 'delete', 'truncate')
+
+BUS_SCHEMA = f"""
+CREATE OR REPLACE FUNCTION publish_table_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    key_column TEXT := COALESCE(TG_ARGV[0], 'id');
+    source TEXT;
+    keys JSONB;
+    payload TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        source := format('SELECT %I AS k FROM new_rows', key_column);
+    ELSIF TG_OP = 'DELETE' THEN
+        source := format('SELECT %I AS k FROM old_rows', key_column);
+    ELSIF TG_OP = 'UPDATE' THEN
+        source := format('SELECT %1$I AS k FROM new_rows UNION SELECT %1$I FROM old_rows', key_column);
+    END IF;
+
+    IF source IS NOT NULL THEN
+        EXECUTE format(
+            'SELECT jsonb_agg(k) FROM (SELECT DISTINCT k FROM (%s) s LIMIT %s) t',
+            source, {MAX_NOTIFY_KEYS + 1}
+        ) INTO keys;
+        IF keys IS NULL THEN
+            -- Nenhuma linha afetada
+            RETURN NULL;
+        END IF;
+        IF jsonb_array_length(keys) > {MAX_NOTIFY_KEYS} THEN
+            keys := NULL;
+        END IF;
+    END IF;
+
+    payload := jsonb_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'keys', keys)::text;
+    IF octet_length(payload) > {MAX_NOTIFY_PAYLOAD} THEN
+        payload := jsonb_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'keys', NULL)::text;
+    END IF;
+    PERFORM pg_notify('{CHANGES_CHANNEL}', payload);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+ChangeEvent = namedtuple('ChangeEvent', ['table', 'op', 'keys'])
+
+# Evento enviado aos assinantes quando avisos podem ter sido perdidos
+RESET_EVENT = ChangeEvent(None, 'RESET', None)
+
+
+# ---------------------------------------------------------------------------
+# Triggers
+# ---------------------------------------------------------------------------
+
+def ensure_bus_schema(cursor):
+    """Cria (ou atualiza) a funcao de trigger que publica os eventos."""
+    cursor.execute(BUS_SCHEMA)
+
+
+def install_change_triggers(cursor, table_name, key_column='id'):
+    """Instala as triggers que publicam as alteracoes da tabela (idempotente)."""
+    ensure_bus_schema(cursor)
+    for op in CHANGE_OPERATIONS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table_name}_changes_{op} ON {table_name}")
+
+    cursor.execute(f"""
+        CREATE TRIGGER {table_name}_changes_insert
+        AFTER INSERT ON {table_name}
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION publish_table_change('{key_column}')
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {table_name}_changes_update
+        AFTER UPDATE ON {table_name}
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION publish_table_change('{key_column}')
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {table_name}_changes_delete
+        AFTER DELETE ON {table_name}
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION publish_table_change('{key_column}')
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {table_name}_changes_truncate
+        AFTER TRUNCATE ON {table_name}
+        FOR EACH STATEMENT EXECUTE FUNCTION publish_table_change('{key_column}')
+    """)
+
+
+def publish_change(cursor, table_name, op, keys=None):
+    """Publica um evento manualmente (ex.: DROP TABLE, que nao dispara triggers).
+
+    Como o NOTIFY das triggers, so e entregue no COMMIT da transacao do cursor.
+    """
+    payload = json.dumps({'table': table_name, 'op': op, 'keys': keys}, default=str)
+    cursor.execute("SELECT pg_notify(%s, %s)", (CHANGES_CHANNEL, payload))
+
+
+def ensure_change_triggers(cursor):
+    """Instala as triggers nas tabelas de sistema e nas tabelas dinamicas
+    que ainda nao as tem (tabelas criadas antes do barramento)."""
+    cursor.execute("SELECT table_name FROM tables_metadata")
+    tables = dict(SYSTEM_TABLE_KEYS)
+    for row in cursor.fetchall():
+        tables.setdefault(row['table_name'], 'id')
+
+    cursor.execute("""
+        SELECT c.relname AS table_name
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind = 'r' AND c.relname = ANY(%s)
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_trigger t
+              WHERE t.tgrelid = c.oid AND t.tgname = c.relname || '_changes_insert'
+          )
+    """, (list(tables),))
+    for row in cursor.fetchall():
+        install_change_triggers(cursor, row['table_name'], tables[row['table_name']])
+
+
+# ---------------------------------------------------------------------------
+# Listener
+# ---------------------------------------------------------------------------
+
+def parse_event(payload):
+    """ChangeEvent do payload JSON; RESET_EVENT se o payload for invalido."""
+    try:
+        data = json.loads(payload)
+        return ChangeEvent(data['table'], data['op'], data.get('keys'))
+    except (ValueError, TypeError, KeyError):
+        logger.warning(f"Evento de invalidacao invalido: {payload!r}")
+        return RESET_EVENT
+
+
+class InvalidationBus:
+    """Thread em LISTEN que repassa os eventos de alteracao aos assinantes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._thread = None
+        self._pid = None
+        self._listening = False
+        self._triggers_ready = False
+        self._versions = {}
+        self._resets = 0
+
+    def subscribe(self, callback, table=None):
+        """Registra `callback(event)` para os eventos de `table` (todas se None).
+
+        O callback roda na thread do listener: deve apenas descartar entradas
+        de cache, sem consultar o banco. Todos os assinantes recebem RESET_EVENT.
+        """
+        with self._lock:
+            self._subscribers.append((table, callback))
+        self.start()
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [(t, c) for t, c in self._subscribers if c is not callback]
+
+    def is_listening(self):
+        """True se a thread esta conectada e recebendo avisos neste processo."""
+        return (self._listening and self._pid == os.getpid()
+                and self._thread is not None and self._thread.is_alive())
+
+    def change_version(self, table):
+        """Versao das alteracoes de `table` vistas por este processo: muda a
+        cada evento da tabela e a cada RESET. Sem o listener nunca muda."""
+        with self._lock:
+            return (self._resets, self._versions.get(table, 0))
+
+    def dispatch(self, event):
+        with self._lock:
+            if event.table is None:
+                self._resets += 1
+            else:
+                self._versions[event.table] = self._versions.get(event.table, 0) + 1
+            subscribers = list(self._subscribers)
+        for table, callback in subscribers:
+            if event.table is None or table is None or table == event.table:
+                try:
+                    callback(event)
+                except Exception as e:
+                    logger.error(f"Erro no assinante de invalidacao {callback!r}: {e}")
+
+    def start(self):
+        """Inicia a thread do listener no processo atual (idempotente)."""
+        if os.getenv('INVALIDATION_LISTENER', 'true').lower() == 'false':
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Processo filho (fork): a thread do pai nao existe aqui
+                self._pid = os.getpid()
+                self._thread = None
+                self._listening = False
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._listen, name="invalidation-listener", daemon=True)
+            self._thread.start()
+
+    def _install_triggers(self):
+        if self._triggers_ready:
+            return
+        try:
+            with get_db_cursor() as cursor:
+                ensure_change_triggers(cursor)
+            self._triggers_ready = True
+        except Exception as e:
+            logger.warning(f"Nao foi possivel instalar as triggers de invalidacao: {e}")
+
+    def _listen(self):
+        """LISTEN em conexao dedicada (fora do pool); reconecta em caso de falha."""
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**db_config.get_connection_params())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANGES_CHANNEL}")
+                self._install_triggers()
+                self._listening = True
+                # Alteracoes feitas antes do LISTEN nao geraram aviso para este processo
+                self.dispatch(RESET_EVENT)
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.dispatch(parse_event(notify.payload))
+            except Exception as e:
+                logger.warning(f"Listener de invalidacao desconectado: {e}")
+                self._listening = False
+                self.dispatch(RESET_EVENT)
+                time.sleep(5)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+
+# Instancia global do barramento
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,349 @@
+"""
+Tarefas em segundo plano (importacao e exportacao de CSV)
+
+A aplicacao e a API gravam a tarefa na tabela jobs (status 'queued') e
+respondem na hora; o processo job_worker.py mantem alguns processos que
+retiram tarefas da fila com SELECT ... FOR UPDATE SKIP LOCKED (cada tarefa
+vai para um unico worker, sem bloquear os demais) e as executam fora da
+sessao do usuario. O andamento (progress, message) e gravado na propria
+linha da tarefa e consultado pela tela (Streamlit) ou por GET /api/jobs/<id>.
+
+Arquivos de entrada e de resultado ficam em JOBS_DIR/<id>/ (por padrao
+data/jobs, compartilhado pelos containers). Uma tarefa cujo worker morreu
+(sem sinal de vida ha JOB_STALE_SECONDS) volta para a fila ate
+JOB_MAX_ATTEMPTS tentativas.
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+
+from database.csv_import import import_csv
+from database.db_config import get_db_cursor, db_pool
+from database.metadata_registry import metadata_registry, sanitize_identifier
+from database.row_counts import get_row_count
+from database.table_browser import get_table_columns, build_filter, count_rows, export_csv
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.getenv(
+    'JOBS_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'jobs')
+)
+
+# Intervalo (s) entre consultas a fila quando nao ha tarefas
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '2'))
+
+# Intervalo (s) do sinal de vida de uma tarefa em execucao
+JOB_HEARTBEAT_INTERVAL = 30
+
+# Tarefa 'running' sem sinal de vida ha mais que isso volta para a fila
+JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', '300'))
+
+JOB_MAX_ATTEMPTS = 3
+
+# Tarefas concluidas (e seus arquivos) sao removidas depois desse prazo
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', '7'))
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    params JSONB NOT NULL DEFAULT '{}'::jsonb,
+    created_by VARCHAR(100),
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    result JSONB,
+    result_file TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (heartbeat_at) WHERE status = 'running';
+"""
+
+JOB_COLUMNS = """
+    id, kind, status, params, created_by, progress, message, result, result_file,
+    error, attempts, created_at, started_at, heartbeat_at, finished_at
+"""
+
+_schema_ready = False
+
+
+def ensure_jobs_schema(cursor):
+    """Cria a tabela de tarefas (idempotente; uma vez por processo)."""
+    global _schema_ready
+    if not _schema_ready:
+        cursor.execute(JOBS_SCHEMA)
+        _schema_ready = True
+
+
+def job_dir(job_id, create=False):
+    path = os.path.join(JOBS_DIR, str(int(job_id)))
+    if create:
+        os.makedirs(path, exist_ok=True)
+    return path
+
+
+def job_file(job):
+    """Caminho do arquivo de resultado da tarefa, ou None."""
+    if not job or not job.get('result_file'):
+        return None
+    return os.path.join(job_dir(job['id']), job['result_file'])
+
+
+def create_job(cursor, kind, params, created_by=None):
+    """Grava a tarefa na fila e retorna o id.
+
+    A tarefa so fica visivel para os workers no commit do cursor, entao o
+    chamador pode gravar os arquivos de entrada em job_dir(id) antes disso.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {kind}")
+    ensure_jobs_schema(cursor)
+    cursor.execute(
+        "INSERT INTO jobs (kind, params, created_by) VALUES (%s, %s, %s) RETURNING id",
+        (kind, json.dumps(params), created_by)
+    )
+    return cursor.fetchone()['id']
+
+
+def get_job(cursor, job_id):
+    """Linha da tarefa (dict) ou None."""
+    cursor.execute("SELECT to_regclass('public.jobs') IS NOT NULL AS installed")
+    if not cursor.fetchone()['installed']:
+        return None
+    cursor.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = %s", (job_id,))
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+
+def requeue_stale_jobs(cursor):
+    """Devolve a fila as tarefas cujo worker parou de dar sinal de vida
+    (ou as marca como falhas apos JOB_MAX_ATTEMPTS tentativas)."""
+    cursor.execute("""
+        UPDATE jobs
+        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+            error = CASE WHEN attempts >= %s THEN 'Worker interrompido' ELSE error END,
+            finished_at = CASE WHEN attempts >= %s THEN NOW() ELSE NULL END
+        WHERE status = 'running' AND heartbeat_at < NOW() - make_interval(secs => %s)
+    """, (JOB_MAX_ATTEMPTS, JOB_MAX_ATTEMPTS, JOB_MAX_ATTEMPTS, JOB_STALE_SECONDS))
+    return cursor.rowcount
+
+
+def claim_job(cursor):
+    """Retira a proxima tarefa da fila (FOR UPDATE SKIP LOCKED) e a marca
+    como 'running'. Retorna a linha da tarefa ou None."""
+    cursor.execute(f"""
+        UPDATE jobs
+        SET status = 'running', attempts = attempts + 1, progress = 0, message = NULL,
+            started_at = NOW(), heartbeat_at = NOW()
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE status = 'queued'
+            ORDER BY id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING {JOB_COLUMNS}
+    """)
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+
+def report_progress(job_id, progress, message=None):
+    """Atualiza o andamento (0..1) em uma transacao propria, visivel na hora."""
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            "UPDATE jobs SET progress = %s, message = %s, heartbeat_at = NOW() WHERE id = %s",
+            (min(max(float(progress), 0.0), 1.0), message, job_id)
+        )
+
+
+def finish_job(job_id, result=None, result_file=None, error=None):
+    with get_db_cursor() as cursor:
+        cursor.execute("""
+            UPDATE jobs
+            SET status = %s, progress = CASE WHEN %s THEN 1 ELSE progress END,
+                result = %s, result_file = %s, error = %s, finished_at = NOW()
+            WHERE id = %s
+        """, (
+            'failed' if error else 'done', not error,
+            json.dumps(result, default=str) if result is not None else None,
+            result_file, error, job_id
+        ))
+
+
+def purge_jobs(cursor, retention_days=JOB_RETENTION_DAYS):
+    """Remove as tarefas concluidas ha mais de `retention_days` dias e seus arquivos."""
+    cursor.execute("""
+        DELETE FROM jobs
+        WHERE status IN ('done', 'failed') AND finished_at < NOW() - make_interval(days => %s)
+        RETURNING id
+    """, (retention_days,))
+    job_ids = [row['id'] for row in cursor.fetchall()]
+    for job_id in job_ids:
+        shutil.rmtree(job_dir(job_id), ignore_errors=True)
+    return len(job_ids)
+
+
+# ---------------------------------------------------------------------------
+# Tipos de tarefa
+# ---------------------------------------------------------------------------
+
+def run_csv_import(job):
+    """Importa JOBS_DIR/<id>/input.csv (veja csv_import.import_csv) em uma
+    unica transacao. Parametros: table_name."""
+    table_name = job['params']['table_name']
+    table_meta = metadata_registry.get_table(table_name)
+    if table_meta is None:
+        raise ValueError(f"Tabela '{table_name}' nao encontrada")
+    path = os.path.join(job_dir(job['id']), 'input.csv')
+    column_names = [sanitize_identifier(field['name']) for field in table_meta['fields']]
+
+    def on_chunk(tally):
+        report_progress(
+            job['id'], tally['progress'],
+            f"{tally['rows']:,} linhas lidas, {tally['valid']:,} validas"
+        )
+
+    with open(path, 'rb') as source:
+        with get_db_cursor() as cursor:
+            tally = import_csv(
+                cursor, source, table_meta, table_name, column_names,
+                size=os.path.getsize(path), on_chunk=on_chunk
+            )
+    os.remove(path)
+    return tally, None
+
+
+class _ProgressWriter:
+    """Arquivo de saida do COPY que conta as linhas gravadas e informa o
+    andamento a cada `interval` segundos."""
+
+    def __init__(self, file, job_id, total, interval=1.0):
+        self.file = file
+        self.job_id = job_id
+        self.total = total
+        self.interval = interval
+        self.lines = 0
+        self.bytes = 0
+        self._reported_at = time.monotonic()
+
+    def write(self, data):
+        self.file.write(data)
+        self.lines += data.count(b'\n') if isinstance(data, bytes) else data.count('\n')
+        self.bytes += len(data)
+        now = time.monotonic()
+        if now - self._reported_at >= self.interval:
+            self._reported_at = now
+            rows = max(self.lines - 1, 0)
+            progress = min(rows / self.total, 0.99) if self.total else 0.0
+            report_progress(self.job_id, progress, f"{rows:,} linhas exportadas")
+
+
+def run_csv_export(job):
+    """Exporta a tabela em CSV para JOBS_DIR/<id>/<tabela>.csv com o mesmo
+    filtro e ordem da tela. Parametros: table_name, sort_by, descending,
+    search, filter_column e columns (colunas exportadas; todas se ausente)."""
+    params = job['params']
+    table_name = params['table_name']
+    file_name = f"{table_name}.csv"
+    path = os.path.join(job_dir(job['id'], create=True), file_name)
+
+    with get_db_cursor() as cursor:
+        columns = get_table_columns(cursor, table_name)
+        if not columns:
+            raise ValueError(f"Tabela '{table_name}' nao encontrada")
+        column_names = [name for name, _ in columns]
+        sort_by = params.get('sort_by') or 'id'
+        if sort_by not in column_names:
+            raise ValueError(f"Coluna de ordenacao invalida: {sort_by}")
+        filter_column = params.get('filter_column')
+        if filter_column and filter_column not in column_names:
+            raise ValueError(f"Coluna de filtro invalida: {filter_column}")
+        where, where_params = build_filter(column_names, params.get('search', ''), filter_column)
+        total = (count_rows(cursor, table_name, where, where_params) if where
+                 else get_row_count(cursor, table_name, 'maintained'))
+
+        if params.get('columns'):
+            export_columns = [(name, data_type) for name, data_type in columns if name in params['columns']]
+        else:
+            export_columns = columns
+
+        with open(path, 'wb') as output:
+            writer = _ProgressWriter(output, job['id'], total)
+            export_csv(cursor, table_name, export_columns, sort_by, params.get('descending', False),
+                       where, where_params, output=writer)
+    return {'rows': max(writer.lines - 1, 0), 'bytes': writer.bytes}, file_name
+
+
+# Tipo de tarefa -> funcao(job) que retorna (resultado, arquivo_de_resultado)
+JOB_HANDLERS = {
+    'csv_import': run_csv_import,
+    'csv_export': run_csv_export,
+}
+
+
+# ---------------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------------
+
+def _heartbeat(job_id, stop):
+    while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+        try:
+            with get_db_cursor() as cursor:
+                cursor.execute("UPDATE jobs SET heartbeat_at = NOW() WHERE id = %s", (job_id,))
+        except Exception as e:
+            logger.warning(f"Falha no sinal de vida da tarefa {job_id}: {e}")
+
+
+def run_job(job):
+    """Executa a tarefa e grava o resultado (ou o erro) na linha dela."""
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job['id'], stop), daemon=True)
+    heartbeat.start()
+    try:
+        result, result_file = JOB_HANDLERS[job['kind']](job)
+    except Exception as e:
+        logger.error(f"Tarefa {job['id']} ({job['kind']}) falhou: {e}")
+        finish_job(job['id'], error=str(e))
+    else:
+        finish_job(job['id'], result=result, result_file=result_file)
+    finally:
+        stop.set()
+        heartbeat.join()
+
+
+def run_worker(poll_interval=JOB_POLL_INTERVAL):
+    """Laco de um processo worker: retira e executa tarefas indefinidamente."""
+    db_pool.start()
+    with get_db_cursor() as cursor:
+        ensure_jobs_schema(cursor)
+    last_purge = 0.0
+    while True:
+        try:
+            with get_db_cursor() as cursor:
+                requeue_stale_jobs(cursor)
+                if time.monotonic() - last_purge > 3600:
+                    last_purge = time.monotonic()
+                    purge_jobs(cursor)
+                job = claim_job(cursor)
+        except Exception as e:
+            logger.error(f"Erro ao consultar a fila de tarefas: {e}")
+            job = None
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        logger.info(f"Tarefa {job['id']} ({job['kind']}) iniciada")
+        run_job(job)
@@ -0,0 +1,390 @@
+"""
+Registro compartilhado dos metadados das tabelas dinamicas (tables_metadata)
+
+Os metadados sao lidos uma vez, normalizados em objetos imutaveis e mantidos
+em cache no processo junto com um numero de versao. Qualquer escrita em
+tables_metadata incrementa a versao (sequence) e publica um evento no
+barramento de invalidacao (database.invalidation_bus), que invalida o cache
+de todos os processos. Sem o listener, a versao e conferida no maximo a cada
+METADATA_CHECK_INTERVAL segundos.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+from database.db_config import get_db_cursor
+from database.bulk_ingest import SQL_TYPES
+from database.invalidation_bus import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Intervalo (s) de conferencia da versao quando o listener nao esta ativo
+METADATA_CHECK_INTERVAL = float(os.getenv('METADATA_CHECK_INTERVAL', '5'))
+
+METADATA_SCHEMA = """
+CREATE SEQUENCE IF NOT EXISTS tables_metadata_version_seq;
+
+CREATE OR REPLACE FUNCTION bump_tables_metadata_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM nextval('tables_metadata_version_seq');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Colunas acrescentadas a tables_metadata depois do schema inicial
+METADATA_COLUMNS = {
+    # Tabelas mantidas inteiras em memoria pela API (database.hot_cache)
+    'hot_cache': "BOOLEAN NOT NULL DEFAULT FALSE",
+    # Campos que identificam o registro (database.natural_key)
+    'natural_key': "JSONB",
+    # Indices de busca textual (database.text_search)
+    'search_config': "JSONB",
+}
+
+# Configuracao de busca textual do PostgreSQL da coluna search_vector
+DEFAULT_SEARCH_LANGUAGE = 'portuguese'
+
+RESERVED_WORDS = {
+    'check', 'order', 'group', 'select', 'from', 'where', 'having', 'limit', 'offset',
+    'insert', 'update', 'delete', 'create', 'alter', 'drop', 'table', 'index',
+    'constraint', 'primary', 'key', 'foreign', 'references', 'unique', 'not', 'null',
+    'default', 'auto_increment', 'serial', 'boolean', 'integer', 'text', 'varchar',
+    'char', 'date', 'time', 'timestamp', 'real', 'float', 'double', 'decimal',
+    'bigint', 'smallint', 'numeric', 'money', 'bytea', 'json', 'jsonb', 'array',
+    'enum', 'range', 'domain', 'type', 'view', 'function', 'procedure', 'trigger',
+    'sequence', 'schema', 'database', 'user', 'role', 'grant', 'revoke', 'privilege',
+    'cascade', 'restrict', 'on', 'in', 'exists', 'between', 'like', 'ilike', 'similar',
+    'to', 'as', 'is', 'and', 'or', 'case', 'when', 'then', 'else', 'end', 'if',
+    'for', 'while', 'loop', 'return', 'begin', 'commit', 'rollback', 'transaction',
+    'lock', 'unlock', 'vacuum', 'analyze', 'explain', 'with', 'recursive', 'union',
+    'intersect', 'except', 'all', 'distinct', 'asc', 'desc', 'nulls', 'first', 'last'
+}
+
+
+def sanitize_identifier(name: str) -> str:
+    """
+    Convert a human‑supplied table or column name into a safe SQL identifier.
+    This replaces spaces with underscores, converts to lower case and removes
+    characters that are not alphanumeric or underscores.  The resulting
+    identifier should always be safe to use directly in SQL statements.
+    """
+    name = name.strip().lower().replace(" ", "_")
+    allowed = []
+    for c in name:
+        if c.isalnum() or c == "_":
+            allowed.append(c)
+        else:
+            allowed.append("_")
+    # Ensure the identifier does not start with a number
+    sanitized = "".join(allowed)
+    if sanitized and sanitized[0].isdigit():
+        sanitized = f"_{sanitized}"
+
+    # Se o identificador for uma palavra reservada, adicionar sufixo
+    if sanitized in RESERVED_WORDS:
+        sanitized = f"{sanitized}_col"
+
+    return sanitized
+
+
+# ---------------------------------------------------------------------------
+# Objetos de schema (imutaveis, compativeis com o acesso por chave dos dicts)
+# ---------------------------------------------------------------------------
+
+class _FrozenDict(dict):
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} e imutavel")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _readonly
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+
+class FieldSchema(_FrozenDict):
+    """Campo de uma tabela dinamica: {'name': ..., 'type': ...}."""
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self['name']
+
+    @property
+    def type(self):
+        return self['type']
+
+    @property
+    def column(self):
+        """Nome da coluna no banco."""
+        return sanitize_identifier(self['name'])
+
+    @property
+    def sql_type(self):
+        return SQL_TYPES.get(self['type'], 'TEXT')
+
+
+class TableSchema(_FrozenDict):
+    """Metadados de uma tabela dinamica; 'fields' e uma tupla de FieldSchema."""
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self['name']
+
+    @property
+    def display_name(self):
+        return self['display_name']
+
+    @property
+    def fields(self):
+        return self['fields']
+
+    @property
+    def status(self):
+        return self['status']
+
+    @property
+    def is_active(self):
+        return self['status'] == 'ativo'
+
+    @property
+    def hot_cache(self):
+        return self['hot_cache']
+
+    @property
+    def natural_key(self):
+        """Nomes dos campos da chave natural (tupla vazia se nao houver)."""
+        return self['natural_key']
+
+    @property
+    def natural_key_columns(self):
+        return tuple(sanitize_identifier(name) for name in self['natural_key'])
+
+    @property
+    def search_config(self):
+        """{'trigram': campos, 'fulltext': campos, 'language': ...}."""
+        return self['search_config']
+
+    @property
+    def field_names(self):
+        return tuple(field['name'] for field in self['fields'])
+
+    @property
+    def column_names(self):
+        return tuple(field.column for field in self['fields'])
+
+    def field(self, name):
+        for field in self['fields']:
+            if field['name'] == name:
+                return field
+        return None
+
+
+def _make_field(field):
+    return FieldSchema(name=field.get('name', ''), type=field.get('type', 'text'))
+
+
+def parse_fields(columns, table_name=''):
+    """Normaliza a coluna JSONB `columns` em uma tupla de FieldSchema.
+
+    Aceita lista de campos, um unico campo (dict com 'name'), um dict
+    nome -> tipo ou o JSON serializado de qualquer um deles.
+    """
+    if isinstance(columns, str):
+        try:
+            columns = json.loads(columns)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Erro ao fazer parse JSON da tabela {table_name}: {e}")
+            return ()
+
+    if not columns:
+        return ()
+    if isinstance(columns, list):
+        fields = []
+        for field in columns:
+            if isinstance(field, dict):
+                fields.append(_make_field(field))
+            else:
+                logger.warning(f"Campo invalido na tabela {table_name}: {field} (tipo: {type(field)})")
+        return tuple(fields)
+    if isinstance(columns, dict):
+        if 'name' in columns:
+            return (_make_field(columns),)
+        return tuple(
+            FieldSchema(name=name, type=field_type if isinstance(field_type, str) else 'text')
+            for name, field_type in columns.items()
+        )
+    logger.warning(f"Formato invalido de campos na tabela {table_name}: {type(columns)}")
+    return ()
+
+
+def parse_search_config(value):
+    """Normaliza search_config (JSONB ou None) em dict com tuplas."""
+    if isinstance(value, str):
+        value = json.loads(value)
+    value = value or {}
+    return {
+        'trigram': tuple(value.get('trigram') or ()),
+        'fulltext': tuple(value.get('fulltext') or ()),
+        'language': value.get('language') or DEFAULT_SEARCH_LANGUAGE,
+    }
+
+
+def _table_from_row(row):
+    created_at = row['created_at']
+    updated_at = row['updated_at']
+    return TableSchema(
+        id=row['id'],
+        name=row['table_name'],
+        display_name=row['display_name'] or row['table_name'],
+        description=row['description'],
+        fields=parse_fields(row['columns'], row['table_name']),
+        status=row['status'] or 'ativo',
+        hot_cache=bool(row['hot_cache']),
+        natural_key=tuple(row['natural_key'] or ()),
+        search_config=parse_search_config(row['search_config']),
+        created_at=created_at.isoformat() if created_at else None,
+        updated_at=updated_at.isoformat() if updated_at else None,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Registro
+# ---------------------------------------------------------------------------
+
+def ensure_metadata_schema(cursor):
+    """Cria sequence, funcao, trigger de versao e colunas novas de tables_metadata (idempotente)."""
+    cursor.execute(METADATA_SCHEMA)
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'tables_metadata'
+    """)
+    existing = {row['column_name'] for row in cursor.fetchall()}
+    for column, definition in METADATA_COLUMNS.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE tables_metadata ADD COLUMN IF NOT EXISTS {column} {definition}")
+    # CREATE OR REPLACE (PostgreSQL 14+): dois processos podem iniciar ao mesmo tempo
+    cursor.execute("""
+        CREATE OR REPLACE TRIGGER tables_metadata_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tables_metadata
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_tables_metadata_version()
+    """)
+    # Nome antigo da funcao (o aviso aos processos agora vem do invalidation_bus)
+    cursor.execute("DROP FUNCTION IF EXISTS notify_tables_metadata_changed()")
+
+
+class MetadataRegistry:
+    """Cache por processo dos metadados, invalidado pela versao no banco."""
+
+    def __init__(self, check_interval=METADATA_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._tables = ()
+        self._by_name = {}
+        self._version = None
+        self._loaded = False
+        self._dirty = True
+        self._invalidations = 0
+        self._checked_at = 0.0
+        self._schema_ready = False
+        self._subscribed = False
+        self._pid = None
+
+    # Carga ---------------------------------------------------------------
+
+    def _load(self):
+        invalidations = self._invalidations
+        with get_db_cursor() as cursor:
+            if not self._schema_ready:
+                ensure_metadata_schema(cursor)
+                self._schema_ready = True
+            # Versao lida antes das linhas: uma alteracao concorrente faz a
+            # proxima conferencia recarregar
+            cursor.execute("SELECT last_value FROM tables_metadata_version_seq")
+            version = cursor.fetchone()['last_value']
+            cursor.execute("""
+                SELECT id, table_name, display_name, description, columns, status, hot_cache,
+                       natural_key, search_config, created_at, updated_at
+                FROM tables_metadata
+                ORDER BY created_at
+            """)
+            tables = tuple(_table_from_row(row) for row in cursor.fetchall())
+
+        self._tables = tables
+        self._by_name = {table['name']: table for table in tables}
+        self._version = version
+        self._loaded = True
+        # Um aviso recebido durante a carga mantem o cache marcado para recarga
+        self._dirty = invalidations != self._invalidations
+        self._checked_at = time.monotonic()
+
+    def _current_version(self):
+        with get_db_cursor() as cursor:
+            cursor.execute("SELECT last_value FROM tables_metadata_version_seq")
+            return cursor.fetchone()['last_value']
+
+    def _ensure_fresh(self):
+        with self._lock:
+            self._subscribe()
+            if not self._loaded or self._dirty:
+                self._load()
+                return
+            now = time.monotonic()
+            if not invalidation_bus.is_listening() and now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                if self._current_version() != self._version:
+                    self._load()
+
+    # Consulta ------------------------------------------------------------
+
+    def list_tables(self, include_inactive=False):
+        """Tupla de TableSchema na ordem de criacao."""
+        self._ensure_fresh()
+        if include_inactive:
+            return self._tables
+        return tuple(table for table in self._tables if table['status'] == 'ativo')
+
+    def get_table(self, table_name):
+        """TableSchema da tabela (ativa ou nao) ou None."""
+        self._ensure_fresh()
+        return self._by_name.get(table_name)
+
+    def table_names(self, include_inactive=False):
+        return [table['name'] for table in self.list_tables(include_inactive)]
+
+    @property
+    def version(self):
+        return self._version
+
+    def invalidate(self, version=None):
+        """Marca o cache como desatualizado (chamado apos escritas e pelo listener)."""
+        if version is None or version != self._version:
+            self._invalidations += 1
+            self._dirty = True
+
+    # Invalidacao -------------------------------------------------------
+
+    def _subscribe(self):
+        if not self._subscribed:
+            self._subscribed = True
+            invalidation_bus.subscribe(self._on_change, table='tables_metadata')
+        if self._pid != os.getpid():
+            # Processo filho (fork): avisos recebidos pelo pai nao valem aqui
+            self._pid = os.getpid()
+            self._dirty = True
+        invalidation_bus.start()
+
+    def _on_change(self, event):
+        # Inclui o RESET do barramento (reconexao ou fork)
+        self.invalidate()
+
+
+# Instancia global do registro
+metadata_registry = MetadataRegistry()
@@ -0,0 +1,76 @@
+"""
+Chave natural das tabelas dinamicas (tables_metadata.natural_key)
+
+Os campos da chave ganham um indice unico (NULLS NOT DISTINCT: valores
+vazios tambem contam como iguais), e as cargas em lote descartam
+duplicados com INSERT ... ON CONFLICT DO NOTHING nessa chave, em vez de
+comparar todas as colunas com a tabela inteira.
+"""
+
+import json
+
+from database.metadata_registry import sanitize_identifier
+
+# Exemplos de chaves repetidas mostrados quando o indice nao pode ser criado
+MAX_DUPLICATE_EXAMPLES = 5
+
+
+def natural_key_index(table_name):
+    return f"{table_name}_natural_key"
+
+
+def key_columns(field_names):
+    return [sanitize_identifier(name) for name in field_names]
+
+
+def find_key_duplicates(cursor, table_name, columns, limit=MAX_DUPLICATE_EXAMPLES):
+    """Exemplos de valores da chave que aparecem em mais de uma linha."""
+    column_list = ', '.join(columns)
+    cursor.execute(f"""
+        SELECT {column_list}, COUNT(*) AS occurrences
+        FROM {table_name}
+        GROUP BY {column_list}
+        HAVING COUNT(*) > 1
+        ORDER BY COUNT(*) DESC
+        LIMIT %s
+    """, (limit,))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def create_natural_key_index(cursor, table_name, columns):
+    """(Re)cria o indice unico da chave; sem colunas, apenas remove o indice."""
+    index_name = natural_key_index(table_name)
+    cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+    if columns:
+        cursor.execute(
+            f"CREATE UNIQUE INDEX {index_name} ON {table_name} ({', '.join(columns)}) NULLS NOT DISTINCT"
+        )
+
+
+def set_natural_key(cursor, table_meta, field_names):
+    """Define (ou remove, com lista vazia) a chave natural da tabela.
+
+    ValueError se algum campo nao existir ou se a tabela ja tiver linhas
+    repetidas na chave (a mensagem traz exemplos).
+    """
+    table_name = table_meta['name']
+    known = {field['name'] for field in table_meta['fields']}
+    unknown = [name for name in field_names if name not in known]
+    if unknown:
+        raise ValueError(f"Campo(s) inexistente(s) na tabela: {', '.join(unknown)}")
+
+    columns = key_columns(field_names)
+    if columns:
+        duplicates = find_key_duplicates(cursor, table_name, columns)
+        if duplicates:
+            examples = '; '.join(
+                ', '.join(f"{col}={row[col]}" for col in columns) + f" ({row['occurrences']}x)"
+                for row in duplicates
+            )
+            raise ValueError(f"A tabela tem registros repetidos nessa chave: {examples}")
+
+    create_natural_key_index(cursor, table_name, columns)
+    cursor.execute(
+        "UPDATE tables_metadata SET natural_key = %s, updated_at = NOW() WHERE table_name = %s",
+        (json.dumps(list(field_names)) if field_names else None, table_name)
+    )
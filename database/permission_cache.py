@@ -0,0 +1,143 @@
+"""
+Snapshot das permissoes de um usuario (tabela -> bitmask + permissoes gerais)
+
+O snapshot e carregado com uma unica consulta e guardado na sessao; as
+verificacoes de permissao passam a ser consultas em memoria. Cada processo
+mantem contadores de epoca (global e por usuario) incrementados pelos
+eventos do barramento de invalidacao em users, user_table_permissions e
+user_general_permissions: um snapshot so e recarregado quando a epoca do
+seu usuario mudou. Sem o listener, o snapshot vale no maximo
+PERMISSION_CHECK_INTERVAL segundos.
+"""
+
+import os
+import time
+import threading
+
+from database.invalidation_bus import invalidation_bus
+
+# Intervalo (s) de validade do snapshot quando o listener nao esta ativo
+PERMISSION_CHECK_INTERVAL = float(os.getenv('PERMISSION_CHECK_INTERVAL', '5'))
+
+PERMISSION_BITS = {
+    'view': 1,
+    'insert': 2,
+    'update': 4,
+    'delete': 8,
+}
+
+GENERAL_PERMISSION_BITS = {
+    'create_tables': 1,
+}
+
+PERMISSION_TABLES = ('users', 'user_table_permissions', 'user_general_permissions')
+
+SNAPSHOT_SQL = """
+    SELECT
+        u.id AS user_id,
+        COALESCE(ugp.can_create_tables, FALSE)::int AS general,
+        COALESCE((
+            SELECT jsonb_object_agg(
+                utp.table_name,
+                (COALESCE(utp.can_view, FALSE)::int)
+                | (COALESCE(utp.can_insert, FALSE)::int << 1)
+                | (COALESCE(utp.can_update, FALSE)::int << 2)
+                | (COALESCE(utp.can_delete, FALSE)::int << 3)
+            )
+            FROM user_table_permissions utp
+            WHERE utp.user_id = u.id
+        ), '{}'::jsonb) AS tables
+    FROM users u
+    LEFT JOIN user_general_permissions ugp ON ugp.user_id = u.id
+    WHERE u.username = %s
+"""
+
+
+class PermissionSnapshot:
+    """Permissoes de um usuario em um instante (imutavel)."""
+
+    __slots__ = ('username', 'user_id', 'tables', 'general', 'epoch', 'loaded_at')
+
+    def __init__(self, username, user_id, tables, general, epoch, loaded_at):
+        self.username = username
+        self.user_id = user_id
+        self.tables = tables
+        self.general = general
+        self.epoch = epoch
+        self.loaded_at = loaded_at
+
+    def has(self, table_name, permission):
+        return bool(self.tables.get(table_name, 0) & PERMISSION_BITS.get(permission, 0))
+
+    def has_general(self, permission):
+        return bool(self.general & GENERAL_PERMISSION_BITS.get(permission, 0))
+
+    def table_names(self, permission='view'):
+        bit = PERMISSION_BITS[permission]
+        return [name for name, mask in self.tables.items() if mask & bit]
+
+
+class PermissionCache:
+    """Epocas de invalidacao das permissoes no processo."""
+
+    def __init__(self, check_interval=PERMISSION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._global_epoch = 0
+        self._user_epochs = {}
+        self._subscribed = False
+
+    def _subscribe(self):
+        if not self._subscribed:
+            self._subscribed = True
+            for table in PERMISSION_TABLES:
+                invalidation_bus.subscribe(self._on_change, table=table)
+        invalidation_bus.start()
+
+    def _on_change(self, event):
+        # Em users a chave e o id; nas tabelas de permissao, o user_id
+        if event.keys is None:
+            self.invalidate()
+        else:
+            self.invalidate(event.keys)
+
+    def invalidate(self, user_ids=None):
+        """Invalida os snapshots dos usuarios informados (todos se None)."""
+        with self._lock:
+            if user_ids is None:
+                self._global_epoch += 1
+                self._user_epochs.clear()
+            else:
+                for user_id in user_ids:
+                    self._user_epochs[user_id] = self._user_epochs.get(user_id, 0) + 1
+
+    def _epoch(self, user_id):
+        return (self._global_epoch, self._user_epochs.get(user_id, 0))
+
+    def is_current(self, snapshot):
+        if snapshot.epoch != self._epoch(snapshot.user_id):
+            return False
+        if not invalidation_bus.is_listening():
+            return time.monotonic() - snapshot.loaded_at < self.check_interval
+        return True
+
+    def load(self, cursor, username):
+        """Carrega o snapshot do usuario (uma unica consulta)."""
+        self._subscribe()
+        # Epoca lida antes da consulta: um evento concorrente invalida o snapshot
+        with self._lock:
+            global_epoch = self._global_epoch
+            user_epochs = dict(self._user_epochs)
+        cursor.execute(SNAPSHOT_SQL, (username,))
+        row = cursor.fetchone()
+        if row is None:
+            return PermissionSnapshot(username, None, {}, 0, (global_epoch, 0), time.monotonic())
+        user_id = row['user_id']
+        return PermissionSnapshot(
+            username, user_id, dict(row['tables']), row['general'],
+            (global_epoch, user_epochs.get(user_id, 0)), time.monotonic()
+        )
+
+
+# Instancia global do cache de permissoes
+permission_cache = PermissionCache()
@@ -0,0 +1,210 @@
+"""
+Contagem de linhas das tabelas dinamicas sem varrer a tabela a cada chamada
+
+Modos:
+    exact       COUNT(*) (varre a tabela; varias tabelas em uma unica consulta)
+    estimate    estimativa do planejador (pg_class.reltuples ajustada pelo
+                tamanho atual da tabela, ou n_live_tup de pg_stat_user_tables)
+    maintained  contador em table_row_counts, mantido por triggers de
+                instrucao instaladas na criacao da tabela (tabelas antigas:
+                scripts/backfill_row_counts.py); tabelas sem contador sao
+                contadas com COUNT(*)
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+COUNT_MODES = ('exact', 'estimate', 'maintained')
+
+ROW_COUNT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS table_row_counts (
+    table_name VARCHAR(100) PRIMARY KEY,
+    row_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION maintain_table_row_count()
+RETURNS TRIGGER AS $$
+DECLARE
+    delta BIGINT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT COUNT(*) INTO delta FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT -COUNT(*) INTO delta FROM old_rows;
+    ELSE
+        -- TRUNCATE
+        UPDATE table_row_counts SET row_count = 0, updated_at = CURRENT_TIMESTAMP
+        WHERE table_name = TG_TABLE_NAME;
+        RETURN NULL;
+    END IF;
+
+    IF delta <> 0 THEN
+        UPDATE table_row_counts SET row_count = row_count + delta, updated_at = CURRENT_TIMESTAMP
+        WHERE table_name = TG_TABLE_NAME;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def validate_count_mode(mode):
+    """Normaliza o modo de contagem. ValueError se for desconhecido."""
+    mode = (mode or 'exact').lower()
+    if mode not in COUNT_MODES:
+        raise ValueError(f"Modo de contagem invalido: {mode}. Use: {', '.join(COUNT_MODES)}")
+    return mode
+
+
+def ensure_row_count_schema(cursor):
+    """Cria a tabela de contadores e a funcao de trigger (idempotente)."""
+    cursor.execute(ROW_COUNT_SCHEMA)
+
+
+def install_row_count_triggers(cursor, table_name):
+    """Instala as triggers de contagem na tabela e inicializa o contador.
+
+    As triggers sao por instrucao (com tabelas de transicao), entao um
+    INSERT ou COPY de um milhao de linhas atualiza o contador uma unica vez.
+    A tabela fica bloqueada para escrita ate o fim da transacao para que a
+    contagem inicial nao perca alteracoes concorrentes. Retorna a contagem
+    inicial.
+    """
+    ensure_row_count_schema(cursor)
+    cursor.execute(f"LOCK TABLE {table_name} IN SHARE ROW EXCLUSIVE MODE")
+
+    cursor.execute(f"DROP TRIGGER IF EXISTS {table_name}_row_count_insert ON {table_name}")
+    cursor.execute(f"DROP TRIGGER IF EXISTS {table_name}_row_count_delete ON {table_name}")
+    cursor.execute(f"DROP TRIGGER IF EXISTS {table_name}_row_count_truncate ON {table_name}")
+    cursor.execute(f"""
+        CREATE TRIGGER {table_name}_row_count_insert
+        AFTER INSERT ON {table_name}
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION maintain_table_row_count()
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {table_name}_row_count_delete
+        AFTER DELETE ON {table_name}
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION maintain_table_row_count()
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {table_name}_row_count_truncate
+        AFTER TRUNCATE ON {table_name}
+        FOR EACH STATEMENT EXECUTE FUNCTION maintain_table_row_count()
+    """)
+
+    cursor.execute(f"""
+        INSERT INTO table_row_counts (table_name, row_count)
+        SELECT %s, COUNT(*) FROM {table_name}
+        ON CONFLICT (table_name) DO UPDATE
+        SET row_count = EXCLUDED.row_count, updated_at = CURRENT_TIMESTAMP
+        RETURNING row_count
+    """, (table_name,))
+    return cursor.fetchone()['row_count']
+
+
+def tables_without_row_count(cursor, table_names):
+    """Tabelas da lista que existem e ainda nao tem contador ou as triggers."""
+    ensure_row_count_schema(cursor)
+    cursor.execute("""
+        SELECT c.relname AS table_name
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind = 'r' AND c.relname = ANY(%s)
+          AND (
+              NOT EXISTS (SELECT 1 FROM table_row_counts r WHERE r.table_name = c.relname)
+              OR (
+                  SELECT COUNT(*) FROM pg_trigger t
+                  WHERE t.tgrelid = c.oid AND t.tgname IN (
+                      c.relname || '_row_count_insert',
+                      c.relname || '_row_count_delete',
+                      c.relname || '_row_count_truncate'
+                  )
+              ) < 3
+          )
+        ORDER BY c.relname
+    """, (list(table_names),))
+    return [row['table_name'] for row in cursor.fetchall()]
+
+
+def drop_row_count(cursor, table_name):
+    """Remove o contador de uma tabela excluida."""
+    cursor.execute("SELECT to_regclass('public.table_row_counts') IS NOT NULL AS installed")
+    if cursor.fetchone()['installed']:
+        cursor.execute("DELETE FROM table_row_counts WHERE table_name = %s", (table_name,))
+
+
+def _exact_counts(cursor, table_names):
+    if not table_names:
+        return {}
+    # Uma unica ida ao banco para todas as tabelas
+    parts = [f"SELECT %s AS table_name, COUNT(*) AS row_count FROM {name}" for name in table_names]
+    cursor.execute(" UNION ALL ".join(parts), list(table_names))
+    return {row['table_name']: row['row_count'] for row in cursor.fetchall()}
+
+
+# Estimativa do planejador para pg_class "c" e pg_stat_user_tables "s":
+# densidade (reltuples/relpages) do ultimo ANALYZE/VACUUM vezes o tamanho atual
+ESTIMATED_ROWS_SQL = """
+    CASE
+        WHEN c.reltuples >= 0 AND c.relpages > 0 THEN
+            (c.reltuples / c.relpages
+             * (pg_relation_size(c.oid) / current_setting('block_size')::int))::bigint
+        WHEN c.reltuples >= 0 THEN c.reltuples::bigint
+        ELSE s.n_live_tup
+    END
+"""
+
+
+def _estimated_counts(cursor, table_names):
+    cursor.execute(f"""
+        SELECT c.relname AS table_name, {ESTIMATED_ROWS_SQL} AS row_count
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+        WHERE n.nspname = 'public' AND c.relkind = 'r' AND c.relname = ANY(%s)
+    """, (list(table_names),))
+    return {row['table_name']: row['row_count'] for row in cursor.fetchall()}
+
+
+def _maintained_counts(cursor, table_names):
+    cursor.execute("SELECT to_regclass('public.table_row_counts') IS NOT NULL AS installed")
+    if not cursor.fetchone()['installed']:
+        return {}
+    cursor.execute(
+        "SELECT table_name, row_count FROM table_row_counts WHERE table_name = ANY(%s)",
+        (list(table_names),)
+    )
+    return {row['table_name']: row['row_count'] for row in cursor.fetchall()}
+
+
+def get_row_counts(cursor, table_names, mode='exact'):
+    """Contagem de linhas de varias tabelas: dict nome -> quantidade.
+
+    No modo maintained, tabelas sem contador (criadas antes das triggers)
+    sao contadas com COUNT(*); no modo estimate, tabelas sem estatisticas
+    ficam com None.
+    """
+    table_names = list(table_names)
+    mode = validate_count_mode(mode)
+    if not table_names:
+        return {}
+
+    if mode == 'exact':
+        counts = _exact_counts(cursor, table_names)
+    elif mode == 'estimate':
+        counts = _estimated_counts(cursor, table_names)
+    else:
+        counts = _maintained_counts(cursor, table_names)
+        missing = [name for name in table_names if name not in counts]
+        counts.update(_exact_counts(cursor, missing))
+
+    return {name: counts.get(name) for name in table_names}
+
+
+def get_row_count(cursor, table_name, mode='exact'):
+    """Contagem de linhas de uma tabela."""
+    return get_row_counts(cursor, [table_name], mode)[table_name]
@@ -0,0 +1,96 @@
+"""
+Hash do registro inteiro (coluna row_hash) para deteccao de duplicados
+
+row_hash e o md5 (como uuid) do JSON dos campos da linha, sem id e sem as
+colunas internas, com os NULLs removidos: incluir uma coluna nova (NULL
+nas linhas antigas) nao altera o hash das linhas existentes. E mantido por
+uma trigger BEFORE INSERT OR UPDATE (conversoes de data para texto nao sao
+IMMUTABLE, o que impede uma coluna GENERATED) e indexado (btree), de modo
+que a verificacao de duplicados vira uma busca no indice e a contagem de
+duplicados um GROUP BY em uma unica coluna estreita.
+"""
+
+ROW_HASH_COLUMN = 'row_hash'
+
+# tsvector da busca textual (database.text_search)
+SEARCH_VECTOR_COLUMN = 'search_vector'
+
+# Colunas mantidas pelo sistema: fora das telas, exportacoes, schema e sincronizacao
+INTERNAL_COLUMNS = (ROW_HASH_COLUMN, SEARCH_VECTOR_COLUMN)
+
+
+def row_hash_sql(row_alias):
+    """Expressao SQL do hash para a linha `row_alias` (NEW, alias de tabela...).
+
+    A staging do BulkIngest tem exatamente as colunas dos campos, com os
+    mesmos nomes e tipos, entao o hash calculado sobre ela e igual ao da
+    tabela de destino.
+    """
+    excluded = ','.join(('id',) + INTERNAL_COLUMNS)
+    return f"md5(jsonb_strip_nulls(to_jsonb({row_alias}) - '{{{excluded}}}'::text[])::text)::uuid"
+
+
+ROW_HASH_SCHEMA = f"""
+CREATE OR REPLACE FUNCTION compute_row_hash()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.{ROW_HASH_COLUMN} := {row_hash_sql('NEW')};
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def public_row(row):
+    """Copia do registro sem as colunas internas (para consultas com SELECT *)."""
+    return {key: value for key, value in dict(row).items() if key not in INTERNAL_COLUMNS}
+
+
+def has_row_hash(cursor, table_name):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s AND column_name = %s
+    """, (table_name, ROW_HASH_COLUMN))
+    return cursor.fetchone() is not None
+
+
+def install_row_hash(cursor, table_name):
+    """Cria (ou completa) a coluna row_hash, a trigger e o indice da tabela.
+
+    Em tabelas existentes calcula o hash das linhas ja gravadas; a tabela
+    fica bloqueada para escrita ate o fim da transacao.
+    """
+    cursor.execute(ROW_HASH_SCHEMA)
+    cursor.execute(f"LOCK TABLE {table_name} IN SHARE ROW EXCLUSIVE MODE")
+    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {ROW_HASH_COLUMN} UUID")
+    cursor.execute(f"DROP TRIGGER IF EXISTS {table_name}_row_hash ON {table_name}")
+    cursor.execute(f"""
+        CREATE TRIGGER {table_name}_row_hash
+        BEFORE INSERT OR UPDATE ON {table_name}
+        FOR EACH ROW EXECUTE FUNCTION compute_row_hash()
+    """)
+    cursor.execute(f"""
+        UPDATE {table_name} t SET {ROW_HASH_COLUMN} = {row_hash_sql('t')}
+        WHERE {ROW_HASH_COLUMN} IS NULL
+    """)
+    backfilled = cursor.rowcount
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS {table_name}_row_hash ON {table_name} ({ROW_HASH_COLUMN})"
+    )
+    return backfilled
+
+
+def tables_without_row_hash(cursor, table_names):
+    """Tabelas da lista que existem e ainda nao tem a coluna row_hash."""
+    cursor.execute("""
+        SELECT c.relname AS table_name
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind = 'r' AND c.relname = ANY(%s)
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_attribute a
+              WHERE a.attrelid = c.oid AND a.attname = %s AND NOT a.attisdropped
+          )
+        ORDER BY c.relname
+    """, (list(table_names), ROW_HASH_COLUMN))
+    return [row['table_name'] for row in cursor.fetchall()]
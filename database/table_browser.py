@@ -0,0 +1,360 @@
+"""
+Consultas paginadas e estatisticas das tabelas dinamicas, feitas no servidor
+"""
+
+import io
+import json
+import base64
+
+from database.bulk_ingest import to_int, to_float, to_date, to_bool
+from database.row_hash import INTERNAL_COLUMNS, ROW_HASH_COLUMN, has_row_hash
+from database.table_export import select_list, arrow_columns, arrow_batch
+
+DEFAULT_PAGE_SIZE = 100
+PAGE_SIZES = (50, 100, 250, 500)
+
+# Conversao dos valores de busca pelo tipo da coluna (data_type do
+# information_schema); os demais tipos sao enviados como texto
+_LOOKUP_CONVERTERS = {
+    'integer': to_int,
+    'real': to_float,
+    'date': to_date,
+    'boolean': to_bool,
+}
+
+
+def get_table_columns(cursor, table_name):
+    """Colunas da tabela na ordem de criacao: lista de (nome, tipo_sql).
+
+    As colunas internas (row_hash) ficam de fora.
+    """
+    cursor.execute("""
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s AND column_name <> ALL(%s)
+        ORDER BY ordinal_position
+    """, (table_name, list(INTERNAL_COLUMNS)))
+    return [(row['column_name'], row['data_type']) for row in cursor.fetchall()]
+
+
+def project_columns(columns, fields, table_meta=None, required=()):
+    """Colunas de `columns` pedidas no parametro fields, na ordem da tabela.
+
+    `fields` e uma lista separada por virgula de nomes de campo (como em
+    tables_metadata) ou de coluna; vazio retorna `columns`. As colunas de
+    `required` sao sempre incluidas. ValueError se algum campo nao existir.
+    """
+    names = [name.strip() for name in (fields or '').split(',') if name.strip()]
+    if not names:
+        return columns
+    aliases = {field['name']: field.column for field in table_meta['fields']} if table_meta else {}
+    available = dict(columns)
+    wanted = set(required)
+    unknown = []
+    for name in names:
+        column = aliases.get(name, name)
+        if column in available:
+            wanted.add(column)
+        else:
+            unknown.append(name)
+    if unknown:
+        raise ValueError(f"Campo(s) inexistente(s) em fields: {', '.join(unknown)}")
+    return [(name, data_type) for name, data_type in columns if name in wanted]
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def build_filter(columns, search, column=None):
+    """Clausula WHERE (ILIKE, texto contido) e seus parametros.
+
+    Sem `column`, procura o termo em todas as colunas.
+    """
+    if not search:
+        return "", []
+    pattern = f"%{_escape_like(search)}%"
+    targets = [column] if column else list(columns)
+    conditions = [f"CAST({col} AS TEXT) ILIKE %s" for col in targets]
+    return f"WHERE ({' OR '.join(conditions)})", [pattern] * len(conditions)
+
+
+def count_rows(cursor, table_name, where="", params=None):
+    cursor.execute(f"SELECT COUNT(*) AS total FROM {table_name} {where}", params or [])
+    return cursor.fetchone()['total']
+
+
+def encode_cursor(sort_by, descending, row):
+    """Cursor opaco (base64 url-safe) apontando para depois da linha `row`."""
+    payload = {
+        's': sort_by,
+        'o': 'DESC' if descending else 'ASC',
+        'v': row.get(sort_by),
+        'id': row['id'],
+    }
+    data = json.dumps(payload, default=str, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort_by, descending):
+    """Retorna (valor, id) do cursor. ValueError se o cursor for invalido ou
+    tiver sido gerado para outra ordenacao."""
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(data)
+        value, last_id = payload['v'], int(payload['id'])
+        cursor_sort, cursor_order = payload['s'], payload['o']
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("cursor invalido")
+    if cursor_sort != sort_by or cursor_order != ('DESC' if descending else 'ASC'):
+        raise ValueError("cursor gerado para outra ordenacao (sort_by/sort_order)")
+    return value, last_id
+
+
+def keyset_condition(sort_by, sort_type, descending, after):
+    """Condicao SQL para as linhas depois de `after` = (valor, id).
+
+    A ordem e (sort_by, id) com NULLs no fim em ordem crescente e no inicio
+    em ordem decrescente (o padrao do PostgreSQL). O valor do cursor e
+    convertido para o tipo da coluna, para que a comparacao seja feita no
+    mesmo tipo (REAL nao e comparado como numeric).
+    """
+    value, last_id = after
+    if sort_by == 'id':
+        return f"id {'<' if descending else '>'} %s", [last_id]
+
+    operator = '<' if descending else '>'
+    if value is None:
+        if descending:
+            # NULLs vieram primeiro: restam os NULLs seguintes e todos os nao nulos
+            return f"(({sort_by} IS NULL AND id < %s) OR {sort_by} IS NOT NULL)", [last_id]
+        return f"({sort_by} IS NULL AND id > %s)", [last_id]
+
+    condition = f"({sort_by}, id) {operator} (CAST(%s AS {sort_type}), %s)"
+    if not descending:
+        condition = f"({condition} OR {sort_by} IS NULL)"
+    return condition, [value, last_id]
+
+
+def _page_query(columns, sort_by, descending, where, params, after, offset, page_size, rank):
+    """(WHERE ... ORDER BY ... LIMIT ..., parametros) de uma pagina com uma
+    linha a mais, que indica se ha proxima pagina (veja fetch_page)."""
+    direction = "DESC" if descending else "ASC"
+    params = list(params or [])
+
+    if rank is not None:
+        after = None
+
+    if after is not None:
+        sort_type = dict(columns).get(sort_by, 'text')
+        keyset, keyset_params = keyset_condition(sort_by, sort_type, descending, after)
+        where = f"{where} AND {keyset}" if where else f"WHERE {keyset}"
+        params.extend(keyset_params)
+
+    if rank is not None:
+        rank_sql, rank_params = rank
+        order_by = f"{rank_sql} DESC, id"
+        params.extend(rank_params)
+    elif sort_by == 'id':
+        order_by = f"id {direction}"
+    else:
+        nulls = "NULLS FIRST" if descending else "NULLS LAST"
+        order_by = f"{sort_by} {direction} {nulls}, id {direction}"
+
+    if after is not None or not offset:
+        paging = "LIMIT %s"
+        params.append(page_size + 1)
+    else:
+        paging = "LIMIT %s OFFSET %s"
+        params.extend([page_size + 1, offset])
+
+    return f"{where} ORDER BY {order_by} {paging}", params
+
+
+def fetch_page(cursor, table_name, columns, sort_by='id', descending=False, where="",
+               params=None, after=None, offset=0, page_size=DEFAULT_PAGE_SIZE, rank=None):
+    """Busca uma pagina de linhas ordenadas por (sort_by, id).
+
+    Com `after` = (valor, id) da ultima linha da pagina anterior a paginacao
+    e por chave (keyset): o custo de cada pagina nao depende da sua
+    posicao, porque o banco nao percorre as linhas anteriores (ordenando por
+    id, usa direto o indice da chave primaria). Sem `after`, usa `offset`.
+
+    Com `rank` = (sql, params), a ordem e pela relevancia (maior primeiro)
+    e id, com paginacao por offset (sort_by e after sao ignorados).
+
+    `columns` e a lista de (nome, tipo_sql) de get_table_columns.
+    Retorna (linhas, ha_proxima_pagina).
+    """
+    column_list = ', '.join(name for name, _ in columns)
+    tail, params = _page_query(columns, sort_by, descending, where, params, after, offset, page_size, rank)
+    cursor.execute(f"SELECT {column_list} FROM {table_name} {tail}", params)
+    rows = cursor.fetchall()
+    return rows[:page_size], len(rows) > page_size
+
+
+def fetch_page_json(cursor, table_name, columns, sort_by='id', descending=False, where="",
+                    params=None, after=None, offset=0, page_size=DEFAULT_PAGE_SIZE, rank=None):
+    """Como fetch_page, mas o JSON de cada linha e gerado pelo PostgreSQL
+    (row_to_json) e a pagina volta como texto, sem passar por dicts Python.
+
+    Retorna (array_json, ha_proxima_pagina, ultima_linha), em que
+    ultima_linha tem apenas id e sort_by (para o cursor) ou e None.
+    """
+    column_list = ', '.join(f"{table_name}.{name}" for name, _ in columns)
+    tail, params = _page_query(columns, sort_by, descending, where, params, after, offset, page_size, rank)
+    sort_column = f", {sort_by}" if sort_by != 'id' else ""
+    cursor.execute(
+        f"SELECT (SELECT row_to_json(r) FROM (SELECT {column_list}) r)::text AS row_json, id{sort_column} "
+        f"FROM {table_name} {tail}",
+        params
+    )
+    rows = cursor.fetchall()
+    page = rows[:page_size]
+    last = {key: value for key, value in page[-1].items() if key != 'row_json'} if page else None
+    return f"[{','.join(row['row_json'] for row in page)}]", len(rows) > page_size, last
+
+
+def fetch_page_arrow(conn, table_name, columns, sort_by='id', descending=False, where="",
+                     params=None, after=None, offset=0, page_size=DEFAULT_PAGE_SIZE, rank=None):
+    """Como fetch_page, mas a pagina volta como pyarrow.RecordBatch, montado
+    coluna a coluna das tuplas de um cursor simples em `conn` (sem dicts).
+
+    Retorna (lote, ha_proxima_pagina, ultima_linha) como fetch_page_json.
+    """
+    select, schema = arrow_columns(columns)
+    tail, params = _page_query(columns, sort_by, descending, where, params, after, offset, page_size, rank)
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT {select} FROM {table_name} {tail}", params)
+        rows = cursor.fetchall()
+    page = rows[:page_size]
+    names = [name for name, _ in columns]
+    last = None
+    if page:
+        last = {name: page[-1][names.index(name)] for name in {'id', sort_by} if name in names}
+    return arrow_batch(page, schema), len(rows) > page_size, last
+
+
+def lookup_text(value):
+    """Forma textual de um valor de busca, enviada ao banco e usada como chave
+    da resposta (booleanos JSON viram true/false, como no PostgreSQL)."""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def convert_lookup_value(data_type, value):
+    """Valor de busca convertido para o tipo Python da coluna `data_type`.
+
+    ValueError/TypeError se o valor nao couber no tipo (inclusive booleanos
+    em colunas numericas e textos vazios fora de colunas de texto).
+    """
+    converter = _LOOKUP_CONVERTERS.get(data_type)
+    if converter is None:
+        return value
+    if isinstance(value, bool) and data_type != 'boolean':
+        raise ValueError(f"valor {value} nao e do tipo {data_type}")
+    result = converter(value)
+    if result is None:
+        raise ValueError(f"valor vazio para o tipo {data_type}")
+    return result
+
+
+def fetch_by_keys(cursor, table_name, columns, key_column, values):
+    """Linhas cuja coluna `key_column` esta em `values`, em uma unica consulta
+    (juncao com os valores, que usa o indice da coluna quando existe).
+
+    Os valores sao convertidos em Python para o tipo da coluna e comparados
+    no banco nesse tipo (10.0 encontra o REAL 10); valores que nao cabem no
+    tipo ficam fora da consulta (e da resposta). Retorna dict
+    lookup_text(valor pedido) -> lista de linhas (ordem por id).
+    """
+    key_type = dict(columns)[key_column]
+    keys = {}
+    for value in values:
+        if value is None:
+            continue
+        try:
+            keys.setdefault(lookup_text(value), lookup_text(convert_lookup_value(key_type, value)))
+        except (TypeError, ValueError):
+            continue
+    if not keys:
+        return {}
+    column_list = ', '.join(f"t.{name}" for name, _ in columns)
+    cursor.execute(
+        f"SELECT k.requested AS lookup_key, {column_list} "
+        f"FROM unnest(CAST(%s AS text[]), CAST(%s AS text[])) AS k(requested, value) "
+        f"JOIN {table_name} t ON t.{key_column} = CAST(k.value AS {key_type}) "
+        f"ORDER BY t.id",
+        (list(keys), list(keys.values()))
+    )
+    found = {}
+    for row in cursor.fetchall():
+        row = dict(row)
+        found.setdefault(row.pop('lookup_key'), []).append(row)
+    return found
+
+
+def count_duplicates(cursor, table_name, data_columns):
+    """Linhas repetidas considerando todas as colunas exceto id (como
+    DataFrame.duplicated: a primeira ocorrencia nao conta).
+
+    Com a coluna row_hash o agrupamento e feito so por ela.
+    """
+    if not data_columns:
+        return 0
+    group_by = ROW_HASH_COLUMN if has_row_hash(cursor, table_name) else ', '.join(data_columns)
+    cursor.execute(f"""
+        SELECT COALESCE(SUM(occurrences - 1), 0) AS duplicates
+        FROM (
+            SELECT COUNT(*) AS occurrences
+            FROM {table_name}
+            GROUP BY {group_by}
+            HAVING COUNT(*) > 1
+        ) groups
+    """)
+    return int(cursor.fetchone()['duplicates'])
+
+
+def column_quality(cursor, table_name, columns):
+    """Valores unicos e nulos por coluna, em uma unica varredura da tabela.
+
+    `columns` e a lista de (nome, tipo_sql) de get_table_columns.
+    """
+    if not columns:
+        return []
+    aggregates = []
+    for i, (name, _) in enumerate(columns):
+        aggregates.append(f"COUNT(DISTINCT {name}) AS u{i}")
+        aggregates.append(f"COUNT(*) - COUNT({name}) AS n{i}")
+    cursor.execute(f"SELECT {', '.join(aggregates)} FROM {table_name}")
+    row = cursor.fetchone()
+    return [
+        {
+            'Coluna': name,
+            'Tipo': data_type,
+            'Valores únicos': row[f"u{i}"],
+            'Valores nulos': row[f"n{i}"],
+        }
+        for i, (name, data_type) in enumerate(columns)
+    ]
+
+
+def export_csv(cursor, table_name, columns, sort_by='id', descending=False, where="", params=None,
+               output=None):
+    """Exporta as linhas (com o mesmo filtro e ordem da tela) em CSV via COPY.
+
+    Booleanos saem como true/false, que a carga em lote aceita de volta. Com
+    `output` (objeto com write()), o CSV e gravado nele e nada e retornado.
+    """
+    direction = "DESC" if descending else "ASC"
+    order_by = f"{sort_by} {direction}" if sort_by == 'id' else f"{sort_by} {direction}, id {direction}"
+    query = cursor.mogrify(
+        f"SELECT {select_list(columns, booleans_as_text=True)} FROM {table_name} {where} ORDER BY {order_by}",
+        params or []
+    ).decode('utf-8')
+
+    buffer = output if output is not None else io.BytesIO()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", buffer)
+    if output is None:
+        return buffer.getvalue()
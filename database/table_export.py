@@ -0,0 +1,297 @@
+"""
+Exportacao em streaming das tabelas dinamicas (COPY ... TO STDOUT)
+"""
+
+import queue
+import logging
+import tempfile
+import threading
+
+from database.db_config import db_pool
+
+logger = logging.getLogger(__name__)
+
+# Tamanho aproximado de cada bloco entregue ao cliente
+EXPORT_CHUNK_SIZE = 1 << 16
+
+# Blocos em memoria entre o COPY e o cliente (limita a memoria por exportacao)
+EXPORT_QUEUE_SIZE = 8
+
+# Linhas buscadas por vez no cursor do servidor (Excel)
+EXCEL_FETCH_SIZE = 5000
+
+# Linhas por lote (RecordBatch / row group) nas exportacoes Arrow e Parquet
+ARROW_BATCH_SIZE = 50000
+
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+PARQUET_MIMETYPE = 'application/vnd.apache.parquet'
+
+_DONE = object()
+
+
+def select_list(columns, booleans_as_text=False):
+    """Lista de colunas para o SELECT da exportacao.
+
+    `columns` e a lista de (nome, tipo_sql) de table_browser.get_table_columns.
+    Com booleans_as_text, booleanos saem como true/false (aceitos de volta
+    pela carga em lote) em vez de t/f.
+    """
+    return ', '.join(
+        f"{name}::text AS {name}" if booleans_as_text and data_type == 'boolean' else name
+        for name, data_type in columns
+    )
+
+
+def csv_copy_sql(table_name, columns):
+    return (
+        f"COPY (SELECT {select_list(columns, booleans_as_text=True)} FROM {table_name} ORDER BY id) "
+        f"TO STDOUT WITH (FORMAT csv, HEADER true)"
+    )
+
+
+def ndjson_copy_sql(table_name, columns):
+    # row_to_json ja escapa aspas, barras e quebras de linha; o formato csv com
+    # QUOTE/DELIMITER que nunca aparecem no JSON evita o escape extra do COPY
+    return (
+        f"COPY (SELECT row_to_json(t) FROM (SELECT {select_list(columns)} FROM {table_name} ORDER BY id) t) "
+        f"TO STDOUT WITH (FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02')"
+    )
+
+
+class CopyExport:
+    """Executa um COPY ... TO STDOUT em uma thread, com conexao propria do
+    pool, e entrega os bytes em blocos por uma fila limitada.
+
+    O COPY so avanca conforme o cliente consome os blocos, entao a memoria
+    fica limitada a EXPORT_QUEUE_SIZE blocos qualquer que seja o tamanho da
+    tabela. Uso::
+
+        export = CopyExport(sql)
+        export.open()          # erros de SQL aparecem aqui, antes da resposta
+        return Response(export.iter_chunks(), mimetype='text/csv')
+    """
+
+    def __init__(self, sql, chunk_size=EXPORT_CHUNK_SIZE, queue_size=EXPORT_QUEUE_SIZE):
+        self.sql = sql
+        self.chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._buffer = []
+        self._buffered = 0
+        self._flushed = False
+        self._cancelled = False
+        self._finished = False
+        self._lock = threading.Lock()
+        self._conn = None
+        self._thread = None
+        self._first = None
+
+    # Lado do COPY (thread de exportacao) ---------------------------------
+
+    def write(self, data):
+        """Chamado pelo psycopg2 a cada linha recebida do servidor."""
+        if self._cancelled:
+            raise IOError("exportacao cancelada pelo cliente")
+        self._buffer.append(data)
+        self._buffered += len(data)
+        # O primeiro bloco sai imediatamente para o cliente receber o inicio do arquivo
+        if self._buffered >= self.chunk_size or not self._flushed:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._queue.put(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+            self._flushed = True
+
+    def _run(self):
+        try:
+            with self._conn.cursor() as cursor:
+                cursor.copy_expert(self.sql, self, size=self.chunk_size)
+            self._flush()
+        except Exception as e:
+            if not self._cancelled:
+                logger.error(f"Erro na exportacao: {e}")
+            self._queue.put(e)
+        finally:
+            # Marcado antes de devolver a conexao: depois do putconn ela pode
+            # estar com outra requisicao e close() nao deve cancela-la
+            with self._lock:
+                self._finished = True
+            self._queue.put(_DONE)
+            db_pool.putconn(self._conn)
+
+    # Lado da resposta HTTP ---------------------------------------------
+
+    def open(self):
+        """Inicia o COPY e espera o primeiro bloco (ou o erro)."""
+        self._conn = db_pool.getconn()
+        try:
+            self._conn.set_session(readonly=True)
+        except Exception:
+            db_pool.putconn(self._conn)
+            raise
+        self._thread = threading.Thread(target=self._run, name="copy-export", daemon=True)
+        self._thread.start()
+
+        self._first = self._queue.get()
+        if isinstance(self._first, Exception):
+            self._queue.get()  # _DONE
+            raise self._first
+        return self
+
+    def iter_chunks(self):
+        """Gerador dos blocos para a resposta; cancela o COPY se o cliente desconectar."""
+        item = self._first
+        try:
+            while item is not _DONE:
+                if isinstance(item, Exception):
+                    # Cabecalhos ja enviados: so resta interromper a resposta
+                    raise item
+                yield item
+                item = self._queue.get()
+        finally:
+            if item is not _DONE:
+                self.close()
+
+    def close(self):
+        """Interrompe o COPY em andamento e espera a thread devolver a conexao.
+
+        Tambem e chamado ao fim de um download completo; nesse caso o COPY ja
+        terminou e so resta esperar a thread.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+        with self._lock:
+            self._cancelled = True
+            if not self._finished:
+                try:
+                    self._conn.cancel()
+                except Exception:
+                    pass
+        # Esvaziar a fila libera a thread se ela estiver bloqueada no put();
+        # a fila pode ja estar vazia (_DONE consumido), entao nunca bloqueia
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
+
+
+def iter_json_array(chunks, prefix=b'{"success": true, "data": [', suffix=b']}'):
+    """Converte blocos NDJSON (cada bloco termina em fim de linha) em um
+    documento JSON com a lista de registros, sem juntar tudo em memoria."""
+    yield prefix
+    separator = b''
+    for chunk in chunks:
+        yield separator + chunk[:-1].replace(b'\n', b',')
+        separator = b','
+    yield suffix
+
+
+def write_excel(conn, table_name, columns, sheet_name=None):
+    """Gera o .xlsx em um arquivo temporario usando o modo write-only do
+    openpyxl e um cursor do servidor, sem carregar a tabela em memoria.
+
+    Retorna o arquivo temporario posicionado no inicio.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=(sheet_name or table_name)[:31])
+    sheet.append([name for name, _ in columns])
+
+    with conn.cursor(name=f"excel_export_{table_name}") as cursor:
+        cursor.itersize = EXCEL_FETCH_SIZE
+        cursor.execute(f"SELECT {select_list(columns)} FROM {table_name} ORDER BY id")
+        for row in cursor:
+            sheet.append(row)
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def arrow_columns(columns):
+    """(lista do SELECT, schema pyarrow) das colunas.
+
+    `columns` e a lista de (nome, tipo_sql) de table_browser.get_table_columns.
+    Tipos sem equivalente direto no Arrow saem como texto.
+    """
+    import pyarrow as pa
+
+    types = {
+        'smallint': pa.int16(),
+        'integer': pa.int32(),
+        'bigint': pa.int64(),
+        'real': pa.float32(),
+        'double precision': pa.float64(),
+        'boolean': pa.bool_(),
+        'date': pa.date32(),
+        'timestamp without time zone': pa.timestamp('us'),
+        'timestamp with time zone': pa.timestamp('us', tz='UTC'),
+        'text': pa.string(),
+        'character varying': pa.string(),
+        'character': pa.string(),
+    }
+    select = []
+    fields = []
+    for name, data_type in columns:
+        select.append(name if data_type in types else f"{name}::text AS {name}")
+        fields.append(pa.field(name, types.get(data_type, pa.string())))
+    return ', '.join(select), pa.schema(fields)
+
+
+def arrow_batch(rows, schema):
+    """RecordBatch montado coluna a coluna a partir das tuplas do cursor."""
+    import pyarrow as pa
+
+    values = list(zip(*rows)) if rows else [()] * len(schema)
+    return pa.record_batch(
+        [pa.array(column, type=field.type) for column, field in zip(values, schema)],
+        schema=schema
+    )
+
+
+def arrow_stream_bytes(batch):
+    """Bytes de um stream Arrow IPC com um unico lote."""
+    import pyarrow as pa
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def write_arrow(conn, table_name, columns, file_format='arrow'):
+    """Gera um stream Arrow IPC (file_format='arrow') ou um arquivo Parquet
+    em arquivo temporario, com um cursor do servidor e ARROW_BATCH_SIZE
+    linhas por lote, sem carregar a tabela em memoria.
+
+    Retorna o arquivo temporario posicionado no inicio.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    select, schema = arrow_columns(columns)
+    output = tempfile.TemporaryFile()
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(output, schema)
+    else:
+        writer = pa.ipc.new_stream(output, schema)
+
+    try:
+        with conn.cursor(name=f"arrow_export_{table_name}") as cursor:
+            cursor.execute(f"SELECT {select} FROM {table_name} ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(ARROW_BATCH_SIZE)
+                if not rows:
+                    break
+                writer.write_table(pa.Table.from_batches([arrow_batch(rows, schema)]))
+    finally:
+        writer.close()
+
+    output.seek(0)
+    return output
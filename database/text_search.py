@@ -0,0 +1,170 @@
+"""
+Busca textual indexada das tabelas dinamicas (tables_metadata.search_config)
+
+Por tabela, o administrador pode ativar:
+
+    trigram   indices GIN pg_trgm em campos de texto: ILIKE '%termo%' e
+              'termo%' passam a usar o indice em vez de varrer a tabela
+    fulltext  uma coluna interna search_vector (tsvector GENERATED STORED
+              com os campos escolhidos) e um indice GIN
+
+search_config = {"trigram": [campos], "fulltext": [campos], "language": "portuguese"}
+
+Modos de busca (parametro search_mode da API):
+
+    contains  o termo em qualquer ponto de um campo de texto (ILIKE)
+    prefix    campos de texto que comecam com o termo (ILIKE 'termo%')
+    fulltext  palavras (websearch_to_tsquery: "frase", -excluir, or)
+    auto      contains se todos os campos de texto tem indice trigram,
+              senao fulltext se a tabela tem search_vector, senao contains
+
+A relevancia (sort_by=relevance) usa ts_rank na busca fulltext e
+word_similarity (pg_trgm) nas demais.
+"""
+
+import json
+
+from database.metadata_registry import sanitize_identifier, parse_search_config
+from database.row_hash import SEARCH_VECTOR_COLUMN
+
+SEARCH_MODES = ('auto', 'contains', 'prefix', 'fulltext')
+
+TEXT_TYPES = ('character varying', 'text', 'character')
+
+RELEVANCE = 'relevance'
+
+
+def validate_search_mode(mode):
+    """Normaliza o modo de busca. ValueError se for desconhecido."""
+    mode = (mode or 'auto').lower()
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"search_mode invalido: {mode}. Use: {', '.join(SEARCH_MODES)}")
+    return mode
+
+
+def trigram_index(table_name, column):
+    return f"{table_name}_{column}_trgm"
+
+
+def search_vector_index(table_name):
+    return f"{table_name}_{SEARCH_VECTOR_COLUMN}"
+
+
+def _vector_sql(columns, language):
+    document = " || ' ' || ".join(f"coalesce({col}, '')" for col in columns)
+    return f"to_tsvector('{language}'::regconfig, {document})"
+
+
+# ---------------------------------------------------------------------------
+# Indices
+# ---------------------------------------------------------------------------
+
+def install_trigram_indexes(cursor, table_name, columns):
+    """Cria os indices trigram de `columns` e remove os das demais colunas."""
+    if columns:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cursor.execute("""
+        SELECT indexname FROM pg_indexes
+        WHERE schemaname = 'public' AND tablename = %s AND indexname LIKE %s
+    """, (table_name, f"{table_name}\\_%\\_trgm"))
+    wanted = {trigram_index(table_name, col) for col in columns}
+    for row in cursor.fetchall():
+        if row['indexname'] not in wanted:
+            cursor.execute(f"DROP INDEX IF EXISTS {row['indexname']}")
+    for col in columns:
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {trigram_index(table_name, col)} "
+            f"ON {table_name} USING gin ({col} gin_trgm_ops)"
+        )
+
+
+def install_search_vector(cursor, table_name, columns, language):
+    """(Re)cria a coluna search_vector com `columns` e seu indice GIN; sem
+    colunas, apenas remove. Adicionar a coluna reescreve a tabela."""
+    cursor.execute(f"ALTER TABLE {table_name} DROP COLUMN IF EXISTS {SEARCH_VECTOR_COLUMN}")
+    if not columns:
+        return
+    cursor.execute(f"""
+        ALTER TABLE {table_name}
+        ADD COLUMN {SEARCH_VECTOR_COLUMN} tsvector
+        GENERATED ALWAYS AS ({_vector_sql(columns, language)}) STORED
+    """)
+    cursor.execute(
+        f"CREATE INDEX {search_vector_index(table_name)} ON {table_name} USING gin ({SEARCH_VECTOR_COLUMN})"
+    )
+
+
+def set_search_config(cursor, table_meta, trigram_fields, fulltext_fields):
+    """Aplica os indices de busca da tabela e grava search_config.
+
+    ValueError se algum campo nao existir ou nao for de texto.
+    """
+    table_name = table_meta['name']
+    text_fields = {field['name'] for field in table_meta['fields'] if field['type'] == 'text'}
+    invalid = [name for name in (*trigram_fields, *fulltext_fields) if name not in text_fields]
+    if invalid:
+        raise ValueError(f"Campo(s) inexistente(s) ou que nao sao de texto: {', '.join(invalid)}")
+
+    current = parse_search_config(table_meta.get('search_config'))
+    language = current['language']
+    install_trigram_indexes(cursor, table_name, [sanitize_identifier(name) for name in trigram_fields])
+    if tuple(fulltext_fields) != current['fulltext']:
+        install_search_vector(cursor, table_name, [sanitize_identifier(name) for name in fulltext_fields], language)
+
+    config = {'trigram': list(trigram_fields), 'fulltext': list(fulltext_fields), 'language': language}
+    cursor.execute(
+        "UPDATE tables_metadata SET search_config = %s, updated_at = NOW() WHERE table_name = %s",
+        (json.dumps(config) if trigram_fields or fulltext_fields else None, table_name)
+    )
+
+
+# ---------------------------------------------------------------------------
+# Consulta
+# ---------------------------------------------------------------------------
+
+def resolve_search_mode(mode, config, text_columns):
+    """Modo efetivo de `mode` para a tabela (auto escolhe o caminho indexado)."""
+    if mode != 'auto':
+        return mode
+    trigram = {sanitize_identifier(name) for name in config['trigram']}
+    if text_columns and set(text_columns) <= trigram:
+        return 'contains'
+    if config['fulltext']:
+        return 'fulltext'
+    return 'contains'
+
+
+def build_search(columns, search, mode, config):
+    """Filtro e relevancia da busca.
+
+    `columns` e a lista de (nome, tipo_sql) de get_table_columns e `mode`
+    um modo ja resolvido (resolve_search_mode). Retorna
+    (where, params, (relevancia_sql, relevancia_params)); where vazio se a
+    tabela nao tiver colunas de texto.
+    """
+    text_columns = [name for name, data_type in columns if data_type in TEXT_TYPES]
+    if not text_columns:
+        return "", [], None
+
+    if mode == 'fulltext':
+        query = f"websearch_to_tsquery('{config['language']}'::regconfig, %s)"
+        if config['fulltext']:
+            vector = SEARCH_VECTOR_COLUMN
+        else:
+            # Sem search_vector: mesma busca, calculada linha a linha
+            vector = _vector_sql(text_columns, config['language'])
+        return f"WHERE {vector} @@ {query}", [search], (f"ts_rank({vector}, {query})", [search])
+
+    pattern = f"{search}%" if mode == 'prefix' else f"%{search}%"
+    conditions = [f"{col} ILIKE %s" for col in text_columns]
+    if config['trigram']:
+        rank = f"GREATEST({', '.join(f'word_similarity(%s, {col})' for col in text_columns)})"
+        rank_params = [search] * len(text_columns)
+    else:
+        # Sem pg_trgm: campos que comecam com o termo valem mais
+        rank = ' + '.join(
+            f"(CASE WHEN {col} ILIKE %s THEN 2 WHEN {col} ILIKE %s THEN 1 ELSE 0 END)"
+            for col in text_columns
+        )
+        rank_params = [f"{search}%", f"%{search}%"] * len(text_columns)
+    return f"WHERE ({' OR '.join(conditions)})", [pattern] * len(text_columns), (rank, rank_params)
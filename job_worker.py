@@ -0,0 +1,48 @@
+"""
+Worker das tarefas em segundo plano (database/jobs.py)
+
+Inicia JOB_WORKERS processos (padrao 2), cada um retirando tarefas da fila
+com FOR UPDATE SKIP LOCKED; processos que terminarem sao reiniciados.
+
+Uso:
+    python job_worker.py [processos]
+"""
+
+import os
+import sys
+import time
+import logging
+import multiprocessing
+
+from database.jobs import run_worker
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+
+
+def start_worker(number):
+    process = multiprocessing.Process(target=run_worker, name=f"job-worker-{number}", daemon=True)
+    process.start()
+    return process
+
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else JOB_WORKERS
+
+    print("⚙️ Worker de tarefas iniciando...")
+    print(f"   Processos: {workers}")
+
+    # spawn: cada processo abre suas proprias conexoes e threads
+    multiprocessing.set_start_method('spawn')
+    processes = [start_worker(number) for number in range(workers)]
+    try:
+        while True:
+            time.sleep(5)
+            for number, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.warning(f"{process.name} terminou (codigo {process.exitcode}); reiniciando")
+                    processes[number] = start_worker(number)
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
@@ -0,0 +1,44 @@
+"""
+Instala o contador de linhas (count=maintained) nas tabelas dinamicas
+criadas antes dele.
+
+Para cada tabela de tables_metadata sem contador em table_row_counts ou sem
+as triggers de contagem: instala as triggers e grava a contagem atual.
+Cada tabela e processada em sua propria transacao (a tabela fica bloqueada
+para escrita enquanto e contada).
+
+Uso:
+    python scripts/backfill_row_counts.py [tabela ...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_config import get_db_cursor  # noqa: E402
+from database.row_counts import install_row_count_triggers, tables_without_row_count  # noqa: E402
+
+
+def main():
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT table_name FROM tables_metadata ORDER BY table_name")
+        names = [row['table_name'] for row in cursor.fetchall()]
+        if len(sys.argv) > 1:
+            names = [name for name in names if name in sys.argv[1:]]
+        pending = tables_without_row_count(cursor, names)
+
+    if not pending:
+        print("Todas as tabelas ja tem o contador de linhas")
+        return
+
+    for table_name in pending:
+        start = time.perf_counter()
+        with get_db_cursor() as cursor:
+            row_count = install_row_count_triggers(cursor, table_name)
+        print(f"{table_name}: {row_count} linhas em {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
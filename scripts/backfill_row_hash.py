@@ -0,0 +1,43 @@
+"""
+Cria a coluna row_hash nas tabelas dinamicas criadas antes dela.
+
+Para cada tabela de tables_metadata ainda sem a coluna: adiciona row_hash,
+a trigger que a mantem e o indice, e calcula o hash das linhas existentes.
+Cada tabela e processada em sua propria transacao (a tabela fica bloqueada
+para escrita enquanto isso).
+
+Uso:
+    python scripts/backfill_row_hash.py [tabela ...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_config import get_db_cursor  # noqa: E402
+from database.row_hash import install_row_hash, tables_without_row_hash  # noqa: E402
+
+
+def main():
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT table_name FROM tables_metadata ORDER BY table_name")
+        names = [row['table_name'] for row in cursor.fetchall()]
+        if len(sys.argv) > 1:
+            names = [name for name in names if name in sys.argv[1:]]
+        pending = tables_without_row_hash(cursor, names)
+
+    if not pending:
+        print("Todas as tabelas ja tem a coluna row_hash")
+        return
+
+    for table_name in pending:
+        start = time.perf_counter()
+        with get_db_cursor() as cursor:
+            backfilled = install_row_hash(cursor, table_name)
+        print(f"{table_name}: {backfilled} linhas em {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
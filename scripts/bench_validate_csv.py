@@ -0,0 +1,179 @@
+"""
+Benchmark da validacao de CSV da "Carga em lote".
+
+Compara a validacao vetorizada (database/csv_import.validate_csv_data) com a
+implementacao original linha a linha (df.iterrows) e confere que ambas geram
+as mesmas mensagens de erro e os mesmos registros.
+
+Uso:
+    python scripts/bench_validate_csv.py [linhas] [--skip-legacy]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.csv_import import validate_csv_data  # noqa: E402
+
+TABLE_META = {
+    'fields': [
+        {'name': 'codigo', 'type': 'int'},
+        {'name': 'descricao', 'type': 'text'},
+        {'name': 'valor', 'type': 'float'},
+        {'name': 'ativo', 'type': 'bool'},
+        {'name': 'vigencia', 'type': 'date'},
+    ]
+}
+
+
+def legacy_validate_csv_data(df: pd.DataFrame, table_meta: dict) -> tuple:
+    """Implementacao original (linha a linha), mantida apenas para comparacao."""
+    errors = []
+    validated_records = []
+
+    required_columns = {field['name'] for field in table_meta['fields']}
+    csv_columns = set(df.columns)
+    missing_columns = required_columns - csv_columns
+    extra_columns = csv_columns - required_columns
+    if missing_columns:
+        errors.append(f"Colunas faltando: {', '.join(missing_columns)}")
+    if extra_columns:
+        errors.append(f"Colunas extras (serao ignoradas): {', '.join(extra_columns)}")
+
+    for index, row in df.iterrows():
+        row_errors = []
+        validated_record = {}
+        for field in table_meta['fields']:
+            field_name = field['name']
+            value = row.get(field_name)
+            if field['type'] == 'int':
+                try:
+                    if pd.isna(value) or value == '':
+                        validated_record[field_name] = None
+                    else:
+                        validated_record[field_name] = int(value)
+                except (ValueError, TypeError):
+                    row_errors.append(f"Campo '{field_name}' deve ser um numero inteiro")
+            elif field['type'] == 'float':
+                try:
+                    if pd.isna(value) or value == '':
+                        validated_record[field_name] = None
+                    else:
+                        validated_record[field_name] = float(value)
+                except (ValueError, TypeError):
+                    row_errors.append(f"Campo '{field_name}' deve ser um numero decimal")
+            elif field['type'] == 'bool':
+                if pd.isna(value) or value == '':
+                    validated_record[field_name] = None
+                else:
+                    validated_record[field_name] = str(value).lower() in ['true', '1', 'sim', 'yes']
+            elif field['type'] == 'date':
+                if pd.isna(value) or value == '':
+                    validated_record[field_name] = None
+                else:
+                    try:
+                        date_str = str(value).strip()
+                        if '/' in date_str:
+                            parts = date_str.split('/')
+                            if len(parts) == 3:
+                                day, month, year = parts
+                                if len(day) <= 2 and len(month) <= 2 and len(year) == 4:
+                                    validated_record[field_name] = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+                                else:
+                                    validated_record[field_name] = date_str
+                            else:
+                                validated_record[field_name] = date_str
+                        elif '-' in date_str and len(date_str.split('-')) == 3:
+                            parts = date_str.split('-')
+                            if len(parts[0]) == 4:
+                                validated_record[field_name] = date_str
+                            else:
+                                day, month, year = parts
+                                validated_record[field_name] = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+                        else:
+                            parsed_date = pd.to_datetime(date_str)
+                            validated_record[field_name] = parsed_date.strftime('%Y-%m-%d')
+                    except:  # noqa: E722
+                        row_errors.append(f"Campo '{field_name}' deve ser uma data válida (formato: YYYY-MM-DD, DD/MM/YYYY)")
+            else:
+                validated_record[field_name] = str(value) if not pd.isna(value) else None
+
+        if row_errors:
+            errors.append(f"Linha {index + 1}: {'; '.join(row_errors)}")
+        else:
+            validated_records.append(validated_record)
+
+    return len(errors) == 0, errors, validated_records
+
+
+def make_dataframe(rows: int) -> pd.DataFrame:
+    """Gera um DataFrame como o lido de um CSV real (colunas de texto com erros esparsos)."""
+    rng = np.random.default_rng(42)
+    codigo = rng.integers(1, 1_000_000, rows).astype(str).astype(object)
+    valor = np.round(rng.random(rows) * 1000, 2).astype(str).astype(object)
+    ativo = rng.choice(['True', 'False', 'sim', '0', ''], rows).astype(object)
+    days = rng.integers(1, 28, rows)
+    months = rng.integers(1, 12, rows)
+    formats = rng.integers(0, 3, rows)
+    vigencia = np.where(
+        formats == 0,
+        pd.Series(days).astype(str).str.zfill(2) + '/' + pd.Series(months).astype(str).str.zfill(2) + '/2024',
+        np.where(
+            formats == 1,
+            '2024-' + pd.Series(months).astype(str).str.zfill(2) + '-' + pd.Series(days).astype(str).str.zfill(2),
+            pd.Series(days).astype(str) + '-' + pd.Series(months).astype(str) + '-2023',
+        ),
+    ).astype(object)
+    descricao = np.char.add('Item ', np.arange(rows).astype(str)).astype(object)
+
+    # Alguns valores invalidos e vazios espalhados pelo arquivo
+    bad = rng.choice(rows, max(rows // 1000, 1), replace=False)
+    codigo[bad[::3]] = 'abc'
+    valor[bad[1::3]] = '12,5'
+    vigencia[bad[2::3]] = 'ontem'
+    codigo[rng.choice(rows, max(rows // 500, 1), replace=False)] = np.nan
+
+    return pd.DataFrame({
+        'codigo': codigo,
+        'descricao': descricao,
+        'valor': valor,
+        'ativo': ativo,
+        'vigencia': vigencia,
+    })
+
+
+def main() -> None:
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    rows = int(args[0]) if args else 1_000_000
+    skip_legacy = '--skip-legacy' in sys.argv
+
+    df = make_dataframe(rows)
+    print(f"Linhas: {rows:,}")
+
+    start = time.perf_counter()
+    result = validate_csv_data(df, TABLE_META)
+    vectorized = time.perf_counter() - start
+    print(f"Vetorizado: {vectorized:8.2f}s  ({len(result[1])} erros, {len(result[2]):,} registros)")
+
+    if skip_legacy:
+        return
+
+    start = time.perf_counter()
+    expected = legacy_validate_csv_data(df, TABLE_META)
+    legacy = time.perf_counter() - start
+    print(f"Original:   {legacy:8.2f}s")
+    print(f"Ganho:      {legacy / vectorized:8.1f}x")
+
+    if result != expected:
+        print("ERRO: resultados diferentes da implementacao original")
+        sys.exit(1)
+    print("Resultados identicos a implementacao original")
+
+
+if __name__ == "__main__":
+    main()
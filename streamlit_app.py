@@ -2,14 +2,29 @@ import streamlit as st
 import os
 import json
 import hashlib
+import shutil
+import time
 import pandas as pd
 from datetime import datetime
 import io
 import base64
 from PIL import Image
 import psycopg2
-from database.db_config import get_db_connection, get_db_cursor, db_config
+from database.db_config import get_db_connection, get_db_cursor, db_config, db_pool
 from database.grants_manager import grants_manager
+from database.csv_import import validate_rows, scan_csv
+from database.invalidation_bus import invalidation_bus, install_change_triggers, publish_change
+from database.jobs import create_job, get_job, job_dir, job_file
+from database.metadata_registry import metadata_registry, sanitize_identifier
+from database.natural_key import key_columns, create_natural_key_index, set_natural_key
+from database.permission_cache import permission_cache
+from database.row_counts import install_row_count_triggers, drop_row_count, get_row_count
+from database.row_hash import INTERNAL_COLUMNS, install_row_hash, public_row
+from database.text_search import set_search_config
+from database.table_browser import (
+    DEFAULT_PAGE_SIZE, PAGE_SIZES, get_table_columns, build_filter, count_rows,
+    fetch_page, count_duplicates, column_quality
+)
 
 
 # Paths for configuration and data.  The app writes all of its state into
@@ -159,11 +174,9 @@ def apply_auto_permissions_for_existing_tables(username: str) -> None:
             user_id = user_row['id']
             
             # Obter todas as tabelas ativas
-            cursor.execute("SELECT table_name FROM tables_metadata WHERE status = 'ativo'")
-            tables = cursor.fetchall()
+            tables = metadata_registry.table_names()
             
-            for table in tables:
-                table_name = table['table_name']
+            for table_name in tables:
                 
                 # Aplicar permissões automáticas: visualizar, inserir, editar
                 cursor.execute("""
@@ -179,6 +192,9 @@ def apply_auto_permissions_for_existing_tables(username: str) -> None:
                 """, (user_id, table_name, True, True, True, False))  # can_delete = False por padrão
             
             print(f"✅ Permissões automáticas aplicadas para {username} em {len(tables)} tabelas existentes")
+        
+        # Sessões deste processo veem a alteração sem esperar o NOTIFY
+        permission_cache.invalidate([user_id])
             
     except Exception as e:
         print(f"❌ Erro ao aplicar permissões automáticas para {username} nas tabelas existentes: {e}")
@@ -214,6 +230,9 @@ def apply_auto_permissions_for_table_creator(username: str, table_name: str) ->
             """, (user_id, table_name, True, True, True, False))  # can_delete = False por padrão
             
             print(f"✅ Permissões automáticas aplicadas para {username} na tabela {table_name}")
+        
+        # O criador vê a tabela já no próximo rerun, sem esperar o NOTIFY
+        permission_cache.invalidate([user_id])
             
     except Exception as e:
         print(f"❌ Erro ao aplicar permissões automáticas para {username}: {e}")
@@ -263,6 +282,8 @@ def toggle_table_status(table_name: str, new_status: str) -> dict:
             updated_table = cursor.fetchone()
             if updated_table and updated_table['status'] != new_status:
                 raise Exception(f"Falha: Status da tabela '{table_name}' não foi atualizado corretamente")
+        
+        metadata_registry.invalidate()
                 
     except Exception as e:
         error_msg = f"Erro ao alterar status da tabela {table_name}: {e}"
@@ -274,95 +295,24 @@ def toggle_table_status(table_name: str, new_status: str) -> dict:
     return results
 
 
+def set_table_hot_cache(table_name: str, enabled: bool) -> None:
+    """Ativa ou desativa o cache em memória da tabela na API (hot_cache)."""
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            "UPDATE tables_metadata SET hot_cache = %s, updated_at = NOW() WHERE table_name = %s",
+            (enabled, table_name)
+        )
+    metadata_registry.invalidate()
+
+
 def load_tables_metadata(include_inactive: bool = False) -> list:
-    """Load the table definitions from the database."""
+    """Load the table definitions from the shared metadata registry.
+
+    The registry keeps the parsed definitions cached in the process and
+    reloads them only when tables_metadata changes.
+    """
     try:
-        with get_db_cursor() as cursor:
-            if include_inactive:
-                # Carregar todas as tabelas (ativas e inativas) - para administradores
-                cursor.execute("""
-                    SELECT id, table_name, display_name, description, columns, status, created_at, updated_at
-                    FROM tables_metadata
-                    ORDER BY created_at
-                """)
-            else:
-                # Carregar apenas tabelas ativas - para usuarios normais
-                cursor.execute("""
-                    SELECT id, table_name, display_name, description, columns, status, created_at, updated_at
-                    FROM tables_metadata
-                    WHERE status = 'ativo'
-                    ORDER BY created_at
-                """)
-            
-            metadata = []
-            for row in cursor.fetchall():
-                table_id = row['id']
-                table_name = row['table_name']
-                display_name = row['display_name']
-                description = row['description']
-                columns = row['columns']
-                status = row['status']
-                created_at = row['created_at']
-                updated_at = row['updated_at']
-                
-                # Converter JSONB para lista de campos
-                fields = []
-                if columns:
-                    # PostgreSQL JSONB já vem como dict/list, não precisa fazer parse
-                    if isinstance(columns, list):
-                        # Processar lista de campos
-                        for field in columns:
-                            if isinstance(field, dict):
-                                fields.append({
-                                    'name': field.get('name', ''),
-                                    'type': field.get('type', 'text')
-                                })
-                            else:
-                                print(f"Campo invalido na tabela {table_name}: {field} (tipo: {type(field)})")
-                    elif isinstance(columns, dict):
-                        # Se for dict único, converter para lista
-                        fields.append({
-                            'name': columns.get('name', ''),
-                            'type': columns.get('type', 'text')
-                        })
-                    elif isinstance(columns, str):
-                        # Se for string, tentar fazer parse do JSON
-                        try:
-                            columns_parsed = json.loads(columns)
-                            if isinstance(columns_parsed, list):
-                                for field in columns_parsed:
-                                    if isinstance(field, dict):
-                                        fields.append({
-                                            'name': field.get('name', ''),
-                                            'type': field.get('type', 'text')
-                                        })
-                            elif isinstance(columns_parsed, dict):
-                                fields.append({
-                                    'name': columns_parsed.get('name', ''),
-                                    'type': columns_parsed.get('type', 'text')
-                                })
-                        except json.JSONDecodeError as e:
-                            print(f"Erro ao fazer parse JSON da tabela {table_name}: {e}")
-                            # Se falhar no parse, pular esta tabela mas continuar
-                            continue
-                    else:
-                        print(f"Formato invalido de campos na tabela {table_name}. Esperado: list/dict, Recebido: {type(columns)}")
-                else:
-                    print(f"Tabela {table_name} nao tem campos definidos")
-                
-                metadata.append({
-                    'id': table_id,
-                    'name': table_name,
-                    'display_name': display_name or table_name,
-                    'description': description,
-                    'fields': fields,
-                    'status': status,
-                    'created_at': created_at.isoformat() if created_at else None,
-                    'updated_at': updated_at.isoformat() if updated_at else None
-                })
-            
-            return metadata
-            
+        return list(metadata_registry.list_tables(include_inactive))
     except Exception as e:
         print(f"Erro ao carregar metadados do banco: {e}")
         import traceback
@@ -371,40 +321,9 @@ def load_tables_metadata(include_inactive: bool = False) -> list:
 
 
 def refresh_table_metadata(table_name: str) -> dict:
-    """Recarrega os metadados de uma tabela específica do banco."""
+    """Retorna os metadados atuais de uma tabela específica (via registro)."""
     try:
-        with get_db_cursor() as cursor:
-            cursor.execute("""
-                SELECT id, table_name, display_name, description, columns, created_at, updated_at
-                FROM tables_metadata
-                WHERE table_name = %s
-            """, (table_name,))
-            
-            row = cursor.fetchone()
-            if not row:
-                return None
-                
-            # Converter JSONB para lista de campos
-            fields = []
-            columns = row['columns']
-            if columns and isinstance(columns, list):
-                for field in columns:
-                    if isinstance(field, dict):
-                        fields.append({
-                            'name': field.get('name', ''),
-                            'type': field.get('type', 'text')
-                        })
-            
-            return {
-                'id': row['id'],
-                'name': row['table_name'],
-                'display_name': row['display_name'] or row['table_name'],
-                'description': row['description'],
-                'fields': fields,
-                'created_at': row['created_at'].isoformat() if row['created_at'] else None,
-                'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None
-            }
-            
+        return metadata_registry.get_table(table_name)
     except Exception as e:
         print(f"Erro ao recarregar metadados da tabela {table_name}: {e}")
         return None
@@ -418,20 +337,19 @@ def sync_table_structure_with_metadata(table_name: str) -> bool:
             cursor.execute("""
                 SELECT column_name, data_type 
                 FROM information_schema.columns 
-                WHERE table_name = %s AND column_name != 'id'
+                WHERE table_name = %s AND column_name <> ALL(%s)
                 ORDER BY ordinal_position
-            """, (table_name,))
+            """, (table_name, ['id', *INTERNAL_COLUMNS]))
             
             real_columns = cursor.fetchall()
             
             # Buscar metadados atuais
-            cursor.execute("SELECT columns FROM tables_metadata WHERE table_name = %s", (table_name,))
-            result = cursor.fetchone()
+            table_schema = metadata_registry.get_table(table_name)
             
-            if not result:
+            if not table_schema:
                 return False
                 
-            current_fields = result['columns'] or []
+            current_fields = [dict(f) for f in table_schema['fields']]
             current_field_names = [f['name'] for f in current_fields]
             
             # Mapear tipos de dados
@@ -472,9 +390,10 @@ def sync_table_structure_with_metadata(table_name: str) -> bool:
                     WHERE table_name = %s
                 """, (json.dumps(current_fields), table_name))
                 print(f"Metadados da tabela {table_name} sincronizados com sucesso")
-                return True
-                
-            return False
+        
+        if updated:
+            metadata_registry.invalidate()
+        return updated
             
     except Exception as e:
         print(f"Erro ao sincronizar estrutura da tabela {table_name}: {e}")
@@ -508,7 +427,8 @@ def save_tables_metadata(metadata: list) -> None:
                     table_meta.get('updated_at')
                 ))
             
-            st.success("Metadados salvos no banco com sucesso!")
+        metadata_registry.invalidate()
+        st.success("Metadados salvos no banco com sucesso!")
             
     except Exception as e:
         st.error(f"Erro ao salvar metadados no banco: {e}")
@@ -559,56 +479,14 @@ def get_db_connection():
     return pg_get_connection()
 
 
-def sanitize_identifier(name: str) -> str:
-    """
-    Convert a human‑supplied table or column name into a safe SQL identifier.
-    This replaces spaces with underscores, converts to lower case and removes
-    characters that are not alphanumeric or underscores.  The resulting
-    identifier should always be safe to use directly in SQL statements.
-    """
-    # Lista de palavras reservadas do PostgreSQL que podem causar conflitos
-    reserved_words = {
-        'check', 'order', 'group', 'select', 'from', 'where', 'having', 'limit', 'offset',
-        'insert', 'update', 'delete', 'create', 'alter', 'drop', 'table', 'index',
-        'constraint', 'primary', 'key', 'foreign', 'references', 'unique', 'not', 'null',
-        'default', 'auto_increment', 'serial', 'boolean', 'integer', 'text', 'varchar',
-        'char', 'date', 'time', 'timestamp', 'real', 'float', 'double', 'decimal',
-        'bigint', 'smallint', 'numeric', 'money', 'bytea', 'json', 'jsonb', 'array',
-        'enum', 'range', 'domain', 'type', 'view', 'function', 'procedure', 'trigger',
-        'sequence', 'schema', 'database', 'user', 'role', 'grant', 'revoke', 'privilege',
-        'cascade', 'restrict', 'on', 'in', 'exists', 'between', 'like', 'ilike', 'similar',
-        'to', 'as', 'is', 'and', 'or', 'case', 'when', 'then', 'else', 'end', 'if',
-        'for', 'while', 'loop', 'return', 'begin', 'commit', 'rollback', 'transaction',
-        'lock', 'unlock', 'vacuum', 'analyze', 'explain', 'with', 'recursive', 'union',
-        'intersect', 'except', 'all', 'distinct', 'asc', 'desc', 'nulls', 'first', 'last'
-    }
-    
-    name = name.strip().lower().replace(" ", "_")
-    allowed = []
-    for c in name:
-        if c.isalnum() or c == "_":
-            allowed.append(c)
-        else:
-            allowed.append("_")
-    # Ensure the identifier does not start with a number
-    sanitized = "".join(allowed)
-    if sanitized and sanitized[0].isdigit():
-        sanitized = f"_{sanitized}"
-    
-    # Se o identificador for uma palavra reservada, adicionar sufixo
-    if sanitized in reserved_words:
-        sanitized = f"{sanitized}_col"
-    
-    return sanitized
-
-
-def create_sql_table(table_name: str, fields: list) -> None:
+def create_sql_table(table_name: str, fields: list, natural_key: list = None) -> None:
     """Create a new table in the PostgreSQL database with the given fields.
 
     Each field in the list should be a dict with keys 'name' and 'type'
     where 'type' is one of 'text', 'int', 'float', 'date' or 'bool'.  A
     primary key column named "id" with auto incrementing integers is always
-    added automatically.
+    added automatically.  `natural_key` lists the field names that identify
+    a record; they get a unique index used to skip duplicates on import.
     """
     with get_db_cursor() as cursor:
         columns = ["id SERIAL PRIMARY KEY"]
@@ -625,6 +503,18 @@ def create_sql_table(table_name: str, fields: list) -> None:
             columns.append(f"{col_name} {sql_type}")
         sql = f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(columns)});"
         cursor.execute(sql)
+        
+        # Contador de linhas mantido por triggers (evita COUNT(*) nas listagens)
+        install_row_count_triggers(cursor, table_name)
+        # Avisa os outros processos (API/Streamlit) das alteracoes nos dados
+        install_change_triggers(cursor, table_name)
+        
+        # Hash do registro (duplicados por busca no índice)
+        install_row_hash(cursor, table_name)
+        
+        # Índice único da chave natural
+        if natural_key:
+            create_natural_key_index(cursor, table_name, key_columns(natural_key))
 
 
 def insert_record(table_name: str, fields: list, values: dict) -> None:
@@ -649,129 +539,6 @@ def insert_record(table_name: str, fields: list, values: dict) -> None:
         cursor.execute(sql, value_list)
 
 
-def insert_batch_records(table_name: str, fields: list, records: list) -> tuple:
-    """Insert multiple records into the specified table with duplicate checking using PostgreSQL.
-    
-    Returns a tuple (inserted_count, duplicate_count, errors)
-    """
-    inserted_count = 0
-    duplicate_count = 0
-    errors = []
-    
-    if not records:
-        return 0, 0, errors
-    
-    # Build column names
-    column_names = []
-    for field in fields:
-        fname = field['name']
-        sql_name = sanitize_identifier(fname)
-        column_names.append(sql_name)
-    
-    try:
-        with get_db_cursor() as cursor:
-            # Usar UPSERT do PostgreSQL para verificar duplicatas de forma eficiente
-            # Criar uma tabela temporária para os novos dados
-            temp_table = f"temp_import_{table_name}_{hash(str(records)) % 10000}"
-            
-            # Criar tabela temporária com a mesma estrutura
-            create_temp_sql = f"""
-                CREATE TEMP TABLE {temp_table} (
-                    {', '.join([f"{col} TEXT" for col in column_names])}
-                )
-            """
-            cursor.execute(create_temp_sql)
-            
-            # Inserir dados na tabela temporária
-            placeholders = ["%s"] * len(column_names)
-            insert_temp_sql = f"INSERT INTO {temp_table} ({', '.join(column_names)}) VALUES ({', '.join(placeholders)})"
-            
-            for i, record in enumerate(records):
-                try:
-                    # Prepare values for this record
-                    value_list = []
-                    for field in fields:
-                        fname = field['name']
-                        value = record.get(fname)
-                        
-                        # Convert data types
-                        if field['type'] == 'int':
-                            value = int(value) if value else None
-                        elif field['type'] == 'float':
-                            value = float(value) if value else None
-                        elif field['type'] == 'bool':
-                            value = True if value in ['True', 'true', '1', 1] else False
-                        
-                        # Converter para string para a tabela temporária
-                        value_list.append(str(value) if value is not None else None)
-                    
-                    cursor.execute(insert_temp_sql, value_list)
-                    
-                except Exception as e:
-                    errors.append(f"Erro na linha {i+1}: {e}")
-            
-            # Verificar duplicatas usando JOIN
-            # Construir condição de JOIN baseada nas colunas (excluindo ID)
-            # Com conversao de tipos para evitar erro real = text
-            join_conditions = []
-            for i, col in enumerate(column_names):
-                field = fields[i]
-                if field['type'] in ['int', 'float']:
-                    # Para campos numericos, converter temp para o tipo correto
-                    join_conditions.append(f"t.{col} = temp.{col}::{field['type']}")
-                elif field['type'] == 'date':
-                    # Para campos de data, converter temp para DATE
-                    join_conditions.append(f"t.{col} = temp.{col}::DATE")
-                else:
-                    # Para campos de texto, comparacao direta
-                    join_conditions.append(f"t.{col} = temp.{col}")
-            
-            # Contar duplicatas
-            count_duplicates_sql = f"""
-                SELECT COUNT(*) as duplicate_count
-                FROM {temp_table} temp
-                INNER JOIN {table_name} t ON {' AND '.join(join_conditions)}
-            """
-            cursor.execute(count_duplicates_sql)
-            duplicate_count = cursor.fetchone()['duplicate_count']
-            
-            # Inserir apenas registros não duplicados
-            # Construir SELECT com conversao de tipos para campos numericos e datas
-            select_columns = []
-            for i, col in enumerate(column_names):
-                field = fields[i]
-                if field['type'] in ['int', 'float']:
-                    # Converter campos numericos da tabela temporaria
-                    select_columns.append(f"temp.{col}::{field['type']} as {col}")
-                elif field['type'] == 'date':
-                    # Converter campos de data da tabela temporaria
-                    select_columns.append(f"temp.{col}::DATE as {col}")
-                else:
-                    # Campos de texto sem conversao
-                    select_columns.append(f"temp.{col}")
-            
-            insert_new_sql = f"""
-                INSERT INTO {table_name} ({', '.join(column_names)})
-                SELECT {', '.join(select_columns)}
-                FROM {temp_table} temp
-                WHERE NOT EXISTS (
-                    SELECT 1 FROM {table_name} t 
-                    WHERE {' AND '.join(join_conditions)}
-                )
-            """
-            cursor.execute(insert_new_sql)
-            inserted_count = cursor.rowcount
-            
-            # Limpar tabela temporária
-            cursor.execute(f"DROP TABLE {temp_table}")
-            
-    except Exception as e:
-        errors.append(f"Erro ao processar importação: {e}")
-        return 0, 0, errors
-    
-    return inserted_count, duplicate_count, errors
-
-
 def generate_template_csv(table_meta: dict) -> str:
     """Generate a CSV template for the given table."""
     # Create a DataFrame with column headers
@@ -810,104 +577,6 @@ def generate_template_csv(table_meta: dict) -> str:
     return df.to_csv(index=False, encoding='utf-8')
 
 
-def validate_csv_data(df: pd.DataFrame, table_meta: dict) -> tuple:
-    """Validate CSV data against table schema.
-    
-    Returns (is_valid, errors, validated_records)
-    """
-    errors = []
-    validated_records = []
-    
-    # Check if all required columns are present
-    required_columns = {field['name'] for field in table_meta['fields']}
-    csv_columns = set(df.columns)
-    
-    missing_columns = required_columns - csv_columns
-    extra_columns = csv_columns - required_columns
-    
-    if missing_columns:
-        errors.append(f"Colunas faltando: {', '.join(missing_columns)}")
-    
-    if extra_columns:
-        errors.append(f"Colunas extras (serao ignoradas): {', '.join(extra_columns)}")
-    
-    # Validate data types for each row
-    for index, row in df.iterrows():
-        row_errors = []
-        validated_record = {}
-        
-        for field in table_meta['fields']:
-            field_name = field['name']
-            value = row.get(field_name)
-            
-            # Validate data type
-            if field['type'] == 'int':
-                try:
-                    if pd.isna(value) or value == '':
-                        validated_record[field_name] = None
-                    else:
-                        validated_record[field_name] = int(value)
-                except (ValueError, TypeError):
-                    row_errors.append(f"Campo '{field_name}' deve ser um numero inteiro")
-            elif field['type'] == 'float':
-                try:
-                    if pd.isna(value) or value == '':
-                        validated_record[field_name] = None
-                    else:
-                        validated_record[field_name] = float(value)
-                except (ValueError, TypeError):
-                    row_errors.append(f"Campo '{field_name}' deve ser um numero decimal")
-            elif field['type'] == 'bool':
-                if pd.isna(value) or value == '':
-                    validated_record[field_name] = None
-                else:
-                    validated_record[field_name] = str(value).lower() in ['true', '1', 'sim', 'yes']
-            elif field['type'] == 'date':
-                if pd.isna(value) or value == '':
-                    validated_record[field_name] = None
-                else:
-                    try:
-                        # Tentar converter diferentes formatos de data
-                        date_str = str(value).strip()
-                        
-                        # Formatos aceitos: YYYY-MM-DD, DD/MM/YYYY, DD-MM-YYYY
-                        if '/' in date_str:
-                            # Formato DD/MM/YYYY ou MM/DD/YYYY
-                            parts = date_str.split('/')
-                            if len(parts) == 3:
-                                day, month, year = parts
-                                # Assumir formato DD/MM/YYYY (brasileiro)
-                                if len(day) <= 2 and len(month) <= 2 and len(year) == 4:
-                                    validated_record[field_name] = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-                                else:
-                                    validated_record[field_name] = date_str
-                            else:
-                                validated_record[field_name] = date_str
-                        elif '-' in date_str and len(date_str.split('-')) == 3:
-                            # Formato YYYY-MM-DD ou DD-MM-YYYY
-                            parts = date_str.split('-')
-                            if len(parts[0]) == 4:  # YYYY-MM-DD
-                                validated_record[field_name] = date_str
-                            else:  # DD-MM-YYYY
-                                day, month, year = parts
-                                validated_record[field_name] = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-                        else:
-                            # Tentar parse automático com pandas
-                            parsed_date = pd.to_datetime(date_str)
-                            validated_record[field_name] = parsed_date.strftime('%Y-%m-%d')
-                    except:
-                        row_errors.append(f"Campo '{field_name}' deve ser uma data válida (formato: YYYY-MM-DD, DD/MM/YYYY)")
-            else:  # text
-                validated_record[field_name] = str(value) if not pd.isna(value) else None
-        
-        if row_errors:
-            errors.append(f"Linha {index + 1}: {'; '.join(row_errors)}")
-        else:
-            validated_records.append(validated_record)
-    
-    return len(errors) == 0, errors, validated_records
-
-
 def update_record(table_name: str, record_id: int, values: dict) -> bool:
     """Atualiza um registro existente."""
     try:
@@ -938,6 +607,8 @@ def drop_table(table_name: str) -> None:
     """Drop the specified table from the database."""
     with get_db_cursor() as cursor:
         cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+        drop_row_count(cursor, table_name)
+        publish_change(cursor, table_name, 'DROP')
 
 
 def alter_table_add_column(table_name: str, field_def: dict) -> None:
@@ -1031,6 +702,13 @@ def page_create_table() -> None:
                 "Booleano": "bool",
             }[ftype]
             field_defs.append({"name": fname, "type": canonical_type})
+    natural_key = st.multiselect(
+        "Chave natural (opcional)",
+        options=[f["name"] for f in field_defs],
+        key="natural_key",
+        help="Campos que identificam um registro (ex.: código). Recebem um índice único e "
+             "registros com a mesma chave são ignorados na importação."
+    )
     if st.button("Criar tabela"):
         if not table_display_name:
             st.error("O nome da tabela é obrigatório.")
@@ -1050,7 +728,7 @@ def page_create_table() -> None:
             return
         # Save to database and metadata
         try:
-            create_sql_table(table_name, field_defs)
+            create_sql_table(table_name, field_defs, natural_key)
         except Exception as e:
             st.error(f"Erro ao criar a tabela: {e}")
             return
@@ -1067,15 +745,20 @@ def page_create_table() -> None:
             with get_db_cursor() as cursor:
                 columns_json = json.dumps(field_defs)
                 cursor.execute("""
-                    INSERT INTO tables_metadata (table_name, display_name, columns, status, created_at)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (table_name, table_display_name, columns_json, 'ativo', datetime.now()))
-                
-                # Aplicar permissões automáticas para o criador da tabela
-                apply_auto_permissions_for_table_creator(username, table_name)
-                
-                st.success("Tabela criada com sucesso!")
-                st.info("Permissões automáticas aplicadas: Visualizar, Inserir e Editar")
+                    INSERT INTO tables_metadata (table_name, display_name, columns, status, natural_key, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (
+                    table_name, table_display_name, columns_json, 'ativo',
+                    json.dumps(natural_key) if natural_key else None, datetime.now()
+                ))
+            
+            metadata_registry.invalidate()
+            
+            # Aplicar permissões automáticas para o criador da tabela
+            apply_auto_permissions_for_table_creator(username, table_name)
+            
+            st.success("Tabela criada com sucesso!")
+            st.info("Permissões automáticas aplicadas: Visualizar, Inserir e Editar")
         except Exception as e:
             st.error(f"Erro ao salvar metadados: {e}")
             return
@@ -1203,10 +886,93 @@ def page_manage_tables() -> None:
         manage_table_admin(selected_meta)
 
 
+JOB_ACTIVE_STATUSES = ('queued', 'running')
+
+
+@st.experimental_fragment(run_every=1)
+def job_progress(job_id: int, label: str) -> None:
+    """Progress bar of a running job.
+
+    Only this fragment reruns every second, so the rest of the page (counts,
+    data, quality stats) is not queried again while the job runs. When the
+    job finishes the whole page reruns once to show its result.
+    """
+    with get_db_cursor() as cursor:
+        job = get_job(cursor, job_id)
+    if job is None or job['status'] not in JOB_ACTIVE_STATUSES:
+        st.rerun()
+    
+    if job['status'] == 'queued':
+        text = f"{label}: aguardando o worker..."
+    else:
+        text = f"{label}: {job['message'] or 'em andamento...'}"
+    st.progress(job['progress'], text=text)
+    st.caption("A tarefa continua rodando mesmo se você sair desta página.")
+
+
+def wait_for_job(job_id: int, label: str):
+    """Show the progress of a background job.
+
+    Returns the job row (None if it no longer exists). While it is queued or
+    running a self-refreshing progress bar is shown (see job_progress) and
+    the caller should not render the result yet.
+    """
+    with get_db_cursor() as cursor:
+        job = get_job(cursor, job_id)
+    if job is not None and job['status'] in JOB_ACTIVE_STATUSES:
+        job_progress(job_id, label)
+    return job
+
+
+def show_import_job(job_key: str) -> None:
+    """Show the status and the result of the last CSV import job."""
+    job = wait_for_job(st.session_state[job_key], "Importando")
+    if job is None:
+        st.session_state.pop(job_key, None)
+        return
+    if job['status'] in JOB_ACTIVE_STATUSES:
+        return
+    
+    if job['status'] == 'failed':
+        st.error(f"Erro ao processar importação: {job['error']}")
+        st.warning("Nenhum registro foi salvo.")
+    else:
+        result = job['result']
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Registros importados", result['inserted'])
+        col2.metric("Duplicados ignorados", result['duplicates'])
+        col3.metric("Repetidos no arquivo", result['repeated'])
+        col4.metric("Total processados", result['rows'])
+        
+        if result['errors']:
+            st.error("**Erros durante a importação:**")
+            for error in result['errors']:
+                st.error(error)
+        
+        if result['inserted'] > 0:
+            st.success(f"✅ Importação concluída! {result['inserted']} registros adicionados.")
+        
+        if result['duplicates'] > 0:
+            st.warning(f"⚠️ {result['duplicates']} registros duplicados foram ignorados.")
+        
+        if result['repeated'] > 0:
+            st.warning(f"⚠️ {result['repeated']} linhas repetidas no próprio arquivo foram importadas uma única vez.")
+    
+    if st.button("Nova importação", key=f"{job_key}_clear"):
+        st.session_state.pop(job_key, None)
+        st.rerun()
+
+
 def batch_upload_form(table_meta: dict) -> None:
     """Display a form for batch upload of records via CSV."""
     st.subheader("Carga em lote via CSV")
     
+    # Importação em andamento (ou concluída) nesta sessão
+    job_key = f"import_job_{table_meta['name']}"
+    if st.session_state.get(job_key):
+        show_import_job(job_key)
+        return
+    
     # Mostrar guia de formatos de dados
     with st.expander("📋 Guia de Formatos de Dados", expanded=False):
         st.markdown("""
@@ -1255,23 +1021,44 @@ def batch_upload_form(table_meta: dict) -> None:
     
     if uploaded_file is not None:
         try:
-            # Read CSV file
-            df = pd.read_csv(uploaded_file, encoding='utf-8')
+            # Validar o arquivo em blocos; o resultado fica na sessao para que
+            # cliques nos controles abaixo nao releiam o arquivo inteiro
+            scan_key = f"csv_scan_{table_meta['name']}"
+            file_id = getattr(uploaded_file, 'file_id', None) or f"{uploaded_file.name}:{uploaded_file.size}"
+            cached_scan = st.session_state.get(scan_key)
+            
+            if cached_scan and cached_scan['file_id'] == file_id:
+                scan = cached_scan['tally']
+            else:
+                progress_bar = st.progress(0.0, text="Validando arquivo...")
+                
+                def show_scan_progress(tally: dict) -> None:
+                    progress_bar.progress(
+                        tally['progress'],
+                        text=f"Validando arquivo... {tally['rows']:,} linhas lidas, {tally['error_count']:,} com erro"
+                    )
+                
+                scan = scan_csv(uploaded_file, table_meta, size=uploaded_file.size, on_chunk=show_scan_progress)
+                progress_bar.empty()
+                st.session_state[scan_key] = {'file_id': file_id, 'tally': scan}
+            
+            if scan['preview'] is None:
+                st.warning("O arquivo CSV não contém registros.")
+                return
             
             # Show preview
             st.write("**Preview dos dados:**")
-            st.dataframe(df.head(10))
+            st.dataframe(scan['preview'])
             
-            # Validate data
-            is_valid, errors, validated_records = validate_csv_data(df, table_meta)
-            
-            if not is_valid:
+            if not scan['is_valid']:
                 st.error("**Erros encontrados:**")
-                for error in errors:
+                for error in scan['errors']:
                     st.error(error)
+                if scan['error_count'] > len(scan['errors']):
+                    st.error(f"... e mais {scan['error_count'] - len(scan['errors'])} erros.")
                 return
             
-            st.success(f"✅ Dados validados com sucesso! {len(validated_records)} registros prontos para importar.")
+            st.success(f"✅ Dados validados com sucesso! {scan['valid']} registros prontos para importar.")
             
             # Show import options
             st.write("**Passo 3: Configurar importação**")
@@ -1295,36 +1082,30 @@ def batch_upload_form(table_meta: dict) -> None:
             if st.button("Importar dados", type="primary"):
                 if preview_mode:
                     st.info("Modo preview ativado - dados não foram salvos")
-                    st.write("**Registros que seriam importados:**")
-                    preview_df = pd.DataFrame(validated_records)
+                    st.write("**Registros que seriam importados (primeiras linhas):**")
+                    _, preview_records = validate_rows(scan['preview'], table_meta)
+                    preview_df = pd.DataFrame(preview_records)
                     st.dataframe(preview_df)
                 else:
-                    # Perform actual import
-                    inserted_count, duplicate_count, errors = insert_batch_records(
-                        table_meta['name'], 
-                        table_meta['fields'], 
-                        validated_records
-                    )
-                    
-                    # Show results
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.metric("Registros importados", inserted_count)
-                    with col2:
-                        st.metric("Duplicados ignorados", duplicate_count)
-                    with col3:
-                        st.metric("Total processados", len(validated_records))
-                    
-                    if errors:
-                        st.error("**Erros durante a importação:**")
-                        for error in errors:
-                            st.error(error)
-                    
-                    if inserted_count > 0:
-                        st.success(f"✅ Importação concluída! {inserted_count} registros adicionados.")
+                    # Importação em segundo plano (job_worker.py): o arquivo vai
+                    # para a pasta da tarefa e a tela apenas acompanha o andamento
+                    try:
+                        with get_db_cursor() as cursor:
+                            job_id = create_job(
+                                cursor,
+                                'csv_import',
+                                {'table_name': table_meta['name']},
+                                created_by=st.session_state.get("username")
+                            )
+                            uploaded_file.seek(0)
+                            with open(os.path.join(job_dir(job_id, create=True), 'input.csv'), 'wb') as target:
+                                shutil.copyfileobj(uploaded_file, target)
+                    except Exception as e:
+                        st.error(f"Erro ao agendar importação: {e}")
+                        return
                     
-                    if duplicate_count > 0:
-                        st.warning(f"⚠️ {duplicate_count} registros duplicados foram ignorados.")
+                    st.session_state[job_key] = job_id
+                    st.rerun()
         
         except Exception as e:
             st.error(f"Erro ao processar arquivo: {e}")
@@ -1403,62 +1184,153 @@ def view_table_data(table_meta: dict) -> None:
         table_meta = refreshed_meta
     
     st.subheader("Visualizar dados")
+    table_name = table_meta['name']
+    
     try:
-        # Usar cursor para evitar problemas de compatibilidade com pandas
         with get_db_cursor() as cursor:
-            cursor.execute(f"SELECT * FROM {table_meta['name']}")
-            rows = cursor.fetchall()
+            columns = get_table_columns(cursor, table_name)
+        column_names = [name for name, _ in columns]
+        if not column_names:
+            st.warning("Tabela não encontrada no banco de dados.")
+            return
+        
+        # Ordenação, filtro e tamanho da página (aplicados no servidor)
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            sort_by = st.selectbox("Ordenar por", column_names, key=f"view_sort_{table_name}")
+        with col2:
+            sort_order = st.selectbox("Ordem", ["Crescente", "Decrescente"], key=f"view_order_{table_name}")
+        with col3:
+            page_size = st.selectbox(
+                "Linhas por página",
+                PAGE_SIZES,
+                index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE),
+                key=f"view_page_size_{table_name}"
+            )
+        
+        col1, col2 = st.columns([1, 2])
+        with col1:
+            filter_column = st.selectbox(
+                "Filtrar coluna",
+                ["Todas as colunas"] + column_names,
+                key=f"view_filter_column_{table_name}"
+            )
+        with col2:
+            search = st.text_input("Contém", key=f"view_search_{table_name}").strip()
+        
+        descending = sort_order == "Decrescente"
+        where, params = build_filter(
+            column_names,
+            search,
+            None if filter_column == "Todas as colunas" else filter_column
+        )
+        
+        # Paginação por chave: pilha com o início de cada página visitada
+        # ((valor, id) da última linha da página anterior); volta à primeira
+        # página se a consulta mudar
+        paging_key = f"view_paging_{table_name}"
+        query_key = (sort_by, descending, filter_column, search, page_size)
+        paging = st.session_state.get(paging_key)
+        if not paging or paging['query'] != query_key:
+            paging = {'query': query_key, 'pages': [None]}
+            st.session_state[paging_key] = paging
+        page_start = paging['pages'][-1]
+        
+        refresh_stats = st.button("🔄 Atualizar estatísticas", key=f"view_refresh_stats_{table_name}")
+        
+        with get_db_cursor() as cursor:
+            total = get_row_count(cursor, table_name, 'maintained')
+            filtered_total = count_rows(cursor, table_name, where, params) if where else total
+            rows, has_next = fetch_page(
+                cursor,
+                table_name,
+                columns,
+                sort_by=sort_by,
+                descending=descending,
+                where=where,
+                params=params,
+                after=page_start,
+                page_size=page_size
+            )
             
-            # Converter para DataFrame manualmente
-            if rows:
-                # Converter Row objects para dicionários
-                data = []
-                for row in rows:
-                    data.append(dict(row))
-                df = pd.DataFrame(data)
-            else:
-                df = pd.DataFrame()
+            # Estatísticas pesadas (agregações sobre a tabela inteira) ficam na
+            # sessão e são recalculadas quando a tabela muda (eventos do
+            # invalidation_bus) ou pelo botão "Atualizar estatísticas"
+            stats_key = f"view_stats_{table_name}"
+            version = (invalidation_bus.change_version(table_name), total, columns)
+            stats = st.session_state.get(stats_key)
+            if not stats or stats['version'] != version or refresh_stats:
+                data_cols = [name for name in column_names if name != 'id']
+                stats = {
+                    'version': version,
+                    'duplicates': count_duplicates(cursor, table_name, data_cols),
+                    'quality': column_quality(cursor, table_name, columns) if total > 0 else []
+                }
+                st.session_state[stats_key] = stats
         
         # Show statistics
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total de registros", len(df))
+            st.metric("Total de registros", total)
         with col2:
-            st.metric("Colunas", len(df.columns))
+            st.metric("Colunas", len(column_names))
         with col3:
-            if len(df) > 0:
-                # Check for potential duplicates (excluding ID)
-                data_cols = [col for col in df.columns if col != 'id']
-                if data_cols:
-                    duplicates = df.duplicated(subset=data_cols).sum()
-                    st.metric("Possíveis duplicados", duplicates)
-                else:
-                    st.metric("Possíveis duplicados", 0)
-            else:
-                st.metric("Possíveis duplicados", 0)
+            st.metric("Possíveis duplicados", stats['duplicates'])
         
         # Show data
         st.write("**Dados da tabela:**")
-        st.dataframe(df)
+        if where:
+            st.caption(f"{filtered_total} registros encontrados com o filtro")
+        st.dataframe(pd.DataFrame(rows, columns=column_names))
         
-        # Provide option to download as CSV
-        csv = df.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="Baixar CSV",
-            data=csv,
-            file_name=f"{table_meta['name']}.csv",
-            mime="text/csv"
-        )
+        page_number = len(paging['pages'])
+        last_page = max(1, -(-filtered_total // page_size))
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("⬅️ Anterior", disabled=page_number == 1, key=f"view_prev_{table_name}"):
+                paging['pages'].pop()
+                st.rerun()
+        with col2:
+            st.caption(f"Página {page_number} de {last_page}")
+        with col3:
+            if st.button("Próxima ➡️", disabled=not has_next, key=f"view_next_{table_name}"):
+                paging['pages'].append((rows[-1][sort_by], rows[-1]['id']))
+                st.rerun()
+        
+        # Exportação em segundo plano (job_worker.py), com o filtro e a ordem da tela
+        export_key = f"view_export_job_{table_name}"
+        if st.button("Gerar CSV", key=f"view_export_{table_name}"):
+            with get_db_cursor() as cursor:
+                st.session_state[export_key] = create_job(
+                    cursor,
+                    'csv_export',
+                    {
+                        'table_name': table_name,
+                        'sort_by': sort_by,
+                        'descending': descending,
+                        'search': search,
+                        'filter_column': None if filter_column == "Todas as colunas" else filter_column
+                    },
+                    created_by=username
+                )
+        if st.session_state.get(export_key):
+            job = wait_for_job(st.session_state[export_key], "Gerando CSV")
+            path = job_file(job) if job and job['status'] == 'done' else None
+            if job and job['status'] == 'failed':
+                st.error(f"Erro ao gerar CSV: {job['error']}")
+            elif path and os.path.exists(path):
+                with open(path, 'rb') as csv_file:
+                    st.download_button(
+                        label="Baixar CSV",
+                        data=csv_file,
+                        file_name=job['result_file'],
+                        mime="text/csv"
+                    )
         
         # Show data quality info
-        if len(df) > 0:
+        if stats['quality']:
             st.write("**Qualidade dos dados:**")
-            quality_df = pd.DataFrame({
-                'Coluna': df.columns,
-                'Tipo': df.dtypes,
-                'Valores únicos': [df[col].nunique() for col in df.columns],
-                'Valores nulos': df.isnull().sum().values
-            })
+            quality_df = pd.DataFrame(stats['quality'])
             st.dataframe(quality_df)
             
     except Exception as e:
@@ -1573,6 +1445,87 @@ def manage_table_admin(table_meta: dict) -> None:
         with col2:
             st.info("ℹ️ Tabela inativa - oculta dos usuários")
     
+    # Chave natural (índice único usado para ignorar duplicados)
+    st.markdown("---")
+    st.markdown("### 🔑 Chave natural")
+    current_key = list(table_meta.get('natural_key') or [])
+    new_key = st.multiselect(
+        "Campos que identificam um registro",
+        options=[field['name'] for field in table_meta['fields']],
+        default=current_key,
+        key=f"natural_key_{table_meta['name']}",
+        help="Os campos recebem um índice único; importações ignoram registros com a mesma chave. "
+             "Deixe vazio para comparar o registro inteiro."
+    )
+    if new_key != current_key and st.button("Salvar chave natural"):
+        try:
+            with get_db_cursor() as cursor:
+                set_natural_key(cursor, table_meta, new_key)
+            metadata_registry.invalidate()
+            st.success("✅ Chave natural atualizada!")
+            st.rerun()
+        except ValueError as e:
+            st.error(f"❌ {e}")
+        except Exception as e:
+            st.error(f"❌ Erro ao alterar a chave natural: {e}")
+    
+    # Cache em memória na API (tabelas de referência pequenas e muito lidas)
+    st.markdown("---")
+    st.markdown("### ⚡ Cache na API")
+    hot_cache_enabled = st.checkbox(
+        "Manter a tabela em memória na API",
+        value=bool(table_meta.get('hot_cache')),
+        key=f"hot_cache_{table_meta['name']}",
+        help="Leituras de /api/tables/<nome> e de registros por ID passam a ser atendidas da memória "
+             "do servidor da API, atualizada a cada alteração. Indicado para tabelas de referência pequenas."
+    )
+    if hot_cache_enabled != bool(table_meta.get('hot_cache')):
+        try:
+            set_table_hot_cache(table_meta['name'], hot_cache_enabled)
+            st.success("✅ Cache da API " + ("ativado" if hot_cache_enabled else "desativado") + "!")
+            st.rerun()
+        except Exception as e:
+            st.error(f"❌ Erro ao alterar o cache da tabela: {e}")
+    
+    # Índices de busca textual usados pelo parâmetro search da API
+    st.markdown("---")
+    st.markdown("### 🔎 Índices de busca")
+    search_config = table_meta.get('search_config') or {}
+    text_fields = [field['name'] for field in table_meta['fields'] if field['type'] == 'text']
+    current_trigram = [name for name in search_config.get('trigram', ()) if name in text_fields]
+    current_fulltext = [name for name in search_config.get('fulltext', ()) if name in text_fields]
+    if not text_fields:
+        st.info("A tabela não tem campos de texto.")
+    else:
+        new_trigram = st.multiselect(
+            "Busca por trecho (trigram)",
+            options=text_fields,
+            default=current_trigram,
+            key=f"search_trigram_{table_meta['name']}",
+            help="Índice pg_trgm por campo: buscas por trecho ou início do texto usam o índice "
+                 "em vez de ler a tabela inteira."
+        )
+        new_fulltext = st.multiselect(
+            "Busca por palavras (texto completo)",
+            options=text_fields,
+            default=current_fulltext,
+            key=f"search_fulltext_{table_meta['name']}",
+            help="Uma coluna tsvector com os campos escolhidos e um índice GIN. "
+                 "Alterar estes campos reescreve a tabela."
+        )
+        if (new_trigram != current_trigram or new_fulltext != current_fulltext) and st.button("Aplicar índices de busca"):
+            try:
+                with st.spinner("Criando índices..."):
+                    with get_db_cursor() as cursor:
+                        set_search_config(cursor, table_meta, new_trigram, new_fulltext)
+                metadata_registry.invalidate()
+                st.success("✅ Índices de busca atualizados!")
+                st.rerun()
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            except Exception as e:
+                st.error(f"❌ Erro ao criar os índices de busca: {e}")
+    
     # Mostrar informações sobre o impacto
     st.markdown("---")
     st.markdown("### 📋 Informações sobre o status da tabela")
@@ -1884,51 +1837,37 @@ def page_manage_users() -> None:
 
 def get_record_by_id(table_name: str, record_id: int) -> dict:
     """Busca um registro específico por ID."""
-    conn = get_db_connection()
     try:
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT * FROM {table_name} WHERE id = %s", (record_id,))
-        row = cursor.fetchone()
-        if row:
-            columns = [description[0] for description in cursor.description]
-            return dict(zip(columns, row))
-        return None
+        with get_db_cursor() as cursor:
+            cursor.execute(f"SELECT * FROM {table_name} WHERE id = %s", (record_id,))
+            row = cursor.fetchone()
+            return public_row(row) if row else None
     except Exception as e:
         st.error(f"Erro ao buscar registro: {e}")
         return None
-    finally:
-        conn.close()
+
+
+def get_permission_snapshot(username: str):
+    """Snapshot das permissões do usuário guardado na sessão.
+
+    Carregado com uma única consulta e recarregado apenas quando as
+    permissões do usuário mudam (barramento de invalidação).
+    """
+    snapshot = st.session_state.get("permission_snapshot")
+    if snapshot is None or snapshot.username != username or not permission_cache.is_current(snapshot):
+        with get_db_cursor() as cursor:
+            snapshot = permission_cache.load(cursor, username)
+        st.session_state.permission_snapshot = snapshot
+    return snapshot
 
 
 def check_user_permission(username: str, table_name: str, permission: str) -> bool:
     """Verifica se um usuário tem permissão específica para uma tabela."""
+    # Admin tem acesso total
+    if st.session_state.get("role") == "admin":
+        return True
     try:
-        with get_db_cursor() as cursor:
-            # Admin tem acesso total
-            if st.session_state.get("role") == "admin":
-                return True
-            
-            # Verificar permissão específica
-            cursor.execute("""
-                SELECT can_view, can_insert, can_update, can_delete 
-                FROM user_table_permissions utp
-                JOIN users u ON utp.user_id = u.id
-                WHERE u.username = %s AND utp.table_name = %s
-            """, (username, table_name))
-            
-            result = cursor.fetchone()
-            if result:
-                if permission == "view":
-                    return result['can_view']
-                elif permission == "insert":
-                    return result['can_insert']
-                elif permission == "update":
-                    return result['can_update']
-                elif permission == "delete":
-                    return result['can_delete']
-            
-            return False
-            
+        return get_permission_snapshot(username).has(table_name, permission)
     except Exception as e:
         st.error(f"Erro ao verificar permissão: {e}")
         return False
@@ -1936,27 +1875,11 @@ def check_user_permission(username: str, table_name: str, permission: str) -> bo
 
 def check_user_general_permission(username: str, permission: str) -> bool:
     """Verifica se um usuário tem permissão geral específica."""
+    # Admin tem acesso total
+    if st.session_state.get("role") == "admin":
+        return True
     try:
-        with get_db_cursor() as cursor:
-            # Admin tem acesso total
-            if st.session_state.get("role") == "admin":
-                return True
-            
-            # Verificar permissão geral
-            cursor.execute("""
-                SELECT can_create_tables
-                FROM user_general_permissions ugp
-                JOIN users u ON ugp.user_id = u.id
-                WHERE u.username = %s
-            """, (username,))
-            
-            result = cursor.fetchone()
-            if result:
-                if permission == "create_tables":
-                    return result['can_create_tables']
-            
-            return False
-            
+        return get_permission_snapshot(username).has_general(permission)
     except Exception as e:
         st.error(f"Erro ao verificar permissão geral: {e}")
         return False
@@ -1965,21 +1888,12 @@ def check_user_general_permission(username: str, permission: str) -> bool:
 def get_user_accessible_tables(username: str) -> list:
     """Retorna lista de tabelas que o usuário pode acessar."""
     try:
-        with get_db_cursor() as cursor:
-            # Admin vê todas as tabelas
-            if st.session_state.get("role") == "admin":
-                cursor.execute("SELECT table_name FROM tables_metadata")
-                return [row['table_name'] for row in cursor.fetchall()]
-            
-            # Usuário vê apenas tabelas com permissão
-            cursor.execute("""
-                SELECT DISTINCT utp.table_name 
-                FROM user_table_permissions utp
-                JOIN users u ON utp.user_id = u.id
-                WHERE u.username = %s AND utp.can_view = TRUE
-            """, (username,))
-            
-            return [row['table_name'] for row in cursor.fetchall()]
+        # Admin vê todas as tabelas
+        if st.session_state.get("role") == "admin":
+            return metadata_registry.table_names(include_inactive=True)
+        
+        # Usuário vê apenas tabelas com permissão
+        return get_permission_snapshot(username).table_names("view")
             
     except Exception as e:
         st.error(f"Erro ao buscar tabelas acessíveis: {e}")
@@ -2149,6 +2063,8 @@ def save_user_permissions(username: str, permissions: list) -> None:
                         print(f"Aviso: Não foi possível aplicar grants para {username} na tabela {perm['table_name']}: {e}")
             
             st.success(f"Permissões para {username} salvas com sucesso!")
+        
+        permission_cache.invalidate([user_id])
             
     except Exception as e:
         st.error(f"Erro ao salvar permissões: {e}")
@@ -2199,6 +2115,8 @@ def save_user_general_permissions(username: str, can_create_tables: bool) -> Non
             st.success(f"Permissões gerais para {username} salvas com sucesso!")
             if can_create_tables:
                 st.info("Permissões automáticas aplicadas nas tabelas existentes: Visualizar, Inserir e Editar")
+        
+        permission_cache.invalidate([user_id])
             
     except Exception as e:
         st.error(f"Erro ao salvar permissões gerais: {e}")
@@ -2257,7 +2175,7 @@ def filter_tables_by_permission(metadata: list, username: str) -> list:
     if st.session_state.get("role") == "admin":
         return metadata
     
-    accessible_tables = get_user_accessible_tables(username)
+    accessible_tables = set(get_user_accessible_tables(username))
     return [table for table in metadata if table['name'] in accessible_tables]
 
 
@@ -2438,7 +2356,7 @@ def edit_record_form(table_meta: dict) -> None:
             if rows:
                 data = []
                 for row in rows:
-                    data.append(dict(row))
+                    data.append(public_row(row))
                 df = pd.DataFrame(data)
             else:
                 df = pd.DataFrame()
@@ -2615,7 +2533,7 @@ def delete_record_form(table_meta: dict) -> None:
             if rows:
                 data = []
                 for row in rows:
-                    data.append(dict(row))
+                    data.append(public_row(row))
                 df = pd.DataFrame(data)
             else:
                 df = pd.DataFrame()
@@ -2664,42 +2582,25 @@ def delete_record_form(table_meta: dict) -> None:
                         try:
                             st.info(f"🔍 Iniciando exclusão do registro ID {record_id}")
                             
-                            # Usar conexao direta para debug
-                            conn = psycopg2.connect(**db_config.get_connection_params())
-                            cursor = conn.cursor()
-                            
                             st.info(f"📝 Executando: DELETE FROM {table_meta['name']} WHERE id = {record_id}")
                             
-                            # Executar DELETE
-                            cursor.execute(f"DELETE FROM {table_meta['name']} WHERE id = %s", (record_id,))
+                            # Executar DELETE em conexao propria do pool (commit ao sair do bloco)
+                            with get_db_cursor() as delete_cursor:
+                                delete_cursor.execute(f"DELETE FROM {table_meta['name']} WHERE id = %s", (record_id,))
+                                affected_rows = delete_cursor.rowcount
                             
                             # Verificar resultado
-                            affected_rows = cursor.rowcount
                             st.info(f"✅ Registros afetados: {affected_rows}")
                             
-                            # Commit da transacao
-                            conn.commit()
-                            
                             if affected_rows > 0:
                                 st.success(f"🎉 Registro ID {record_id} excluído com sucesso!")
-                                cursor.close()
-                                conn.close()
                                 st.rerun()
                             else:
                                 st.warning(f"⚠️ Nenhum registro foi excluído. ID {record_id} pode não existir.")
-                                cursor.close()
-                                conn.close()
                                 
                         except Exception as e:
                             st.error(f"❌ Erro ao excluir registro: {e}")
                             st.info("🔍 Verifique os logs da aplicação para mais detalhes.")
-                            try:
-                                if 'cursor' in locals():
-                                    cursor.close()
-                                if 'conn' in locals():
-                                    conn.close()
-                            except:
-                                pass
                     
                     if cancel:
                         st.info("Exclusão cancelada.")
@@ -2713,6 +2614,9 @@ def main() -> None:
     """Main entry point for the Streamlit app."""
     # Set page configuration
     st.set_page_config(page_title="Sistema de Cadastros Auxiliares", layout="wide")
+    # Listener de invalidacao de cache e manutencao do pool (uma thread por processo)
+    invalidation_bus.start()
+    db_pool.start()
     if not st.session_state.get("logged_in"):
         login_screen()
         return
@@ -2730,6 +2634,7 @@ def main() -> None:
         st.session_state.logged_in = False
         st.session_state.username = None
         st.session_state.role = None
+        st.session_state.pop("permission_snapshot", None)
         st.rerun()
     # Main menu
     menu_options = ["Página Inicial", "Gerenciar Tabelas", "Configurações"]